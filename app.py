@@ -1,20 +1,66 @@
-from flask import Flask, render_template, request, jsonify, send_file, session
+from flask import Flask, render_template, request, jsonify, send_file, session, g
 from flask_cors import CORS
-import yt_dlp
 import os
+import sys
+import gc
+import random
+import importlib
 import tempfile
+import shutil
 import uuid
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse, urljoin, parse_qsl, urlencode
 import re
-import requests
-from bs4 import BeautifulSoup
 import json
 import threading
 import time
+import math
+import hashlib
+import sqlite3
+import socket
+try:
+    import fcntl  # 用於多個 worker 之間的快取清理鎖（Windows 上不可用）
+except ImportError:
+    fcntl = None
 from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, deque
 from datetime import datetime
-from pytube import YouTube
-import subprocess
+
+class LazyImport:
+    """延遲載入模組（或模組中的屬性），首次使用時才 import，減少冷啟動時間"""
+
+    def __init__(self, module_name, attribute=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            module = importlib.import_module(self._module_name)
+            self._target = getattr(module, self._attribute) if self._attribute else module
+        return self._target
+
+    @property
+    def is_loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+# 重量級依賴改為首次使用時載入（頁面渲染與狀態輪詢不需要它們）
+yt_dlp = LazyImport('yt_dlp')
+requests = LazyImport('requests')
+subprocess = LazyImport('subprocess')
+BeautifulSoup = LazyImport('bs4', 'BeautifulSoup')
+YouTube = LazyImport('pytube', 'YouTube')
+LAZY_IMPORTS = (yt_dlp, requests, subprocess, BeautifulSoup, YouTube)
+
+# 設置 PRELOAD_MODULES=1 並以 gunicorn --preload 啟動時，master 程序預先載入依賴，fork 出的 worker 以 copy-on-write 共享
+PRELOAD_MODULES = os.environ.get('PRELOAD_MODULES', '').lower() in ('1', 'true', 'yes')
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # For session management
@@ -22,17 +68,83 @@ CORS(app)
 
 # API Configuration
 API_KEY = os.environ.get('API_KEY', None)  # Optional API key for authentication
+API_KEYS = os.environ.get('API_KEYS', '')  # 多個 API key，以逗號分隔：key[:每分鐘請求數[:同時任務數[:每日 MB]]]
+API_KEY_RATE_LIMIT = int(os.environ.get('API_KEY_RATE_LIMIT', '600'))  # 每個 key 每分鐘請求數（0 為不限制）
+API_KEY_MAX_INFLIGHT = int(os.environ.get('API_KEY_MAX_INFLIGHT', '8'))  # 每個 key 同時進行的下載任務數（0 為不限制）
+API_KEY_DAILY_MB = int(os.environ.get('API_KEY_DAILY_MB', '0'))  # 每個 key 每日（UTC）下載量（0 為不限制）
+API_LIMITS_DB = os.environ.get('API_LIMITS_DB') or os.path.join(tempfile.gettempdir(), 'video_downloader_limits.db')  # 多個 worker 共用的限額狀態
 API_VERSION = 'v1'
+ADMIN_KEY = os.environ.get('ADMIN_KEY', None)  # Admin endpoints (profiling) are disabled unless set
+
+# Profiling configuration
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))  # 自動取樣比例 (0-1)
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.01'))  # 堆疊取樣間隔（秒）
+PROFILE_MAX_STORED = int(os.environ.get('PROFILE_MAX_STORED', '50'))
 
 # 配置临时文件目录
 TEMP_DIR = tempfile.gettempdir()
-DOWNLOAD_DIR = os.path.join(TEMP_DIR, 'video_downloads')
+DOWNLOAD_DIR = os.environ.get('DOWNLOAD_DIR') or os.path.join(TEMP_DIR, 'video_downloads')  # 分散式模式下 API 節點與 worker 共用
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-# 下载状态存储
+# 下载状态存储：task_id -> TaskRecord
 download_status = {}
+status_version = {'current': 0}  # 每次任務狀態變更遞增，供批次狀態查詢只返回有變化的任務
 status_lock = threading.Lock()
 
+# 任務階段計時統計（跨任務匯總）
+stage_stats = {}
+stage_stats_lock = threading.Lock()
+stage_samples = {}
+STAGE_SAMPLE_INTERVAL = 0.5  # 計算峰值吞吐量的取樣間隔（秒）
+
+# YoutubeDL 實例池：key -> [(ydl, 最後使用時間)]，按最近使用排序
+ydl_pool = OrderedDict()
+ydl_pool_lock = threading.Lock()
+ydl_pool_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'discarded': 0}
+
+# 分片並行配額：task_id -> 已分配的並行分片數
+fragment_slots = {}
+fragment_slots_lock = threading.Lock()
+
+# 每個任務目前所在的管線階段（下載 / 後處理）
+task_pipeline_stage = {}
+pipeline_lock = threading.Lock()
+
+# 路由快取：域名/URL 模式 -> 成功的 extractor 或 HTML 解析
+extractor_routes = OrderedDict()
+routes_lock = threading.Lock()
+route_totals = {'routed': 0, 'scans': 0, 'stale': 0, 'html_skips': 0}
+
+# 負面快取：(正規化 URL, cookie 身分) -> 最近一次所有方法都失敗的原因
+failed_urls = OrderedDict()
+failed_urls_lock = threading.Lock()
+failed_url_totals = {'recorded': 0, 'hits': 0, 'bypassed': 0, 'expired': 0, 'cleared': 0}
+
+# yt-dlp 快取命中統計：按 extractor 區分熱快取 / 冷快取的提取耗時
+ytdlp_cache_stats = {}
+ytdlp_cache_lock = threading.Lock()
+ytdlp_cache_state = {'last_prune': 0, 'pruned_files': 0, 'pruned_bytes': 0}
+cache_tracking = threading.local()
+
+# 性能剖析結果存儲（按時間順序，超出上限時淘汰最舊的）
+profiles = OrderedDict()
+profiles_lock = threading.Lock()
+
+# 探測 HTML / Instagram 候選視頻 URL 的執行緒池（第一次使用時建立）
+probe_executor = {'pool': None}
+probe_executor_lock = threading.Lock()
+
+# ffmpeg 支援的選項（第一次檢查後快取）
+ffmpeg_features = {}
+
+# 批次提取的執行緒池（第一次使用時建立）
+extract_executor = {'pool': None}
+extract_executor_lock = threading.Lock()
+
+# 自動取消無人查詢任務的背景執行緒
+task_reaper = {'thread': None}
+task_reaper_lock = threading.Lock()
+
 # Webhook callbacks storage
 webhook_callbacks = {}
 webhook_lock = threading.Lock()
@@ -44,6 +156,12 @@ COOKIE_TEMP_FILE = None
 SESSION_COOKIE_DIR = os.path.join(DOWNLOAD_DIR, 'session_cookies')
 os.makedirs(SESSION_COOKIE_DIR, exist_ok=True)
 
+# yt-dlp 持久化快取目錄（簽名函數 / nsig、player JS 等），所有 worker 共享
+YTDLP_CACHE_DIR = os.environ.get('YTDLP_CACHE_DIR') or os.path.join(TEMP_DIR, 'yt_dlp_cache')
+YTDLP_CACHE_MAX_MB = int(os.environ.get('YTDLP_CACHE_MAX_MB', '200'))
+YTDLP_CACHE_PRUNE_INTERVAL = int(os.environ.get('YTDLP_CACHE_PRUNE_INTERVAL', '600'))
+os.makedirs(YTDLP_CACHE_DIR, exist_ok=True)
+
 # Prepare cookies temp file if raw content provided
 if COOKIES_CONTENT and not COOKIES_FILE:
     try:
@@ -54,6 +172,77 @@ if COOKIES_CONTENT and not COOKIES_FILE:
         print(f"Error writing cookies content: {e}")
         COOKIE_TEMP_FILE = None
 
+# YoutubeDL 實例池設定（YDL_POOL_SIZE=0 關閉池化）
+YDL_POOL_SIZE = int(os.environ.get('YDL_POOL_SIZE', '4'))  # 每組選項最多保留的空閒實例
+YDL_POOL_MAX_KEYS = int(os.environ.get('YDL_POOL_MAX_KEYS', '32'))  # 最多保留的選項組數
+YDL_POOL_IDLE_TIMEOUT = int(os.environ.get('YDL_POOL_IDLE_TIMEOUT', '300'))  # 空閒實例存活秒數
+YDL_TASK_OPTIONS = ('outtmpl', 'progress_hooks', 'postprocessor_hooks', 'concurrent_fragment_downloads', 'download_ranges', 'ratelimit')  # 每次借出時單獨設置的選項
+
+# HLS/DASH 分片並行下載（FRAGMENT_CONCURRENCY=1 為逐個下載）
+FRAGMENT_CONCURRENCY = int(os.environ.get('FRAGMENT_CONCURRENCY', '4'))  # 每個任務最多同時下載的分片數
+FRAGMENT_CONCURRENCY_GLOBAL = int(os.environ.get('FRAGMENT_CONCURRENCY_GLOBAL', '16'))  # 所有任務合計的分片並行上限
+PARALLEL_STREAMS = os.environ.get('PARALLEL_STREAMS', '1').lower() in ('1', 'true', 'yes')  # 合併格式（bv*+ba）的影像與音訊同時下載
+
+# 命令列備援：超過此秒數沒有任何輸出即視為停滯並終止子程序
+CLI_STALL_TIMEOUT = int(os.environ.get('CLI_STALL_TIMEOUT', '120'))
+CLI_PROGRESS_PREFIX = '[vd-progress]'
+CLI_FILE_PREFIX = '[vd-file]'
+
+# 下載（網路）與後處理（ffmpeg 合併 / 轉檔，CPU）分為兩個管線階段，各自限制同時執行的任務數（0 為不限制）
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', '16'))
+POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS', str(os.cpu_count() or 2)))
+
+# 超過此秒數沒有查詢狀態（且未設定 webhook）的任務自動取消（0 為不自動取消）
+TASK_POLL_TIMEOUT = int(os.environ.get('TASK_POLL_TIMEOUT', '300'))
+TASK_METHOD_EVENTS = max(1, int(os.environ.get('TASK_METHOD_EVENTS', '32')))  # 每個任務保留的最近方法事件數
+STATUS_BATCH_MAX = int(os.environ.get('STATUS_BATCH_MAX', '1000'))  # 批次狀態查詢每次最多的任務數
+
+# 批次提取：所有批次請求共用一個執行緒池
+EXTRACT_BATCH_MAX = int(os.environ.get('EXTRACT_BATCH_MAX', '500'))  # 每次請求最多的 URL 數
+EXTRACT_BATCH_WORKERS = int(os.environ.get('EXTRACT_BATCH_WORKERS', '8'))  # 同時進行的提取數
+
+# HTML / Instagram 解析出的候選視頻 URL 並行探測（HEAD / Range）後排序（CANDIDATE_PROBE_WORKERS=0 關閉）
+CANDIDATE_PROBE_WORKERS = int(os.environ.get('CANDIDATE_PROBE_WORKERS', '16'))  # 所有請求合計同時進行的探測數
+CANDIDATE_PROBE_TIMEOUT = float(os.environ.get('CANDIDATE_PROBE_TIMEOUT', '5'))  # 每個探測請求的逾時秒數
+
+# 簽名 URL 過期（HTTP 403/410）時只重新解析該格式的 URL，從已寫入的位元組繼續下載
+URL_REFRESH_MAX = int(os.environ.get('URL_REFRESH_MAX', '2'))  # 每次下載最多重新解析的次數（0 為停用）
+
+# 分散式 worker：設置 TASK_QUEUE 後 API 節點只把下載任務寫入共用佇列，由 worker.py 行程執行（空值為在本行程內執行）
+TASK_QUEUE = os.environ.get('TASK_QUEUE', '').lower()  # 佇列後端：sqlite
+TASK_QUEUE_DB = os.environ.get('TASK_QUEUE_DB') or os.path.join(TEMP_DIR, 'video_downloader_queue.db')  # 不放在下載目錄內，以免被檔案端點按前綴匹配
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', '4'))  # 每個 worker 行程同時執行的任務數
+WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get('WORKER_HEARTBEAT_TIMEOUT', '60'))  # 超過此秒數沒有心跳的任務交給其他 worker
+WORKER_MAX_ATTEMPTS = int(os.environ.get('WORKER_MAX_ATTEMPTS', '2'))  # 每個任務最多被領取的次數
+WORKER_SYNC_INTERVAL = float(os.environ.get('WORKER_SYNC_INTERVAL', '0.5'))  # 發布狀態、心跳與領取新任務的間隔（秒）
+
+# 下載前按估計大小預留磁碟空間與在途流量，放不下時排隊，排隊已滿時以 503 + Retry-After 拒絕新任務
+DISK_RESERVE_MB = int(os.environ.get('DISK_RESERVE_MB', '500'))  # 下載目錄所在磁碟至少保留的空間
+MAX_INFLIGHT_MB = int(os.environ.get('MAX_INFLIGHT_MB', '0'))  # 所有任務尚未下載完的估計大小合計上限（0 為不限制）
+ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', '32'))  # 等待空間的任務數上限
+ADMISSION_QUEUE_TIMEOUT = int(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '600'))  # 等待空間的最長秒數
+
+# 頻寬整形（KB/s，0 為不限制）：全局上限按權重公平分給正在傳輸的任務，用不完的份額讓給其他任務
+BANDWIDTH_LIMIT_KBPS = int(os.environ.get('BANDWIDTH_LIMIT_KBPS', '0'))  # 所有任務合計
+TASK_BANDWIDTH_LIMIT_KBPS = int(os.environ.get('TASK_BANDWIDTH_LIMIT_KBPS', '0'))  # 每個任務
+API_KEY_BANDWIDTH_LIMIT_KBPS = int(os.environ.get('API_KEY_BANDWIDTH_LIMIT_KBPS', '0'))  # 同一 API key 的任務合計
+BANDWIDTH_SHORT_JOB_MB = int(os.environ.get('BANDWIDTH_SHORT_JOB_MB', '50'))  # 剩餘估計大小低於此值的任務優先分配
+
+# 推測性預取：提取成功後以低優先級在背景下載預設格式，相同 URL 的下載請求直接接手
+SPECULATIVE_PREFETCH = os.environ.get('SPECULATIVE_PREFETCH', '').lower() in ('1', 'true', 'yes')
+PREFETCH_WINDOW = int(os.environ.get('PREFETCH_WINDOW', '60'))  # 沒有下載請求接手時，此秒數後取消並刪除檔案
+PREFETCH_MAX_ACTIVE = int(os.environ.get('PREFETCH_MAX_ACTIVE', '4'))  # 同時等待接手的預取任務數上限
+PREFETCH_RATE_KBPS = int(os.environ.get('PREFETCH_RATE_KBPS', '2048'))  # 被接手前每個預取任務的速率上限（0 為不限制）
+
+# 域名 → extractor 路由快取設定
+ROUTE_CACHE_MAX = int(os.environ.get('ROUTE_CACHE_MAX', '5000'))  # 最多記錄的域名/URL 模式數
+ROUTE_HTML_TTL = int(os.environ.get('ROUTE_HTML_TTL', '3600'))  # 「只有 HTML 解析可用」的記錄有效秒數
+ROUTE_HTML_MIN_FAILURES = int(os.environ.get('ROUTE_HTML_MIN_FAILURES', '2'))  # yt-dlp 連續失敗幾次後改走 HTML
+
+# 所有提取 / 下載方法都失敗的 URL 在短時間內直接返回相同的失敗原因（請求帶 force 時略過）
+NEGATIVE_CACHE_TTL = int(os.environ.get('NEGATIVE_CACHE_TTL', '120'))  # 失敗記錄有效秒數（0 為停用）
+NEGATIVE_CACHE_MAX = int(os.environ.get('NEGATIVE_CACHE_MAX', '5000'))  # 最多記錄的 URL 數
+
 # Preferred download settings
 PREFERRED_DEFAULT_FORMAT = 'bv*+ba/bestvideo+bestaudio/best'
 MERGE_OUTPUT_FORMAT = 'mp4'
@@ -156,17 +345,429 @@ def t(key, lang=None):
     else:
         return key  # 如果找不到翻译，返回key本身
 
+def get_request_api_key():
+    """請求帶的 API key（X-API-Key 標頭或 api_key 參數）"""
+    return request.headers.get('X-API-Key') or request.args.get('api_key')
+
+def parse_api_keys():
+    """合併 API_KEY 與 API_KEYS 為 key → 限額；沒有設定任何 key 時返回空 dict（不需要認證）"""
+    keys = {}
+    entries = ([API_KEY] if API_KEY else []) + [entry.strip() for entry in API_KEYS.split(',') if entry.strip()]
+    for entry in entries:
+        key, *limits = entry.split(':')
+        values = [API_KEY_RATE_LIMIT, API_KEY_MAX_INFLIGHT, API_KEY_DAILY_MB]
+        for index, value in enumerate(limits[:3]):
+            if value.strip():
+                values[index] = int(value)
+        keys[key] = {'rate_per_minute': values[0], 'max_inflight': values[1], 'daily_bytes': values[2] * 1024 * 1024}
+    return keys
+
+API_KEY_LIMITS = parse_api_keys()
+
+class SQLiteStore:
+    """多個行程共用的 SQLite（WAL）檔案：每個執行緒各自一個連線，BEGIN IMMEDIATE 讓檢查與更新互斥"""
+
+    SCHEMA = ''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+class ApiKeyLimiter(SQLiteStore):
+    """記錄各 API key 的請求令牌桶、進行中的任務與每日下載量，
+    同一主機上的所有 gunicorn worker 共用一個檔案；key 只以雜湊值儲存"""
+
+    STALE_SECONDS = 6 * 3600  # 超過此時間仍未結束的任務記錄視為 worker 異常退出的殘留
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS key_buckets (key_id TEXT PRIMARY KEY, tokens REAL, updated_at REAL);
+        CREATE TABLE IF NOT EXISTS key_tasks (task_id TEXT PRIMARY KEY, key_id TEXT, started_at REAL);
+        CREATE INDEX IF NOT EXISTS key_tasks_key ON key_tasks (key_id);
+        CREATE TABLE IF NOT EXISTS key_daily (key_id TEXT, day TEXT, bytes INTEGER, PRIMARY KEY (key_id, day));
+    """
+
+    @staticmethod
+    def key_id(api_key):
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def _today():
+        return datetime.utcnow().strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _seconds_until_tomorrow():
+        now = datetime.utcnow()
+        return 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+
+    def check_rate(self, api_key, per_minute):
+        """消耗一個請求令牌；令牌不足時返回需要等待的秒數，否則返回 None"""
+        if per_minute <= 0:
+            return None
+        key_id = self.key_id(api_key)
+        now = time.time()
+        rate = per_minute / 60
+        with self._transaction() as conn:
+            row = conn.execute('SELECT tokens, updated_at FROM key_buckets WHERE key_id = ?', (key_id,)).fetchone()
+            tokens = per_minute if row is None else min(per_minute, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO key_buckets (key_id, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key_id, tokens, now))
+        return None if allowed else max(1, math.ceil((1 - tokens) / rate))
+
+    def reserve_task(self, api_key, task_id, limits):
+        """登記一個進行中的下載任務；超出同時任務數或每日下載量時返回 (等待秒數, 錯誤訊息)"""
+        key_id = self.key_id(api_key)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM key_tasks WHERE started_at < ?', (now - self.STALE_SECONDS,))
+            if limits['daily_bytes'] > 0:
+                row = conn.execute('SELECT bytes FROM key_daily WHERE key_id = ? AND day = ?',
+                                   (key_id, self._today())).fetchone()
+                if row and row[0] >= limits['daily_bytes']:
+                    return self._seconds_until_tomorrow(), 'Daily download quota exceeded'
+            if limits['max_inflight'] > 0:
+                count = conn.execute('SELECT COUNT(*) FROM key_tasks WHERE key_id = ?', (key_id,)).fetchone()[0]
+                if count >= limits['max_inflight']:
+                    return None, 'Too many downloads in progress'
+            conn.execute('INSERT OR REPLACE INTO key_tasks (task_id, key_id, started_at) VALUES (?, ?, ?)',
+                         (task_id, key_id, now))
+        return None, None
+
+    def release_task(self, task_id, downloaded_bytes):
+        """任務結束：移除進行中記錄並把下載量計入當日用量"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT key_id FROM key_tasks WHERE task_id = ?', (task_id,)).fetchone()
+            if row is None:
+                return
+            conn.execute('DELETE FROM key_tasks WHERE task_id = ?', (task_id,))
+            if downloaded_bytes:
+                conn.execute(
+                    'INSERT INTO key_daily (key_id, day, bytes) VALUES (?, ?, ?) '
+                    'ON CONFLICT (key_id, day) DO UPDATE SET bytes = bytes + excluded.bytes',
+                    (row[0], self._today(), downloaded_bytes)
+                )
+
+    def usage(self, api_key, limits):
+        """目前的用量與限額"""
+        key_id = self.key_id(api_key)
+        now = time.time()
+        conn = self._connection()
+        bucket = conn.execute('SELECT tokens, updated_at FROM key_buckets WHERE key_id = ?', (key_id,)).fetchone()
+        inflight = conn.execute('SELECT COUNT(*) FROM key_tasks WHERE key_id = ? AND started_at >= ?',
+                                (key_id, now - self.STALE_SECONDS)).fetchone()[0]
+        daily = conn.execute('SELECT bytes FROM key_daily WHERE key_id = ? AND day = ?',
+                             (key_id, self._today())).fetchone()
+        per_minute = limits['rate_per_minute']
+        tokens = None
+        if per_minute > 0:
+            tokens = per_minute if bucket is None else min(per_minute, bucket[0] + (now - bucket[1]) * per_minute / 60)
+        return {
+            'requests_per_minute': per_minute or None,
+            'requests_available': int(tokens) if tokens is not None else None,
+            'max_inflight': limits['max_inflight'] or None,
+            'inflight': inflight,
+            'daily_bytes_limit': limits['daily_bytes'] or None,
+            'daily_bytes_used': daily[0] if daily else 0,
+            'daily_reset_seconds': self._seconds_until_tomorrow()
+        }
+
+key_limiter = ApiKeyLimiter(API_LIMITS_DB)
+
+class TaskQueueBackend:
+    """分散式模式的任務佇列介面：API 節點寫入任務並讀取狀態，worker 領取任務並發布狀態。
+    其他後端（如 Redis）實作以下方法後登記到 TASK_QUEUE_BACKENDS 即可"""
+
+    def enqueue(self, task_id, payload, status):
+        """寫入新任務（payload 為下載參數）與初始狀態"""
+        raise NotImplementedError
+
+    def claim(self, worker_id, limit):
+        """領取最多 limit 個排隊中的任務，返回 [(task_id, payload, status, cancel_reason)]"""
+        raise NotImplementedError
+
+    def publish(self, task_id, worker_id, status_json, finished=False):
+        """發布 worker 上的任務狀態（JSON 字串）；finished 表示任務已結束"""
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id, task_ids):
+        """更新任務心跳，返回 {task_id: (cancel_reason, last_polled)}"""
+        raise NotImplementedError
+
+    def fetch(self, task_id):
+        """讀取任務狀態並記錄查詢時間；不存在時返回 None"""
+        raise NotImplementedError
+
+    def fetch_many(self, task_ids, since_version=None, since=None):
+        """批次讀取在 since_version / since 之後變更過的任務狀態並記錄查詢時間；
+        返回 (task_id -> 狀態, 找不到的 task_id, 目前版本)"""
+        raise NotImplementedError
+
+    def request_cancel(self, task_id, reason):
+        """要求取消任務；返回 'not_found'、'finished' 或 'cancelling'"""
+        raise NotImplementedError
+
+    def recover(self, timeout, max_attempts, lost_status):
+        """把心跳超時的任務放回佇列，超過嘗試次數的以 lost_status 結束；返回 [(task_id, payload, status)]"""
+        raise NotImplementedError
+
+    def stats(self):
+        """各狀態的任務數與正在執行任務的 worker 數"""
+        raise NotImplementedError
+
+class SQLiteTaskQueue(SQLiteStore, TaskQueueBackend):
+    """以 SQLite 檔案作為共用佇列，適用於同一主機或共用本地磁碟的多個行程"""
+
+    RETENTION_SECONDS = 24 * 3600  # 已結束任務的狀態保留時間
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY, payload TEXT NOT NULL, state TEXT NOT NULL,
+            worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, enqueued_at REAL NOT NULL,
+            heartbeat REAL, updated_at REAL NOT NULL, last_polled REAL,
+            cancel_reason TEXT, status TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, enqueued_at);
+        CREATE INDEX IF NOT EXISTS tasks_version ON tasks (version);
+        CREATE TABLE IF NOT EXISTS task_version (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO task_version VALUES (1, (SELECT COALESCE(MAX(version), 0) FROM tasks));
+    """
+    FETCH_CHUNK = 500  # 每條 SQL 的 task_id 數，低於舊版 SQLite 的參數上限
+
+    @staticmethod
+    def _next_version(conn):
+        """遞增並返回共用的狀態版本（呼叫者須在交易中）；計數單獨保存，刪除舊任務後也不會倒退"""
+        conn.execute('UPDATE task_version SET value = value + 1 WHERE id = 1')
+        return conn.execute('SELECT value FROM task_version WHERE id = 1').fetchone()[0]
+
+    def enqueue(self, task_id, payload, status):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO tasks (task_id, payload, state, enqueued_at, updated_at, last_polled, status, version) '
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (task_id, json.dumps(payload), now, now, now, json.dumps(status, default=str), self._next_version(conn))
+            )
+
+    def claim(self, worker_id, limit):
+        now = time.time()
+        with self._transaction() as conn:
+            # 已要求取消的任務優先領取，讓 worker 儘快以 cancelled 結束並釋放 key 配額
+            rows = conn.execute(
+                "SELECT task_id, payload, status, cancel_reason, last_polled FROM tasks WHERE state = 'queued' "
+                'ORDER BY cancel_reason IS NULL, enqueued_at LIMIT ?', (limit,)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET state = 'running', worker = ?, attempts = attempts + 1, heartbeat = ?, "
+                'updated_at = ?, version = ? WHERE task_id = ?',
+                [(worker_id, now, now, self._next_version(conn), row[0]) for row in rows]
+            )
+        claimed = []
+        for task_id, payload, status, cancel_reason, last_polled in rows:
+            status = json.loads(status)
+            status['last_polled'] = last_polled or now
+            claimed.append((task_id, json.loads(payload), status, cancel_reason))
+        return claimed
+
+    def publish(self, task_id, worker_id, status_json, finished=False):
+        now = time.time()
+        with self._transaction() as conn:
+            # 只接受目前持有任務的 worker 發布，避免已被判定失聯的 worker 覆蓋接手者的狀態
+            conn.execute(
+                'UPDATE tasks SET status = ?, state = ?, heartbeat = ?, updated_at = ?, version = ? '
+                "WHERE task_id = ? AND worker = ? AND state = 'running'",
+                (status_json, 'done' if finished else 'running', now, now, self._next_version(conn), task_id, worker_id)
+            )
+
+    def heartbeat(self, worker_id, task_ids):
+        if not task_ids:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(task_ids))
+        with self._transaction() as conn:
+            conn.execute(f'UPDATE tasks SET heartbeat = ? WHERE worker = ? AND task_id IN ({placeholders})',
+                         (now, worker_id, *task_ids))
+            rows = conn.execute(f'SELECT task_id, cancel_reason, last_polled FROM tasks WHERE task_id IN ({placeholders})',
+                                task_ids).fetchall()
+        return {task_id: (cancel_reason, last_polled) for task_id, cancel_reason, last_polled in rows}
+
+    @staticmethod
+    def _status(row, now):
+        state, worker, attempts, status, version = row
+        status = json.loads(status)
+        status.update({'version': version, 'last_polled': now})
+        status['queue'] = {'state': state, 'worker': worker, 'attempts': attempts}
+        return status
+
+    def fetch(self, task_id):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT state, worker, attempts, status, version FROM tasks WHERE task_id = ?',
+                               (task_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE tasks SET last_polled = ? WHERE task_id = ?', (now, task_id))
+        return self._status(row, now)
+
+    def fetch_many(self, task_ids, since_version=None, since=None):
+        now = time.time()
+        conditions = ''
+        filters = []
+        if since_version is not None:
+            conditions += ' AND version > ?'
+            filters.append(since_version)
+        if since is not None:
+            conditions += ' AND updated_at > ?'
+            filters.append(since)
+        statuses = {}
+        found = set()
+        with self._transaction() as conn:
+            for offset in range(0, len(task_ids), self.FETCH_CHUNK):
+                chunk = task_ids[offset:offset + self.FETCH_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                found.update(row[0] for row in conn.execute(
+                    f'SELECT task_id FROM tasks WHERE task_id IN ({placeholders})', chunk))
+                conn.execute(f'UPDATE tasks SET last_polled = ? WHERE task_id IN ({placeholders})', (now, *chunk))
+                for row in conn.execute(
+                        'SELECT task_id, state, worker, attempts, status, version FROM tasks '
+                        f'WHERE task_id IN ({placeholders}){conditions}', (*chunk, *filters)):
+                    statuses[row[0]] = self._status(row[1:], now)
+            version = conn.execute('SELECT value FROM task_version WHERE id = 1').fetchone()[0]
+        return statuses, [task_id for task_id in task_ids if task_id not in found], version
+
+    def request_cancel(self, task_id, reason):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT state FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            if row is None:
+                return 'not_found'
+            if row[0] == 'done':
+                return 'finished'
+            conn.execute('UPDATE tasks SET cancel_reason = COALESCE(cancel_reason, ?), version = ? WHERE task_id = ?',
+                         (reason, self._next_version(conn), task_id))
+        return 'cancelling'
+
+    def recover(self, timeout, max_attempts, lost_status):
+        now = time.time()
+        failed = []
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM tasks WHERE state = 'done' AND updated_at < ?", (now - self.RETENTION_SECONDS,))
+            conn.execute(
+                "UPDATE tasks SET state = 'queued', worker = NULL, updated_at = ?, version = ? "
+                "WHERE state = 'running' AND heartbeat < ? AND attempts < ?",
+                (now, self._next_version(conn), now - timeout, max_attempts)
+            )
+            rows = conn.execute(
+                "SELECT task_id, payload, status FROM tasks WHERE state = 'running' AND heartbeat < ?",
+                (now - timeout,)
+            ).fetchall()
+            for task_id, payload, status in rows:
+                status = dict(json.loads(status), **lost_status)
+                conn.execute("UPDATE tasks SET state = 'done', status = ?, updated_at = ?, version = ? WHERE task_id = ?",
+                             (json.dumps(status, default=str), now, self._next_version(conn), task_id))
+                failed.append((task_id, json.loads(payload), status))
+        return failed
+
+    def stats(self):
+        conn = self._connection()
+        counts = dict(conn.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+        workers = conn.execute("SELECT COUNT(DISTINCT worker) FROM tasks WHERE state = 'running'").fetchone()[0]
+        oldest = conn.execute("SELECT MIN(enqueued_at) FROM tasks WHERE state = 'queued'").fetchone()[0]
+        return {
+            'backend': TASK_QUEUE,
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'active_workers': workers,
+            'oldest_queued_seconds': round(time.time() - oldest, 1) if oldest else 0
+        }
+
+TASK_QUEUE_BACKENDS = {'sqlite': SQLiteTaskQueue}
+if TASK_QUEUE and TASK_QUEUE not in TASK_QUEUE_BACKENDS:
+    raise ValueError(f'Unknown TASK_QUEUE backend: {TASK_QUEUE}')
+task_queue = TASK_QUEUE_BACKENDS[TASK_QUEUE](TASK_QUEUE_DB) if TASK_QUEUE else None
+worker_state = {'active': False, 'worker_id': None}  # 本行程以 worker.py 執行時為 True
+
+def rate_limited_response(error, retry_after):
+    """429 回應，附 Retry-After（秒）"""
+    response = jsonify({
+        'success': False,
+        'error': error,
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def cached_failure_result(failure):
+    """負面快取命中時 API 返回的錯誤欄位（單個提取與批次提取共用）"""
+    return {
+        'success': False,
+        'error': f"{url_failure_message(failure, 'en')} (failed recently; retry after {failure['retry_after']}s or pass force=true)",
+        'cached_failure': True,
+        'retry_after': failure['retry_after']
+    }
+
+def cached_failure_response(failure):
+    """URL 最近所有方法都失敗時的 API 回應（負面快取命中）"""
+    return jsonify(cached_failure_result(failure)), 400
+
 def require_api_key(f):
-    """API认证装饰器（如果设置了API_KEY）"""
+    """API认证装饰器（如果设置了API_KEY / API_KEYS），並按 key 限制每分鐘請求數"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if API_KEY:
-            provided_key = request.headers.get('X-API-Key') or request.args.get('api_key')
-            if not provided_key or provided_key != API_KEY:
+        if API_KEY_LIMITS:
+            provided_key = get_request_api_key()
+            if not provided_key or provided_key not in API_KEY_LIMITS:
                 return jsonify({
                     'success': False,
                     'error': 'Invalid or missing API key'
                 }), 401
+            retry_after = key_limiter.check_rate(provided_key, API_KEY_LIMITS[provided_key]['rate_per_minute'])
+            if retry_after:
+                return rate_limited_response('Rate limit exceeded', retry_after)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def is_admin_request():
+    """檢查請求是否帶有正確的管理員密鑰"""
+    if not ADMIN_KEY:
+        return False
+    provided_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    return provided_key == ADMIN_KEY
+
+def require_admin_key(f):
+    """管理員認證裝飾器（未設置 ADMIN_KEY 時管理端點停用）"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_KEY:
+            return jsonify({
+                'success': False,
+                'error': 'Admin API is disabled'
+            }), 403
+        if not is_admin_request():
+            return jsonify({
+                'success': False,
+                'error': 'Invalid or missing admin key'
+            }), 401
         return f(*args, **kwargs)
     return decorated_function
 
@@ -200,6 +801,69 @@ def is_valid_url(url):
     except:
         return False
 
+def parse_time_value(value):
+    """解析時間點：秒數或 [HH:]MM:SS(.ms) 字串，空值返回 None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    else:
+        parts = str(value).strip().split(':')
+        if len(parts) > 3:
+            raise ValueError(f'invalid time: {value}')
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+    if not 0 <= seconds < float('inf'):
+        raise ValueError(f'invalid time: {value}')
+    return seconds
+
+def parse_clip_range(data):
+    """從請求讀取片段起止時間（start / end），都未指定時返回 None"""
+    start = parse_time_value(data.get('start'))
+    end = parse_time_value(data.get('end'))
+    if start is None and end is None:
+        return None
+    start = start or 0.0
+    if end is not None and end <= start:
+        raise ValueError('end must be after start')
+    return start, end
+
+def ffmpeg_available():
+    """片段下載需要 ffmpeg"""
+    return shutil.which('ffmpeg') is not None
+
+def ffmpeg_supports_readrate():
+    """ffmpeg 5.0 起支援 -readrate，用來限制片段下載的讀取速率"""
+    if 'readrate' not in ffmpeg_features:
+        try:
+            result = subprocess.run(['ffmpeg', '-hide_banner', '-h', 'full'], capture_output=True, text=True, timeout=10)
+            ffmpeg_features['readrate'] = '-readrate ' in result.stdout
+        except (OSError, subprocess.SubprocessError):
+            ffmpeg_features['readrate'] = False
+    return ffmpeg_features['readrate']
+
+def estimate_download_bytes(info):
+    """按所選格式估計下載大小：filesize / filesize_approx，否則以 tbr × 時長推算"""
+    duration = info.get('duration')
+    total = 0
+    for fmt in info.get('requested_formats') or [info]:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = fmt['tbr'] * 1000 / 8 * duration
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+def clip_fraction(clip, duration):
+    """片段佔全片時長的比例，時長未知時返回 None"""
+    if not clip or not duration:
+        return None
+    start, end = clip
+    end = duration if end is None else min(end, duration)
+    return max(end - start, 0) / duration
+
 def build_format_options(info, limit=None):
     """从 yt-dlp info 中构建格式列表"""
     formats = []
@@ -257,20 +921,581 @@ def is_direct_video_url(url):
         return True
     return False
 
+def instrument_ydl_cache(ydl):
+    """包裝實例的快取讀取，統計本次提取的快取命中 / 未命中"""
+    cache = ydl.cache
+    original_load = cache.load
+
+    def load(section, key, *args, **kwargs):
+        result = original_load(section, key, *args, **kwargs)
+        counters = getattr(cache_tracking, 'counters', None)
+        if counters is not None:
+            counters['hits' if result is not None else 'misses'] += 1
+        return result
+
+    cache.load = load
+    return ydl
+
+def record_cache_usage(ie_key, counters, seconds):
+    """按快取狀態累計提取耗時（有未命中為 cold，全部命中為 warm）"""
+    if not ie_key or not (counters['hits'] or counters['misses']):
+        return
+    state = 'cold' if counters['misses'] else 'warm'
+    with ytdlp_cache_lock:
+        stats = ytdlp_cache_stats.setdefault(ie_key, {'warm': [0, 0.0], 'cold': [0, 0.0]})
+        stats[state][0] += 1
+        stats[state][1] += seconds
+
+def get_cache_dir_usage():
+    """返回快取目錄中的檔案列表 [(最後存取時間, 大小, 路徑)] 及總大小"""
+    files = []
+    for root, _, filenames in os.walk(YTDLP_CACHE_DIR):
+        for filename in filenames:
+            if filename == '.prune.lock':
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+    return files, sum(size for _, size, _ in files)
+
+def prune_ytdlp_cache():
+    """快取超出 YTDLP_CACHE_MAX_MB 時刪除最久未使用的檔案；以檔案鎖避免多個 worker 同時清理"""
+    lock_file = open(os.path.join(YTDLP_CACHE_DIR, '.prune.lock'), 'w')
+    try:
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0
+        files, total = get_cache_dir_usage()
+        max_bytes = YTDLP_CACHE_MAX_MB * 1024 * 1024
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            with ytdlp_cache_lock:
+                ytdlp_cache_state['pruned_files'] += 1
+                ytdlp_cache_state['pruned_bytes'] += size
+        return removed
+    finally:
+        lock_file.close()
+
+def maybe_prune_ytdlp_cache():
+    """每隔 YTDLP_CACHE_PRUNE_INTERVAL 秒最多清理一次"""
+    now = time.time()
+    with ytdlp_cache_lock:
+        if now - ytdlp_cache_state['last_prune'] < YTDLP_CACHE_PRUNE_INTERVAL:
+            return
+        ytdlp_cache_state['last_prune'] = now
+    try:
+        prune_ytdlp_cache()
+    except Exception as e:
+        print(f"yt-dlp cache prune failed: {e}")
+
+def get_ytdlp_cache_stats():
+    """返回快取目錄大小與熱快取節省的提取時間估算"""
+    files, total = get_cache_dir_usage()
+    extractors = {}
+    saved_total = 0
+    with ytdlp_cache_lock:
+        for ie_key, stats in ytdlp_cache_stats.items():
+            warm_count, warm_seconds = stats['warm']
+            cold_count, cold_seconds = stats['cold']
+            warm_avg = warm_seconds / warm_count if warm_count else 0
+            cold_avg = cold_seconds / cold_count if cold_count else 0
+            saved = max(cold_avg - warm_avg, 0) * warm_count if warm_count and cold_count else 0
+            saved_total += saved
+            extractors[ie_key] = {
+                'warm_extractions': warm_count,
+                'warm_avg_seconds': round(warm_avg, 3),
+                'cold_extractions': cold_count,
+                'cold_avg_seconds': round(cold_avg, 3),
+                'estimated_seconds_saved': round(saved, 3)
+            }
+        state = dict(ytdlp_cache_state)
+    return {
+        'cache_dir': YTDLP_CACHE_DIR,
+        'files': len(files),
+        'size_bytes': total,
+        'max_bytes': YTDLP_CACHE_MAX_MB * 1024 * 1024,
+        'last_prune': state['last_prune'],
+        'pruned_files': state['pruned_files'],
+        'pruned_bytes': state['pruned_bytes'],
+        'estimated_seconds_saved': round(saved_total, 3),
+        'extractors': extractors
+    }
+
+def ydl_pool_key(ydl_opts):
+    """由共享選項與 cookie 檔案身份（路徑 + 修改時間）生成池 key"""
+    shared = {key: value for key, value in ydl_opts.items() if key not in YDL_TASK_OPTIONS}
+    cookie_file = ydl_opts.get('cookiefile')
+    cookie_mtime = None
+    if cookie_file:
+        try:
+            cookie_mtime = os.path.getmtime(cookie_file)
+        except OSError:
+            pass
+    return json.dumps([shared, cookie_mtime], sort_keys=True, default=str)
+
+def close_pooled_ydl(ydl):
+    """關閉池中實例；池化實例不回寫 cookie 檔案，避免改變檔案身份或覆蓋新上傳的 cookies"""
+    ydl.params['cookiefile'] = None
+    try:
+        ydl.close()
+    except Exception:
+        pass
+
+def evict_idle_ydl(now=None):
+    """淘汰超過空閒時間的實例（呼叫者需持有 ydl_pool_lock），返回待關閉的實例"""
+    now = now or time.time()
+    expired = []
+    for key in list(ydl_pool):
+        idle = ydl_pool[key]
+        keep = [(ydl, last_used) for ydl, last_used in idle if now - last_used < YDL_POOL_IDLE_TIMEOUT]
+        expired.extend(ydl for ydl, last_used in idle if now - last_used >= YDL_POOL_IDLE_TIMEOUT)
+        if keep:
+            ydl_pool[key] = keep
+        else:
+            del ydl_pool[key]
+    ydl_pool_stats['evictions'] += len(expired)
+    return expired
+
+def acquire_ydl(key, base_opts):
+    """從池中取出一個空閒實例，沒有則新建"""
+    with ydl_pool_lock:
+        expired = evict_idle_ydl()
+        idle = ydl_pool.get(key)
+        ydl = idle.pop()[0] if idle else None
+        ydl_pool_stats['hits' if ydl else 'misses'] += 1
+    for old in expired:
+        close_pooled_ydl(old)
+    return ydl or instrument_ydl_cache(yt_dlp.YoutubeDL(base_opts))
+
+def release_ydl(key, ydl):
+    """將實例歸還池中，超出數量限制時關閉最舊的"""
+    overflow = []
+    with ydl_pool_lock:
+        idle = ydl_pool.setdefault(key, [])
+        ydl_pool.move_to_end(key)
+        idle.append((ydl, time.time()))
+        while len(idle) > YDL_POOL_SIZE:
+            overflow.append(idle.pop(0)[0])
+        while len(ydl_pool) > YDL_POOL_MAX_KEYS:
+            overflow.extend(ydl for ydl, _ in ydl_pool.popitem(last=False)[1])
+        ydl_pool_stats['evictions'] += len(overflow)
+    for old in overflow:
+        close_pooled_ydl(old)
+
+@contextmanager
+def pooled_ydl(ydl_opts):
+    """借出一個 YoutubeDL 實例：掛上本次的 hooks 和輸出模板，用完卸下後歸還"""
+    if YDL_POOL_SIZE <= 0:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            yield instrument_ydl_cache(ydl)
+        return
+
+    key = ydl_pool_key(ydl_opts)
+    base_opts = {key_: value for key_, value in ydl_opts.items() if key_ not in YDL_TASK_OPTIONS}
+    ydl = acquire_ydl(key, base_opts)
+    progress_hooks = ydl_opts.get('progress_hooks', [])
+    postprocessor_hooks = ydl_opts.get('postprocessor_hooks', [])
+    default_outtmpl = ydl.params['outtmpl'].get('default')
+    for hook in progress_hooks:
+        ydl.add_progress_hook(hook)
+    for hook in postprocessor_hooks:
+        ydl.add_postprocessor_hook(hook)
+    if 'outtmpl' in ydl_opts:
+        ydl.params['outtmpl']['default'] = ydl_opts['outtmpl']
+    # 其他按任務設置的選項（如分片並行數）直接寫入 params，歸還時恢復
+    task_params = [param for param in YDL_TASK_OPTIONS if param not in ('outtmpl', 'progress_hooks', 'postprocessor_hooks')]
+    saved_params = {param: ydl.params.get(param) for param in task_params}
+    for param in task_params:
+        if param in ydl_opts:
+            ydl.params[param] = ydl_opts[param]
+
+    reusable = True
+    try:
+        yield ydl
+    except (yt_dlp.utils.YoutubeDLError, TaskCancelled, AdmissionRejected):
+        raise
+    except BaseException:
+        # 非 yt-dlp 的異常可能讓實例處於未知狀態，不再放回池中
+        reusable = False
+        raise
+    finally:
+        for hook in progress_hooks:
+            if hook in ydl._progress_hooks:
+                ydl._progress_hooks.remove(hook)
+        for hook in postprocessor_hooks:
+            # yt-dlp 會把後處理 hook 複製到每個已註冊的 PostProcessor 上
+            for hooks in [ydl._postprocessor_hooks] + [pp._progress_hooks for pps in ydl._pps.values() for pp in pps]:
+                if hook in hooks:
+                    hooks.remove(hook)
+        ydl.params['outtmpl']['default'] = default_outtmpl
+        ydl.params.update(saved_params)
+        if reusable:
+            release_ydl(key, ydl)
+        else:
+            with ydl_pool_lock:
+                ydl_pool_stats['discarded'] += 1
+            close_pooled_ydl(ydl)
+
+@contextmanager
+def concurrent_stream_downloads(ydl):
+    """合併格式的各個串流同時下載：yt-dlp 逐個呼叫 dl()，前面的串流改在背景執行緒下載，
+    最後一個串流下載完後等待全部完成再返回，yt-dlp 隨即開始合併。
+    任務分得的分片並行數由各串流平分，分不開時（並行數少於串流數）仍依次下載"""
+    if not PARALLEL_STREAMS:
+        yield ydl
+        return
+
+    original_process_info = ydl.process_info
+    original_dl = ydl.dl
+    pending = {'format_ids': set(), 'threads': []}
+
+    def process_info(info_dict):
+        format_ids = {f.get('format_id') for f in info_dict.get('requested_formats') or []}
+        granted = ydl.params.get('concurrent_fragment_downloads') or 1
+        if len(format_ids) > 1 and granted >= len(format_ids):
+            pending['format_ids'] = format_ids
+            ydl.params['concurrent_fragment_downloads'] = granted // len(format_ids)
+        else:
+            pending['format_ids'] = set()
+        pending['threads'] = []
+        try:
+            return original_process_info(info_dict)
+        finally:
+            # 前台串流出錯時也要等背景下載結束，避免之後仍有執行緒寫入檔案
+            for thread, _ in pending['threads']:
+                thread.join()
+            ydl.params['concurrent_fragment_downloads'] = granted
+            pending['format_ids'] = set()
+            pending['threads'] = []
+
+    def dl(name, info, subtitle=False, test=False):
+        format_ids = pending['format_ids']
+        if subtitle or test or info.get('format_id') not in format_ids:
+            return original_dl(name, info, subtitle, test)
+        format_ids.discard(info['format_id'])
+        if format_ids:
+            result = {}
+
+            def run():
+                try:
+                    result['value'] = original_dl(name, info)
+                except BaseException as e:
+                    result['error'] = e
+
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+            pending['threads'].append((thread, result))
+            return True, True
+
+        success, real_download = original_dl(name, info)
+        for thread, result in pending['threads']:
+            thread.join()
+            if 'error' in result:
+                raise result['error']
+            success = success and result['value'][0]
+            real_download = real_download or result['value'][1]
+        pending['threads'] = []
+        return success, real_download
+
+    ydl.process_info = process_info
+    ydl.dl = dl
+    try:
+        yield ydl
+    finally:
+        del ydl.process_info
+        del ydl.dl
+
+def get_ydl_pool_stats():
+    """返回實例池狀態"""
+    with ydl_pool_lock:
+        return dict(ydl_pool_stats,
+                    keys=len(ydl_pool),
+                    idle=sum(len(idle) for idle in ydl_pool.values()),
+                    max_per_key=YDL_POOL_SIZE,
+                    max_keys=YDL_POOL_MAX_KEYS,
+                    idle_timeout=YDL_POOL_IDLE_TIMEOUT)
+
+def route_key(url):
+    """URL 的路由 key：域名 + 第一段路徑（像 ID 的路徑段以 * 代替）"""
+    parsed = urlparse(url)
+    domain = parsed.netloc.lower()
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    segment = parsed.path.strip('/').split('/')[0].lower()
+    if not re.fullmatch(r'[a-z_-]{1,24}', segment):
+        segment = '*'
+    return f'{domain}/{segment}'
+
+def _route_entry(key):
+    """取得或建立路由記錄（呼叫者需持有 routes_lock）"""
+    entry = extractor_routes.get(key)
+    if entry is None:
+        entry = extractor_routes[key] = {
+            'route': None,
+            'ie_key': None,
+            'method': None,
+            'hits': 0,
+            'successes': 0,
+            'failures': 0,
+            'consecutive_failures': 0,
+            'total_seconds': 0,
+            'updated': time.time()
+        }
+        while len(extractor_routes) > ROUTE_CACHE_MAX:
+            extractor_routes.popitem(last=False)
+    extractor_routes.move_to_end(key)
+    return entry
+
+def get_route(url):
+    """查詢 URL 的路由；過期的 HTML 路由會被清除以重新嘗試 yt-dlp"""
+    with routes_lock:
+        entry = extractor_routes.get(route_key(url))
+        if not entry or not entry['route']:
+            return None
+        if entry['route'] == 'html' and time.time() - entry['updated'] > ROUTE_HTML_TTL:
+            entry['route'] = None
+            entry['consecutive_failures'] = 0
+            return None
+        return dict(entry)
+
+def record_route_success(url, ie_key, seconds):
+    """記錄 yt-dlp 成功使用的 extractor"""
+    if not ie_key:
+        return
+    with routes_lock:
+        entry = _route_entry(route_key(url))
+        if entry['ie_key'] != ie_key or entry['route'] != 'ie':
+            entry['updated'] = time.time()
+        entry.update({'route': 'ie', 'ie_key': ie_key, 'method': 'yt_dlp', 'consecutive_failures': 0})
+        entry['successes'] += 1
+        entry['total_seconds'] += seconds
+
+def record_route_failure(url):
+    """記錄 yt-dlp 提取失敗，已快取的 extractor 失效"""
+    with routes_lock:
+        entry = _route_entry(route_key(url))
+        entry['failures'] += 1
+        entry['consecutive_failures'] += 1
+        if entry['route'] == 'ie':
+            entry['route'] = None
+
+def record_route_fallback(url, method):
+    """yt-dlp 失敗而 HTML / Instagram 解析成功；連續失敗足夠多次後直接走 HTML 路由"""
+    with routes_lock:
+        entry = _route_entry(route_key(url))
+        entry['method'] = method
+        if entry['route'] != 'html' and entry['consecutive_failures'] >= ROUTE_HTML_MIN_FAILURES:
+            entry['route'] = 'html'
+            entry['updated'] = time.time()
+
+def should_skip_yt_dlp(url):
+    """該域名近期只有 HTML 解析可用時，跳過 yt-dlp"""
+    route = get_route(url)
+    if route and route['route'] == 'html':
+        with routes_lock:
+            route_totals['html_skips'] += 1
+            _route_entry(route_key(url))['hits'] += 1
+        return True
+    return False
+
+def top_level_ie_key(ydl, url, ie_key):
+    """info 中的 extractor_key 可能是內層 extractor（如 Generic 內嵌的 HTML5MediaEmbed），找出實際匹配 URL 的那個"""
+    try:
+        if ie_key and ydl.get_info_extractor(ie_key).suitable(url):
+            return ie_key
+        for key, ie in ydl._ies.items():
+            if ie.suitable(url):
+                return key
+    except Exception:
+        pass
+    return None
+
+def extract_with_route(ydl, url, download=False):
+    """按路由快取直接呼叫對應的 extractor（跳過 suitable() 掃描），失效時回退到完整掃描"""
+    route = get_route(url)
+    ie_key = route['ie_key'] if route and route['route'] == 'ie' else None
+    start = time.time()
+    cache_tracking.counters = counters = {'hits': 0, 'misses': 0}
+    try:
+        if ie_key:
+            with routes_lock:
+                route_totals['routed'] += 1
+                _route_entry(route_key(url))['hits'] += 1
+            try:
+                info = ydl.extract_info(url, download=download, ie_key=ie_key)
+            except yt_dlp.utils.YoutubeDLError:
+                # 下載時不重試，避免重新下載；由呼叫者的備援流程處理
+                if download:
+                    raise
+                with routes_lock:
+                    route_totals['stale'] += 1
+                info = None
+            if info is not None:
+                record_route_success(url, ie_key, time.time() - start)
+                if not download:
+                    record_cache_usage(ie_key, counters, time.time() - start)
+                return info
+        with routes_lock:
+            route_totals['scans'] += 1
+        info = ydl.extract_info(url, download=download)
+    except Exception:
+        record_route_failure(url)
+        raise
+    finally:
+        cache_tracking.counters = None
+        maybe_prune_ytdlp_cache()
+    ie_key = top_level_ie_key(ydl, url, info.get('extractor_key'))
+    record_route_success(url, ie_key, time.time() - start)
+    if not download:
+        record_cache_usage(ie_key, counters, time.time() - start)
+    return info
+
+def get_route_stats():
+    """返回各域名/URL 模式的路由與命中統計"""
+    with routes_lock:
+        routes = {}
+        for key, entry in extractor_routes.items():
+            attempts = entry['successes'] + entry['failures']
+            routes[key] = {
+                'route': entry['route'],
+                'ie_key': entry['ie_key'],
+                'method': entry['method'],
+                'hits': entry['hits'],
+                'successes': entry['successes'],
+                'failures': entry['failures'],
+                'avg_extract_seconds': round(entry['total_seconds'] / entry['successes'], 3) if entry['successes'] else 0,
+                'success_rate': round(entry['successes'] / attempts, 3) if attempts else 0,
+                'updated': entry['updated']
+            }
+        return {'totals': dict(route_totals), 'routes': routes}
+
+EXTRACT_FAILURE_SCOPE = 'extract'
+
+def normalize_url(url):
+    """負面快取用的 URL 正規化：scheme 與主機小寫，去掉預設連接埠、片段（#）與結尾的 /，查詢參數排序"""
+    url = url.strip()
+    try:
+        parsed = urlparse(url)
+        port = parsed.port
+    except ValueError:
+        return url
+    scheme = parsed.scheme.lower()
+    netloc = (parsed.hostname or '').lower()
+    if port and (scheme, port) not in (('http', 80), ('https', 443)):
+        netloc = f'{netloc}:{port}'
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"{scheme}://{netloc}{parsed.path.rstrip('/')}" + (f'?{query}' if query else '')
+
+def cookie_identity(cookie_file):
+    """cookie 檔案的身分（路徑、大小與修改時間的摘要）；重新上傳 cookies 後視為不同身分"""
+    if not cookie_file:
+        return ''
+    try:
+        stat = os.stat(cookie_file)
+    except OSError:
+        return ''
+    return hashlib.sha1(f'{cookie_file}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:16]
+
+def download_failure_scope(format_id, clip):
+    """下載失敗的記錄範圍：格式不存在、片段範圍錯誤等只影響相同格式與片段的下載"""
+    return ('download', normalize_format_id(format_id), tuple(clip) if clip else None)
+
+def record_url_failure(url, cookie_file, reason_key, detail='', scope=EXTRACT_FAILURE_SCOPE):
+    """記錄 URL 的所有方法都失敗；reason_key 為翻譯 key，detail 為最後的錯誤訊息。
+    scope 為 EXTRACT_FAILURE_SCOPE（提取失敗）或 download_failure_scope() 的結果，只有相同範圍的請求會命中"""
+    if NEGATIVE_CACHE_TTL <= 0:
+        return
+    key = (normalize_url(url), cookie_identity(cookie_file), scope)
+    with failed_urls_lock:
+        failed_urls[key] = {
+            'reason_key': reason_key,
+            'detail': ' '.join(str(detail).split())[:500],
+            'source': scope if scope == EXTRACT_FAILURE_SCOPE else scope[0],
+            'failed_at': time.time(),
+            'hits': 0
+        }
+        failed_urls.move_to_end(key)
+        failed_url_totals['recorded'] += 1
+        while len(failed_urls) > NEGATIVE_CACHE_MAX:
+            failed_urls.popitem(last=False)
+
+def clear_url_failure(url, cookie_file, scopes=(EXTRACT_FAILURE_SCOPE,)):
+    """URL 提取或下載成功後刪除 scopes 範圍內的失敗記錄"""
+    if NEGATIVE_CACHE_TTL <= 0:
+        return
+    url, identity = normalize_url(url), cookie_identity(cookie_file)
+    with failed_urls_lock:
+        for scope in scopes:
+            if failed_urls.pop((url, identity, scope), None) is not None:
+                failed_url_totals['cleared'] += 1
+
+def get_url_failure(url, cookie_file, force=False, scope=EXTRACT_FAILURE_SCOPE):
+    """返回 scope 範圍內仍在有效期內的失敗記錄（含 retry_after 秒數）；沒有記錄、已過期或 force 時返回 None"""
+    if NEGATIVE_CACHE_TTL <= 0:
+        return None
+    key = (normalize_url(url), cookie_identity(cookie_file), scope)
+    now = time.time()
+    with failed_urls_lock:
+        entry = failed_urls.get(key)
+        if entry is None:
+            return None
+        if now - entry['failed_at'] > NEGATIVE_CACHE_TTL:
+            del failed_urls[key]
+            failed_url_totals['expired'] += 1
+            return None
+        if force:
+            failed_url_totals['bypassed'] += 1
+            return None
+        entry['hits'] += 1
+        failed_url_totals['hits'] += 1
+        return dict(entry, retry_after=max(1, math.ceil(NEGATIVE_CACHE_TTL - (now - entry['failed_at']))))
+
+def url_failure_message(entry, lang):
+    """失敗記錄的原因文字（按請求語言翻譯）"""
+    message = t(entry['reason_key'], lang)
+    return f"{message}: {entry['detail']}" if entry['detail'] else message
+
+def get_negative_cache_stats():
+    """返回負面快取的設定、記錄數與命中統計"""
+    with failed_urls_lock:
+        return {
+            'ttl_seconds': NEGATIVE_CACHE_TTL,
+            'max_entries': NEGATIVE_CACHE_MAX,
+            'entries': len(failed_urls),
+            **failed_url_totals
+        }
+
 def extract_video_info(url):
     """提取视频信息（包含预览信息）"""
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
         'extract_flat': False,
+        'cachedir': YTDLP_CACHE_DIR,
     }
     cookie_file = get_cookie_file(get_session_cookie_path())
     if cookie_file:
         ydl_opts['cookiefile'] = cookie_file
     
+    if should_skip_yt_dlp(url):
+        return None
+    
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        with pooled_ydl(ydl_opts) as ydl:
+            info = extract_with_route(ydl, url)
             # 获取缩略图
             thumbnail = info.get('thumbnail', '')
             if not thumbnail and info.get('thumbnails'):
@@ -300,20 +1525,113 @@ def get_video_formats(url):
         'quiet': True,
         'no_warnings': True,
         'listformats': True,
+        'cachedir': YTDLP_CACHE_DIR,
     }
     cookie_file = get_cookie_file(get_session_cookie_path())
     if cookie_file:
         ydl_opts['cookiefile'] = cookie_file
     
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        with pooled_ydl(ydl_opts) as ydl:
+            info = extract_with_route(ydl, url)
             return build_format_options(info)
     except Exception as e:
         return []
 
-def extract_instagram_video(url):
-    """專門處理 Instagram 貼文/Reels 的視頻提取"""
+PROBE_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+STREAM_CONTENT_TYPES = ('application/vnd.apple.mpegurl', 'application/x-mpegurl', 'audio/mpegurl', 'application/dash+xml')
+BINARY_CONTENT_TYPES = ('', 'application/octet-stream', 'binary/octet-stream')
+EMBED_CANDIDATE_TYPES = ('youtube', 'vimeo')  # 嵌入頁面由 yt-dlp 處理，不探測
+
+def get_probe_executor():
+    """探測候選 URL 共用的執行緒池，第一次使用時建立"""
+    with probe_executor_lock:
+        if probe_executor['pool'] is None:
+            probe_executor['pool'] = ThreadPoolExecutor(max_workers=CANDIDATE_PROBE_WORKERS,
+                                                        thread_name_prefix='candidate-probe')
+        return probe_executor['pool']
+
+def probe_video_candidate(video_url, referer=None):
+    """以 HEAD（不支援或沒有大小時改用 Range: bytes=0-0 的 GET）取得候選視頻的大小、類型與是否支援 Range"""
+    headers = dict(PROBE_HEADERS, Referer=referer) if referer else dict(PROBE_HEADERS)
+    start = time.perf_counter()
+    probe = {'status': None, 'content_type': '', 'content_length': 0, 'accepts_ranges': False, 'valid': False}
+    try:
+        response = requests.head(video_url, headers=headers, timeout=CANDIDATE_PROBE_TIMEOUT, allow_redirects=True)
+        if response.status_code >= 400 or not response.headers.get('content-length'):
+            response = requests.get(video_url, headers=dict(headers, Range='bytes=0-0'),
+                                    timeout=CANDIDATE_PROBE_TIMEOUT, allow_redirects=True, stream=True)
+            response.close()
+        content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+        total = response.headers.get('content-range', '').rpartition('/')[2]
+        if response.status_code == 206:
+            content_length = int(total) if total.isdigit() else 0
+            accepts_ranges = True
+        elif response.status_code < 400:
+            content_length = int(response.headers.get('content-length') or 0)
+            accepts_ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+        else:
+            content_length, accepts_ranges = 0, False  # 錯誤頁面的大小沒有意義
+        probe.update({
+            'status': response.status_code,
+            'content_type': content_type,
+            'content_length': content_length,
+            'accepts_ranges': accepts_ranges,
+            'valid': response.status_code < 400 and (
+                content_type.startswith('video/') or content_type in STREAM_CONTENT_TYPES
+                or (content_type in BINARY_CONTENT_TYPES and is_direct_video_url(response.url))
+            )
+        })
+    except (requests.RequestException, ValueError) as e:
+        probe['error'] = str(e)
+    probe['seconds'] = round(time.perf_counter() - start, 3)
+    return probe
+
+def rank_video_candidates(video_urls, referer=None):
+    """並行探測候選視頻並排序：可直接下載、大小已知的有效視頻按大小由大到小排在最前，
+    其次是其他有效的串流與嵌入頁面，探測失敗的排在最後"""
+    probeable = [video for video in video_urls if video.get('type') not in EMBED_CANDIDATE_TYPES]
+    if CANDIDATE_PROBE_WORKERS <= 0 or not probeable:
+        return video_urls
+    pool = get_probe_executor()
+    futures = [(video, pool.submit(probe_video_candidate, video['url'], referer)) for video in probeable]
+    for video, future in futures:
+        video['probe'] = future.result()
+
+    def rank(item):
+        index, video = item
+        probe = video.get('probe')
+        if probe is None:
+            tier = 2
+        elif not probe['valid']:
+            tier = 3
+        elif probe['content_length'] and is_direct_video_url(video['url']):
+            tier = 0
+        else:
+            tier = 1
+        return tier, -(probe or {}).get('content_length', 0), index
+    return [video for _, video in sorted(enumerate(video_urls), key=rank)]
+
+def candidate_formats(prefix, video_urls):
+    """HTML / Instagram 解析出的候選視頻轉為 formats，按探測排序，quality 越大越好"""
+    formats = []
+    for idx, video in enumerate(video_urls):
+        probe = video.get('probe')
+        fmt = {
+            'format_id': f'{prefix}_{idx}',
+            'ext': video['type'].split('/')[-1] if '/' in video['type'] else 'mp4',
+            'resolution': video.get('quality', 'unknown'),
+            'filesize': probe['content_length'] if probe else 0,
+            'quality': len(video_urls) - idx if probe and probe['valid'] else 0,
+            'video_url': video['url']  # 保存實際視頻URL
+        }
+        if probe:
+            fmt['probe'] = probe
+        formats.append(fmt)
+    return formats
+
+def extract_instagram_video(url, probe=True):
+    """專門處理 Instagram 貼文/Reels 的視頻提取；probe=False 時不探測候選（只需要新的 URL 時）"""
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -424,15 +1742,15 @@ def extract_instagram_video(url):
             if video['url'] not in seen_urls:
                 seen_urls.add(video['url'])
                 unique_videos.append(video)
-        video_info['video_urls'] = unique_videos
+        video_info['video_urls'] = rank_video_candidates(unique_videos, url) if probe else unique_videos
         
         return video_info if video_info['video_urls'] else None
         
     except Exception as e:
         return None
 
-def extract_video_from_html(url):
-    """備用方案：從HTML頁面直接提取視頻"""
+def extract_video_from_html(url, probe=True):
+    """備用方案：從HTML頁面直接提取視頻；probe=False 時不探測候選（只需要新的 URL 時）"""
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -562,83 +1880,1470 @@ def extract_video_from_html(url):
             if video['url'] not in seen_urls:
                 seen_urls.add(video['url'])
                 unique_videos.append(video)
-        video_info['video_urls'] = unique_videos
+        video_info['video_urls'] = rank_video_candidates(unique_videos, url) if probe else unique_videos
         
         return video_info if video_info['video_urls'] else None
         
     except Exception as e:
         return None
 
-def add_method_event(task_id, method_key, status, lang=None, detail=None):
-    """記錄方法嘗試狀態"""
-    if lang is None:
-        lang = get_language()
-    method_label = t(f'method_{method_key}', lang)
-    status_label = t(f'method_status_{status}', lang)
-    event = {
-        'method': method_key,
-        'method_label': method_label,
-        'status': status,
-        'status_label': status_label,
-        'detail': detail or '',
-        'timestamp': datetime.utcnow().isoformat()
-    }
-    with status_lock:
-        entry = download_status.setdefault(task_id, {})
-        entry.setdefault('methods', []).append(event)
+class TaskCancelled(Exception):
+    """任務已被要求取消，用於中斷下載流程"""
 
-def update_status(task_id, status, message, progress=0, lang=None, file_id=None, filename=None, download_url=None):
-    """更新下載狀態"""
-    if lang is None:
-        lang = get_language()
-    
-    # 存储原始消息key和翻译后的消息
-    message_key = message if message.startswith('status_') or message.startswith('error_') else None
-    translated_message = t(message, lang) if message_key else message
-    
-    with status_lock:
-        download_status[task_id] = download_status.get(task_id, {})
-        download_status[task_id].update({
-            'status': status,  # 'processing', 'downloading', 'completed', 'error'
-            'message': translated_message,  # 翻译后的消息（用于向后兼容）
-            'message_key': message_key,  # 翻译key（用于前端重新翻译）
-            'progress': progress,
-            'timestamp': time.time()
-        })
-        if file_id:
-            download_status[task_id]['file_id'] = file_id
-        if filename:
-            download_status[task_id]['filename'] = filename
-        if download_url:
-            download_status[task_id]['download_url'] = download_url
-        
-        # 如果状态是 completed 或 error，发送 webhook 回调
-        if status in ['completed', 'error']:
-            send_webhook_callback(task_id, download_status[task_id])
+FINAL_STATUSES = ('completed', 'error', 'cancelled')
 
-def download_video_direct(url, video_url, file_id, task_id=None, lang=None):
-    """直接下載視頻文件"""
-    if lang is None:
-        lang = get_language()
-    if not is_direct_video_url(video_url):
-        return None
-    try:
-        if task_id:
-            update_status(task_id, 'downloading', 'status_connecting', 10, lang)
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(video_url, headers=headers, stream=True, timeout=30)
-        response.raise_for_status()
-        
-        # 獲取文件大小
-        total_size = int(response.headers.get('content-length', 0))
-        
-        if task_id:
-            update_status(task_id, 'downloading', 'status_preparing', 20, lang)
-        
-        # 確定文件擴展名
+_MISSING = object()
+
+class StageSpan:
+    """timeline 中的一個階段記錄：欄位固定，以 __slots__ 保存，保留 span['key'] 的存取方式"""
+
+    __slots__ = ('stage', 'method', 'start', 'end', 'duration', 'bytes', 'avg_throughput', 'peak_throughput', 'status')
+
+    def __init__(self, stage, method, start, end=None, duration=None, bytes=0, avg_throughput=0, peak_throughput=0,
+                 status='running'):
+        self.stage = sys.intern(stage)
+        self.method = sys.intern(method)
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.bytes = bytes
+        self.avg_throughput = avg_throughput
+        self.peak_throughput = peak_throughput
+        self.status = sys.intern(status)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class TaskRecord:
+    """download_status 中的任務記錄：常用欄位放在 __slots__，狀態與方法名稱經 sys.intern 共用同一字串，
+    方法事件以 tuple 存在固定長度的環形緩衝，翻譯文字只在 to_dict() 序列化時產生。
+    保留字典式的 get / setdefault / [] 介面，較少用的欄位（timeline、admission、pipeline 等）放在按需建立的 extra"""
+
+    __slots__ = ('status', 'message', 'message_key', 'lang', 'progress', 'timestamp', 'file_id', 'filename',
+                 'download_url', 'last_polled', 'cancel_requested', 'version', 'updated_at', 'method_events',
+                 'method_dropped', 'extra')
+    FIELDS = ('status', 'message', 'message_key', 'progress', 'timestamp', 'file_id', 'filename', 'download_url',
+              'last_polled', 'cancel_requested', 'version')
+    INTERNED = ('status', 'message_key')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 to_dict() 的結果（例如 worker 從佇列領取的狀態）重建記錄"""
+        record = cls()
+        record.update(data)
+        return record
+
+    def touch(self):
+        """標記記錄已變更（呼叫者須持有 status_lock）；查詢時間等不影響結果的欄位不需標記"""
+        status_version['current'] += 1
+        self.version = status_version['current']
+        self.updated_at = time.time()
+
+    def changed_since(self, since_version=None, since=None):
+        """記錄是否在指定版本 / 時間之後變更過"""
+        if since_version is not None and (self.version or 0) <= since_version:
+            return False
+        return since is None or (self.updated_at or 0) > since
+
+    def set_message(self, message, lang):
+        """翻譯 key 只保存 key 與語言，其他訊息原樣保存"""
+        if message.startswith('status_') or message.startswith('error_'):
+            self.message_key = sys.intern(message)
+            self.lang = sys.intern(lang)
+            self.message = None
+        else:
+            self.message_key = None
+            self.message = message
+
+    def add_method_event(self, method, status, detail, timestamp, lang):
+        """記錄一次方法事件；超過 TASK_METHOD_EVENTS 時覆蓋最舊的事件"""
+        event = (sys.intern(method), sys.intern(status), detail, timestamp, sys.intern(lang) if lang else None)
+        if self.method_events is None:
+            self.method_events = []
+        if len(self.method_events) < TASK_METHOD_EVENTS:
+            self.method_events.append(event)
+        else:
+            dropped = self.method_dropped or 0
+            self.method_events[dropped % TASK_METHOD_EVENTS] = event
+            self.method_dropped = dropped + 1
+
+    def render_message(self):
+        if self.message is not None or self.message_key is None:
+            return self.message
+        return t(self.message_key, self.lang)
+
+    def render_methods(self):
+        events = self.method_events or []
+        if self.method_dropped:
+            start = self.method_dropped % len(events)
+            events = events[start:] + events[:start]
+        return [{
+            'method': method,
+            'method_label': t(f'method_{method}', lang),
+            'status': status,
+            'status_label': t(f'method_status_{status}', lang),
+            'detail': detail,
+            'timestamp': datetime.utcfromtimestamp(timestamp).isoformat() if isinstance(timestamp, float) else timestamp
+        } for method, status, detail, timestamp, lang in events]
+
+    def to_dict(self):
+        """序列化為原有的狀態 JSON 結構"""
+        data = {}
+        for key in self.FIELDS:
+            value = self.get(key)
+            if value is not None:
+                data[key] = value
+        if self.method_events:
+            data['methods'] = self.render_methods()
+        if self.extra:
+            data.update(self.extra)
+            if 'timeline' in self.extra:
+                data['timeline'] = [span.to_dict() for span in self.extra['timeline']]
+        return data
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            value = self.render_message() if key == 'message' else getattr(self, key)
+        elif key == 'methods':
+            value = self.render_methods() if self.method_events else None
+        else:
+            return self.extra.get(key, default) if self.extra else default
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key == 'methods':
+            self.method_events = None
+            self.method_dropped = None
+            for event in value or []:
+                self.add_method_event(event['method'], event['status'], event.get('detail', ''),
+                                      event.get('timestamp'), None)
+        elif key == 'timeline':
+            self.extra = self.extra or {}
+            self.extra[key] = [StageSpan(**span) if isinstance(span, dict) else span for span in value]
+        elif key in self.FIELDS:
+            if key in self.INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            return self.get(key)
+        return value
+
+    def update(self, values):
+        for key, value in values.items():
+            self[key] = value
+
+def task_record(task_id):
+    """返回任務記錄，不存在時建立（呼叫者須持有 status_lock）"""
+    record = download_status.get(task_id)
+    if record is None:
+        record = download_status[task_id] = TaskRecord()
+    return record
+
+def uses_task_queue():
+    """本行程是否只把任務寫入共用佇列（分散式模式的 API 節點）"""
+    return task_queue is not None and not worker_state['active']
+
+def get_task_status(task_id):
+    """返回任務狀態的副本並記錄查詢時間；分散式模式下讀取 worker 發布到共用佇列的狀態"""
+    if uses_task_queue():
+        return task_queue.fetch(task_id)
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is None:
+            return None
+        entry['last_polled'] = time.time()
+        return entry.to_dict()
+
+def get_task_statuses(task_ids, since_version=None, since=None):
+    """批次讀取任務狀態並記錄查詢時間，只返回在 since_version / since（時間戳）之後變更過的任務；
+    返回 (task_id -> 狀態, 找不到的 task_id, 目前版本)"""
+    if uses_task_queue():
+        return task_queue.fetch_many(task_ids, since_version, since)
+    now = time.time()
+    statuses = {}
+    missing = []
+    with status_lock:
+        for task_id in task_ids:
+            record = download_status.get(task_id)
+            if record is None:
+                missing.append(task_id)
+                continue
+            record.last_polled = now
+            if record.changed_since(since_version, since):
+                statuses[task_id] = record.to_dict()
+        version = status_version['current']
+    return statuses, missing, version
+
+def is_task_cancelled(task_id):
+    """任務是否已被要求取消"""
+    if not task_id:
+        return False
+    with status_lock:
+        return bool(download_status.get(task_id, {}).get('cancel_requested'))
+
+def check_cancelled(task_id):
+    """任務已被要求取消時拋出 TaskCancelled"""
+    if is_task_cancelled(task_id):
+        raise TaskCancelled(task_id)
+
+def cancel_task(task_id, reason):
+    """要求取消任務，下載執行緒在下一個檢查點中斷；返回 'not_found'、'finished' 或 'cancelling'"""
+    if uses_task_queue():
+        return task_queue.request_cancel(task_id, reason)
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is None:
+            return 'not_found'
+        if entry.get('status') in FINAL_STATUSES:
+            return 'finished'
+        entry['cancel_requested'] = True
+        entry.setdefault('cancel_reason', reason)
+        entry.touch()
+    return 'cancelling'
+
+def get_file_bytes(file_id):
+    """任務在下載目錄中的檔案總大小"""
+    total = 0
+    for filename in os.listdir(DOWNLOAD_DIR):
+        if filename.startswith(file_id):
+            try:
+                total += os.path.getsize(os.path.join(DOWNLOAD_DIR, filename))
+            except OSError:
+                pass
+    return total
+
+def remove_partial_files(file_id):
+    """刪除任務未完成的下載檔案（包括 .part 與分片暫存檔）"""
+    for filename in os.listdir(DOWNLOAD_DIR):
+        if filename.startswith(file_id):
+            try:
+                os.remove(os.path.join(DOWNLOAD_DIR, filename))
+            except OSError:
+                pass
+
+def reap_unpolled_tasks():
+    """定期取消超過 TASK_POLL_TIMEOUT 秒沒有查詢狀態、也沒有 webhook 的任務"""
+    interval = max(1, min(30, TASK_POLL_TIMEOUT / 4))
+    while True:
+        time.sleep(interval)
+        now = time.time()
+        with webhook_lock:
+            watched = set(webhook_callbacks)
+        with status_lock:
+            stale = [
+                task_id for task_id, entry in download_status.items()
+                if entry.get('status') not in FINAL_STATUSES and task_id not in watched
+                and not entry.get('cancel_requested')
+                and now - entry.get('last_polled', now) > TASK_POLL_TIMEOUT
+            ]
+        for task_id in stale:
+            cancel_task(task_id, f'status not polled for {TASK_POLL_TIMEOUT}s')
+
+def ensure_task_reaper():
+    """第一次啟動任務時才建立自動取消執行緒"""
+    if TASK_POLL_TIMEOUT <= 0:
+        return
+    with task_reaper_lock:
+        if task_reaper['thread'] is None:
+            task_reaper['thread'] = threading.Thread(target=reap_unpolled_tasks, daemon=True)
+            task_reaper['thread'].start()
+
+def add_method_event(task_id, method_key, status, lang=None, detail=None):
+    """記錄方法嘗試狀態；開始嘗試下一個方法前先確認任務未被取消"""
+    if lang is None:
+        lang = get_language()
+    if status == 'trying':
+        check_cancelled(task_id)
+    with status_lock:
+        record = task_record(task_id)
+        record.add_method_event(method_key, status, detail or '', time.time(), lang)
+        record.touch()
+    if status == 'trying':
+        begin_stage(task_id, 'attempt', method_key)
+    else:
+        end_stage(task_id, 'attempt', status, method_key)
+
+def update_status(task_id, status, message, progress=0, lang=None, file_id=None, filename=None, download_url=None):
+    """更新下載狀態"""
+    if lang is None:
+        lang = get_language()
+    
+    with status_lock:
+        record = task_record(task_id)
+        # 已取消的任務不再被仍在結束中的執行緒覆蓋
+        if record.status == 'cancelled':
+            return
+        record.status = status  # 'processing', 'downloading', 'completed', 'error', 'cancelled'
+        # 翻譯 key 只保存 key 與語言（前端可重新翻譯），序列化時才產生翻譯後的 message
+        record.set_message(message, lang)
+        record.progress = progress
+        record.timestamp = time.time()
+        if file_id:
+            record.file_id = file_id
+        if filename:
+            record.filename = filename
+        if download_url:
+            record.download_url = download_url
+        record.touch()
+        
+        # 如果状态是 completed、error 或 cancelled，发送 webhook 回调
+        if status in FINAL_STATUSES:
+            stage_status = {'completed': 'success', 'error': 'failed'}.get(status, status)
+            _close_open_stages(task_id, record, stage_status)
+            _close_pipeline_records(record)
+            send_webhook_callback(task_id, record)
+
+def _find_open_stage(entry, stage, method=None):
+    """查找尚未結束的階段記錄"""
+    for span in reversed(entry.get('timeline', [])):
+        if span['stage'] == stage and span['end'] is None and (method is None or span['method'] == method):
+            return span
+    return None
+
+def _record_stage_stats(span):
+    """將已結束的階段累加到匯總統計"""
+    with stage_stats_lock:
+        bucket = stage_stats.setdefault(span['stage'], {'methods': {}})
+        targets = [bucket]
+        if span['method']:
+            targets.append(bucket['methods'].setdefault(span['method'], {}))
+        for stats in targets:
+            stats['count'] = stats.get('count', 0) + 1
+            if span['status'] == 'failed':
+                stats['failed'] = stats.get('failed', 0) + 1
+            stats['total_seconds'] = stats.get('total_seconds', 0) + span['duration']
+            stats['max_seconds'] = max(stats.get('max_seconds', 0), span['duration'])
+            stats['total_bytes'] = stats.get('total_bytes', 0) + span['bytes']
+            stats['peak_throughput'] = max(stats.get('peak_throughput', 0), span['peak_throughput'])
+
+def _close_stage(task_id, entry, span, status, now):
+    """結束階段並更新任務的階段總計（呼叫者需持有 status_lock）"""
+    span['end'] = now
+    span['duration'] = round(now - span['start'], 3)
+    span['status'] = status
+    if span['duration'] > 0:
+        span['avg_throughput'] = int(span['bytes'] / span['duration'])
+    span['peak_throughput'] = max(span['peak_throughput'], span['avg_throughput'])
+    stage_samples.pop((task_id, span['stage']), None)
+
+    totals = entry.setdefault('stage_totals', {})
+    totals[span['stage']] = round(totals.get(span['stage'], 0) + span['duration'], 3)
+    if span['stage'] == 'attempt' and status == 'failed':
+        totals['fallback'] = round(totals.get('fallback', 0) + span['duration'], 3)
+    _record_stage_stats(span)
+
+def _close_open_stages(task_id, entry, status):
+    """任務結束時關閉所有未結束的階段（呼叫者需持有 status_lock）"""
+    now = time.time()
+    for span in entry.get('timeline', []):
+        if span['end'] is None:
+            _close_stage(task_id, entry, span, status, now)
+
+def begin_stage(task_id, stage, method=None):
+    """開始記錄任務階段（extract / download / postprocess / attempt）"""
+    if not task_id:
+        return
+    with status_lock:
+        record = task_record(task_id)
+        record.setdefault('timeline', []).append(StageSpan(stage, method or '', time.time()))
+        record.touch()
+
+def record_stage_bytes(task_id, stage, transferred_bytes):
+    """更新階段已傳輸位元組數（累計值），並按取樣間隔計算峰值吞吐量"""
+    if not task_id:
+        return
+    now = time.time()
+    with status_lock:
+        entry = download_status.get(task_id)
+        span = _find_open_stage(entry, stage) if entry else None
+        if span is None:
+            return
+        span['bytes'] = transferred_bytes
+        entry.touch()
+        sample_key = (task_id, stage)
+        last_time, last_bytes = stage_samples.get(sample_key, (span['start'], 0))
+        elapsed = now - last_time
+        if elapsed >= STAGE_SAMPLE_INTERVAL:
+            rate = int(max(transferred_bytes - last_bytes, 0) / elapsed)
+            span['peak_throughput'] = max(span['peak_throughput'], rate)
+            stage_samples[sample_key] = (now, transferred_bytes)
+
+def end_stage(task_id, stage, status='success', method=None, transferred_bytes=None):
+    """結束任務階段"""
+    if not task_id:
+        return
+    with status_lock:
+        entry = download_status.get(task_id)
+        span = _find_open_stage(entry, stage, method) if entry else None
+        if span is None:
+            return
+        if transferred_bytes is not None:
+            span['bytes'] = transferred_bytes
+        _close_stage(task_id, entry, span, status, time.time())
+        entry.touch()
+
+def get_stage_stats():
+    """返回各階段的匯總統計（含平均耗時與平均吞吐量）"""
+    def summarize(stats):
+        count = stats.get('count', 0)
+        total_seconds = stats.get('total_seconds', 0)
+        return {
+            'count': count,
+            'failed': stats.get('failed', 0),
+            'total_seconds': round(total_seconds, 3),
+            'avg_seconds': round(total_seconds / count, 3) if count else 0,
+            'max_seconds': round(stats.get('max_seconds', 0), 3),
+            'total_bytes': stats.get('total_bytes', 0),
+            'avg_throughput': int(stats.get('total_bytes', 0) / total_seconds) if total_seconds else 0,
+            'peak_throughput': stats.get('peak_throughput', 0)
+        }
+
+    with stage_stats_lock:
+        result = {}
+        for stage, bucket in stage_stats.items():
+            result[stage] = summarize(bucket)
+            result[stage]['methods'] = {
+                method: summarize(stats) for method, stats in bucket['methods'].items()
+            }
+        return result
+
+@contextmanager
+def reserve_fragment_slots(task_id):
+    """為一次 yt-dlp 下載分配分片並行數：不超過每任務上限，全局配額用完時退回逐個下載"""
+    with fragment_slots_lock:
+        in_use = sum(fragment_slots.values()) - fragment_slots.get(task_id, 0)
+        granted = max(1, min(FRAGMENT_CONCURRENCY, FRAGMENT_CONCURRENCY_GLOBAL - in_use))
+        fragment_slots[task_id] = granted
+    try:
+        yield granted
+    finally:
+        with fragment_slots_lock:
+            fragment_slots.pop(task_id, None)
+
+def record_fragment_progress(task_id, d):
+    """記錄 HLS/DASH 分片下載進度，計算每個分片的平均大小、耗時與吞吐量"""
+    fragment_index = d.get('fragment_index')
+    if not task_id or fragment_index is None:
+        return
+    elapsed = d.get('elapsed') or 0
+    downloaded = d.get('downloaded_bytes') or 0
+    with fragment_slots_lock:
+        concurrency = fragment_slots.get(task_id, 1)
+    stats = {
+        'format_id': (d.get('info_dict') or {}).get('format_id'),
+        'concurrency': concurrency,
+        'completed': fragment_index,
+        'total': d.get('fragment_count'),
+        'throughput': int(downloaded / elapsed) if elapsed else 0
+    }
+    if fragment_index and elapsed:
+        # 同時下載多個分片時，每個分片實際佔用的時間約為總耗時 × 並行數 / 已完成數
+        avg_bytes = downloaded / fragment_index
+        avg_seconds = elapsed * min(concurrency, fragment_index) / fragment_index
+        stats.update({
+            'avg_fragment_bytes': int(avg_bytes),
+            'avg_fragment_seconds': round(avg_seconds, 3),
+            'per_fragment_throughput': int(avg_bytes / avg_seconds) if avg_seconds else 0
+        })
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is not None:
+            entry['fragments'] = stats
+            entry.touch()
+
+class PipelineStage:
+    """限制同時執行任務數的管線階段，超出時按先來後到排隊"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._active = set()
+        self._waiting = []
+
+    def _can_run(self, task_id):
+        return self._waiting[0] == task_id and (self.workers <= 0 or len(self._active) < self.workers)
+
+    def acquire(self, task_id, on_wait=None, should_abort=None):
+        """等待空閒位置；排隊位置變化時呼叫 on_wait(位置, 排隊數)，返回等待秒數；
+        should_abort() 為真時放棄排隊並返回 None"""
+        start = time.time()
+        last_position = None
+        with self._cond:
+            self._waiting.append(task_id)
+            while not self._can_run(task_id):
+                if should_abort and should_abort():
+                    self._waiting.remove(task_id)
+                    self._cond.notify_all()
+                    return None
+                position = self._waiting.index(task_id) + 1
+                if on_wait and position != last_position:
+                    on_wait(position, len(self._waiting))
+                    last_position = position
+                self._cond.wait(1)
+            self._waiting.remove(task_id)
+            self._active.add(task_id)
+            self._cond.notify_all()
+        return time.time() - start
+
+    def release(self, task_id):
+        with self._cond:
+            self._active.discard(task_id)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {'workers': self.workers, 'active': len(self._active), 'queued': len(self._waiting)}
+
+pipeline_stages = {
+    'download': PipelineStage('download', DOWNLOAD_WORKERS),
+    'postprocess': PipelineStage('postprocess', POSTPROCESS_WORKERS)
+}
+
+class AdmissionRejected(Exception):
+    """任務的估計大小無法放入磁碟，或等待空間逾時"""
+
+    def __init__(self, message_key, detail=''):
+        super().__init__(message_key)
+        self.message_key = message_key
+        self.detail = detail
+
+class AdmissionController:
+    """按估計大小為任務預留磁碟空間與在途流量，放不下時按先來後到排隊"""
+
+    def __init__(self, directory, reserve_bytes, max_inflight_bytes):
+        self.directory = directory
+        self.reserve_bytes = reserve_bytes
+        self.max_inflight_bytes = max_inflight_bytes
+        self._cond = threading.Condition()
+        self._reservations = {}  # task_id -> (file_id, 預留位元組)
+        self._waiting = []
+        self._counters = {'admitted': 0, 'queued': 0, 'rejected': 0, 'timeouts': 0}
+
+    def _outstanding(self, exclude=None):
+        """已預留但尚未寫入磁碟的位元組（已寫入的部分已反映在剩餘空間中）"""
+        written = {}
+        for filename in os.listdir(self.directory):
+            file_id = filename[:36]
+            try:
+                written[file_id] = written.get(file_id, 0) + os.path.getsize(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+        return sum(
+            max(size - written.get(file_id, 0), 0)
+            for task_id, (file_id, size) in self._reservations.items() if task_id != exclude
+        )
+
+    def _free_bytes(self):
+        return shutil.disk_usage(self.directory).free - self.reserve_bytes
+
+    def _fits(self, task_id, size):
+        outstanding = self._outstanding(exclude=task_id)
+        if size > self._free_bytes() - outstanding:
+            return False
+        # 單個任務超過在途上限時，等其他任務都下載完再放行
+        if self.max_inflight_bytes > 0 and outstanding and outstanding + size > self.max_inflight_bytes:
+            return False
+        return True
+
+    def acquire(self, task_id, file_id, size, on_wait=None, should_abort=None, timeout=None):
+        """預留 size 位元組並返回等待秒數；should_abort() 為真時返回 None。
+        估計大小超過目前可用空間或等待逾時拋出 AdmissionRejected"""
+        start = time.time()
+        last_position = None
+        with self._cond:
+            self._reservations.pop(task_id, None)
+            free = self._free_bytes()
+            if size > free:
+                self._counters['rejected'] += 1
+                raise AdmissionRejected('error_insufficient_disk', f'{size // 1024 // 1024}MB > {max(free, 0) // 1024 // 1024}MB')
+            self._waiting.append(task_id)
+            try:
+                while not (self._waiting[0] == task_id and self._fits(task_id, size)):
+                    if should_abort and should_abort():
+                        return None
+                    if timeout and time.time() - start > timeout:
+                        self._counters['timeouts'] += 1
+                        raise AdmissionRejected('error_admission_timeout', f'{int(timeout)}s')
+                    position = self._waiting.index(task_id) + 1
+                    if last_position is None:
+                        self._counters['queued'] += 1
+                    if on_wait and position != last_position:
+                        on_wait(position, len(self._waiting))
+                    last_position = position
+                    # 磁碟空間會因其他任務寫入或清理而變化，定期重新檢查
+                    self._cond.wait(1)
+                self._reservations[task_id] = (file_id, size)
+                self._counters['admitted'] += 1
+            finally:
+                self._waiting.remove(task_id)
+                self._cond.notify_all()
+        return time.time() - start
+
+    def release(self, task_id):
+        with self._cond:
+            if self._reservations.pop(task_id, None) is not None:
+                self._cond.notify_all()
+
+    def retry_after(self):
+        """排隊已滿或磁碟已低於保留空間時，返回建議的重試秒數；否則返回 None"""
+        with self._cond:
+            if len(self._waiting) < ADMISSION_MAX_QUEUED and self._free_bytes() > 0:
+                return None
+            outstanding = self._outstanding()
+        throughput = get_stage_stats().get('download', {}).get('avg_throughput')
+        if not throughput or not outstanding:
+            return 30
+        return int(min(max(outstanding / throughput, 5), 600))
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, **{
+                'free_bytes': max(self._free_bytes(), 0),
+                'reserve_bytes': self.reserve_bytes,
+                'max_inflight_bytes': self.max_inflight_bytes,
+                'reserved_bytes': sum(size for _, size in self._reservations.values()),
+                'outstanding_bytes': self._outstanding(),
+                'active': len(self._reservations),
+                'waiting': len(self._waiting)
+            })
+
+admission = AdmissionController(DOWNLOAD_DIR, DISK_RESERVE_MB * 1024 * 1024, MAX_INFLIGHT_MB * 1024 * 1024)
+
+def admit_download(task_id, file_id, estimated_bytes, source, lang=None):
+    """下載開始前按估計大小預留空間，放不下時排隊並在狀態中顯示排隊位置；返回是否曾排隊。
+    大小未知時不預留"""
+    bandwidth.set_size(task_id, estimated_bytes)
+    if not task_id or not estimated_bytes:
+        with status_lock:
+            entry = download_status.get(task_id)
+            if entry is not None:
+                entry['admission'] = {'state': 'admitted', 'estimated_bytes': None, 'source': 'unknown', 'wait_seconds': 0}
+                entry.touch()
+        return False
+    if lang is None:
+        lang = get_language()
+
+    def on_wait(position, depth):
+        with status_lock:
+            entry = download_status.get(task_id, {})
+            entry.setdefault('admission', {}).update({'state': 'queued', 'queue_position': position, 'queue_depth': depth})
+            progress = entry.get('progress', 0)
+        update_status(task_id, 'processing', f"{t('status_waiting_disk', lang)} (#{position})", progress, lang)
+
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is not None:
+            entry['admission'] = {'state': 'checking', 'estimated_bytes': int(estimated_bytes), 'source': source, 'wait_seconds': 0}
+            entry.touch()
+    try:
+        waited = admission.acquire(task_id, file_id, int(estimated_bytes), on_wait,
+                                   lambda: is_task_cancelled(task_id), ADMISSION_QUEUE_TIMEOUT)
+    except AdmissionRejected:
+        with status_lock:
+            entry = download_status.get(task_id)
+            if entry is not None:
+                entry.setdefault('admission', {}).update({'state': 'rejected', 'queue_position': 0})
+                entry.touch()
+        raise
+    if waited is None:
+        raise TaskCancelled(task_id)
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is not None:
+            record = entry.setdefault('admission', {})
+            queued = record.get('state') == 'queued'
+            record.update({'state': 'admitted', 'queue_position': 0, 'wait_seconds': round(waited, 3)})
+            entry.touch()
+            return queued
+    return False
+
+def reserved_download_bytes(info):
+    """yt-dlp 所選格式需要預留的磁碟空間：合併或轉檔時原始串流與輸出檔會同時存在，按兩倍預留"""
+    size = estimate_download_bytes(info)
+    if not size:
+        return None
+    if len(info.get('requested_formats') or []) > 1 or info.get('ext') != MERGE_OUTPUT_FORMAT:
+        size *= 2
+    return size
+
+def water_fill(capacity, demands, weights):
+    """按權重分配 capacity；需求低於份額的只拿需求，剩餘再分給其他人（max-min fairness）"""
+    if capacity == float('inf'):
+        return dict(demands)
+    allocation = {}
+    pending = dict(demands)
+    while pending:
+        share = max(capacity, 0) / sum(weights[key] for key in pending)
+        satisfied = {key: demand for key, demand in pending.items() if demand <= share * weights[key]}
+        if not satisfied:
+            for key in pending:
+                allocation[key] = share * weights[key]
+            break
+        for key, demand in satisfied.items():
+            allocation[key] = demand
+            capacity -= demand
+            del pending[key]
+    return allocation
+
+class BandwidthManager:
+    """令牌桶頻寬整形：每個任務一個令牌桶，速率由全局 / API key / 任務上限按權重公平分配，
+    並依各任務實際吞吐量定期重新分配（受來源限速的任務讓出用不完的份額）"""
+
+    REBALANCE_INTERVAL = 0.5
+    IDLE_SECONDS = 2  # 超過此秒數沒有傳輸的任務不參與分配（排隊中、後處理中）
+    MIN_RATE = 32 * 1024
+    LOW_PRIORITY_WEIGHT = 0.25  # 預取等推測性任務的權重倍數
+
+    def __init__(self, global_limit, task_limit, key_limit, short_job_bytes):
+        self.global_limit = global_limit or float('inf')
+        self.task_limit = task_limit or float('inf')
+        self.key_limit = key_limit or float('inf')
+        self.short_job_bytes = short_job_bytes
+        self.enabled = bool(global_limit or task_limit or key_limit)
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._last_rebalance = 0
+
+    def configure(self, task_id, api_key=None, limit=None):
+        """登記任務所屬的 API key 與單獨的速率上限（bytes/s）"""
+        if not self.enabled and not limit:
+            return
+        with self._lock:
+            self.enabled = True
+            task = self._tasks.setdefault(task_id, self._new_task())
+            task['api_key'] = api_key
+            task['limit'] = min(limit or float('inf'), self.task_limit)
+
+    def set_priority(self, task_id, low_priority, limit=None):
+        """調整任務的優先級與速率上限：預取任務開始前登記為低優先級（有上限時即使未設全局上限也啟用整形），
+        被接手後恢復一般優先級並解除上限"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                if not low_priority:
+                    return
+                task = self._tasks[task_id] = self._new_task()
+            if limit:
+                self.enabled = True
+            task['low_priority'] = low_priority
+            task['limit'] = min(limit or float('inf'), self.task_limit)
+            self._last_rebalance = 0
+
+    def set_size(self, task_id, total_bytes):
+        """記錄任務的估計大小，剩餘較少的任務分配權重較高"""
+        with self._lock:
+            if task_id in self._tasks and total_bytes:
+                self._tasks[task_id]['size'] = total_bytes
+
+    def forget(self, task_id):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    def _new_task(self):
+        return {
+            'api_key': None, 'limit': self.task_limit, 'size': None, 'transferred': 0,
+            'rate': float('inf'), 'tokens': 0, 'last_fill': time.time(), 'active_since': None,
+            'last_active': 0, 'window_start': time.time(), 'window_bytes': 0, 'measured': 0,
+            'throttled': False, 'was_throttled': False, 'low_priority': False
+        }
+
+    def _weight(self, task):
+        weight = 4 if task['size'] and task['size'] - task['transferred'] < self.short_job_bytes else 1
+        return weight * self.LOW_PRIORITY_WEIGHT if task['low_priority'] else weight
+
+    def _demand(self, task, now):
+        # 剛開始傳輸或最近需要等待令牌（份額已用滿）時需求視為無限；
+        # 從未被限速且實測明顯低於份額（來源本身較慢）時只保留略高於實測的速率，其餘讓出
+        demand = task['limit']
+        saturated = task['throttled'] or task['was_throttled']
+        if now - task['active_since'] > self.IDLE_SECONDS and not saturated and task['measured'] < task['rate'] * 0.8:
+            demand = min(demand, max(task['measured'] * 1.5, self.MIN_RATE))
+        return demand
+
+    def _rebalance(self, now):
+        """先把全局上限分給各 API key（沒有 key 的任務各自一組），再在組內分給各任務"""
+        active = {
+            task_id: task for task_id, task in self._tasks.items()
+            if task['active_since'] is not None and now - task['last_active'] <= self.IDLE_SECONDS
+        }
+        for task in self._tasks.values():
+            if task['active_since'] is not None and now - task['last_active'] > self.IDLE_SECONDS:
+                task['active_since'] = None
+        groups = {}
+        for task_id, task in active.items():
+            group = ('key', task['api_key']) if task['api_key'] else ('task', task_id)
+            groups.setdefault(group, {})[task_id] = task
+        group_demands = {}
+        group_weights = {}
+        for group, tasks in groups.items():
+            total = sum(self._demand(task, now) for task in tasks.values())
+            group_demands[group] = min(total, self.key_limit) if group[0] == 'key' else total
+            group_weights[group] = sum(self._weight(task) for task in tasks.values())
+        group_rates = water_fill(self.global_limit, group_demands, group_weights)
+        for group, tasks in groups.items():
+            rates = water_fill(
+                group_rates[group],
+                {task_id: self._demand(task, now) for task_id, task in tasks.items()},
+                {task_id: self._weight(task) for task_id, task in tasks.items()}
+            )
+            for task_id, rate in rates.items():
+                tasks[task_id]['rate'] = rate
+        self._last_rebalance = now
+
+    def consume(self, task_id, nbytes):
+        """記錄傳輸了 nbytes，返回為維持分配速率需要等待的秒數"""
+        if not self.enabled or not task_id:
+            return 0
+        now = time.time()
+        with self._lock:
+            task = self._tasks.setdefault(task_id, self._new_task())
+            if task['active_since'] is None:
+                task['active_since'] = now
+                task['last_fill'] = now
+                task['tokens'] = 0
+                task['last_active'] = now
+                self._rebalance(now)
+            task['last_active'] = now
+            task['transferred'] += nbytes
+            task['window_bytes'] += nbytes
+            if now - task['window_start'] >= 1:
+                task['measured'] = task['window_bytes'] / (now - task['window_start'])
+                task['window_start'] = now
+                task['window_bytes'] = 0
+                task['was_throttled'] = task['throttled']
+                task['throttled'] = False
+            if now - self._last_rebalance >= self.REBALANCE_INTERVAL:
+                self._rebalance(now)
+            rate = task['rate']
+            if rate == float('inf'):
+                return 0
+            # 令牌桶最多累積一秒的量，用完後欠下的量換算成等待時間
+            task['tokens'] = min(task['tokens'] + (now - task['last_fill']) * rate, rate)
+            task['last_fill'] = now
+            task['tokens'] -= nbytes
+            if task['tokens'] >= 0:
+                return 0
+            task['throttled'] = True
+            return -task['tokens'] / rate
+
+    def current_rate(self, task_id):
+        """任務目前分得的速率（bytes/s），不限制時返回 None；尚未開始傳輸的任務按加入後的份額估算"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            task = self._tasks.setdefault(task_id, self._new_task())
+            if task['active_since'] is None:
+                task['active_since'] = task['last_active'] = task['last_fill'] = now
+                self._rebalance(now)
+            rate = task['rate']
+        return None if rate == float('inf') else int(rate)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            tasks = {
+                task_id: {
+                    'api_key': (task['api_key'] or '')[:4] + '...' if task['api_key'] else None,
+                    'active': task['active_since'] is not None and now - task['last_active'] <= self.IDLE_SECONDS,
+                    'rate_limit': None if task['rate'] == float('inf') else int(task['rate']),
+                    'measured_rate': int(task['measured']),
+                    'transferred_bytes': task['transferred'],
+                    'weight': self._weight(task)
+                }
+                for task_id, task in self._tasks.items()
+            }
+        def as_limit(value):
+            return None if value == float('inf') else int(value)
+
+        return {
+            'enabled': self.enabled,
+            'global_limit': as_limit(self.global_limit),
+            'task_limit': as_limit(self.task_limit),
+            'api_key_limit': as_limit(self.key_limit),
+            'allocated': sum(task['rate_limit'] or 0 for task in tasks.values() if task['active']),
+            'tasks': tasks
+        }
+
+bandwidth = BandwidthManager(BANDWIDTH_LIMIT_KBPS * 1024, TASK_BANDWIDTH_LIMIT_KBPS * 1024,
+                             API_KEY_BANDWIDTH_LIMIT_KBPS * 1024, BANDWIDTH_SHORT_JOB_MB * 1024 * 1024)
+
+def throttle_transfer(task_id, nbytes):
+    """傳輸 nbytes 後按分配速率等待；不限速時也先檢查一次任務是否已取消，等待期間每 0.5 秒再檢查"""
+    check_cancelled(task_id)
+    delay = bandwidth.consume(task_id, nbytes)
+    while delay > 0:
+        time.sleep(min(delay, 0.5))
+        delay -= 0.5
+        check_cancelled(task_id)
+
+def connection_rate_limit(task_id, fragmented=False):
+    """yt-dlp 每個連線的 ratelimit：分片下載時任務分得的速率平均分給同時下載的分片。
+    略高於份額，只用來平滑單一連線的突發，實際速率仍由令牌桶決定"""
+    rate = bandwidth.current_rate(task_id)
+    if rate is None:
+        return None
+    concurrency = 1
+    if fragmented:
+        with fragment_slots_lock:
+            concurrency = fragment_slots.get(task_id, 1)
+    return max(int(rate * 1.25 / concurrency), 1024)
+
+def _update_pipeline_record(task_id, stage, **fields):
+    """更新任務狀態中某個管線階段的記錄"""
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is None:
+            return
+        record = entry.setdefault('pipeline', {}).setdefault(stage, {
+            'state': 'queued', 'queue_position': 0, 'queue_depth': 0, 'wait_seconds': 0, 'seconds': 0, 'started_at': None
+        })
+        record.update(fields)
+        entry.touch()
+        return record
+
+def enter_pipeline_stage(task_id, stage, lang=None):
+    """讓任務進入下載 / 後處理階段：先離開目前的階段，再排隊等待空閒位置"""
+    with pipeline_lock:
+        current = task_pipeline_stage.get(task_id)
+    if current == stage:
+        return
+    leave_pipeline_stage(task_id)
+    if lang is None:
+        lang = get_language()
+
+    def on_wait(position, depth):
+        _update_pipeline_record(task_id, stage, state='queued', queue_position=position, queue_depth=depth)
+        with status_lock:
+            progress = download_status.get(task_id, {}).get('progress', 0)
+        update_status(task_id, 'processing', f"{t('status_queued', lang)} ({stage} #{position})", progress, lang)
+
+    if stage == 'download':
+        # 預取任務不能讓一般下載排隊：下載階段已滿時取消最早的預取任務讓出位置
+        stats = pipeline_stages[stage].stats()
+        with status_lock:
+            speculative = download_status.get(task_id, {}).get('prefetch') == 'pending'
+        if not speculative and 0 < stats['workers'] <= stats['active'] + stats['queued']:
+            prefetcher.preempt()
+    waited = pipeline_stages[stage].acquire(task_id, on_wait, lambda: is_task_cancelled(task_id))
+    if waited is None:
+        raise TaskCancelled(task_id)
+    with pipeline_lock:
+        task_pipeline_stage[task_id] = stage
+    with status_lock:
+        record = download_status.get(task_id, {}).get('pipeline', {}).get(stage, {})
+        wait_seconds = record.get('wait_seconds', 0) + waited
+    _update_pipeline_record(task_id, stage, state='running', queue_position=0,
+                            queue_depth=pipeline_stages[stage].stats()['queued'],
+                            wait_seconds=round(wait_seconds, 3), started_at=time.time())
+
+def _close_pipeline_records(entry):
+    """累計執行中階段的耗時並標記為完成（呼叫者需持有 status_lock）"""
+    now = time.time()
+    for record in entry.get('pipeline', {}).values():
+        if record.get('started_at'):
+            record['seconds'] = round(record['seconds'] + now - record['started_at'], 3)
+            record['started_at'] = None
+            record['state'] = 'done'
+
+def leave_pipeline_stage(task_id):
+    """離開目前的管線階段並累計該階段的執行時間"""
+    with pipeline_lock:
+        stage = task_pipeline_stage.pop(task_id, None)
+    if stage is None:
+        return
+    pipeline_stages[stage].release(task_id)
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is not None:
+            _close_pipeline_records(entry)
+
+class StackSampler:
+    """定時取樣指定執行緒的 Python 堆疊，輸出 collapsed stack（flamegraph）格式"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.started = None
+        self.duration = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = round(time.time() - self.started, 3)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        """返回 flamegraph.pl / speedscope 可讀取的 collapsed stack 文本"""
+        lines = [f'{stack} {count}' for stack, count in sorted(self.stacks.items(), key=lambda x: -x[1])]
+        return '\n'.join(lines) + '\n'
+
+    def top_functions(self, limit=20):
+        """按自身取樣次數（堆疊頂端）排序的函數列表"""
+        counts = {}
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            counts[leaf] = counts.get(leaf, 0) + count
+        ranked = sorted(counts.items(), key=lambda x: -x[1])[:limit]
+        return [{'frame': frame, 'samples': count} for frame, count in ranked]
+
+def should_profile():
+    """判斷本次請求是否需要剖析：管理員 X-Profile 標頭或按 PROFILE_SAMPLE_RATE 隨機取樣"""
+    if request.headers.get('X-Profile') and is_admin_request():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def store_profile(profile_id, kind, target, sampler):
+    """保存剖析結果"""
+    with profiles_lock:
+        profiles[profile_id] = {
+            'profile_id': profile_id,
+            'kind': kind,
+            'target': target,
+            'started': sampler.started,
+            'duration': sampler.duration,
+            'samples': sampler.samples,
+            'interval': sampler.interval,
+            'sampler': sampler
+        }
+        while len(profiles) > PROFILE_MAX_STORED:
+            profiles.popitem(last=False)
+
+def run_profiled_task(task_id, func, *args):
+    """在剖析器下執行下載任務"""
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    try:
+        func(*args)
+    finally:
+        sampler.stop()
+        store_profile(task_id, 'download', task_id, sampler)
+
+def start_download_task(task_id, url, format_id, video_url, method, user_cookie_file=None, profile=False, clip=None,
+                        api_key=None, max_rate=None):
+    """啟動下載任務；分散式模式下只寫入共用佇列，由 worker 行程執行。
+    之後只使用 API key 的雜湊值（頻寬分組），佇列資料庫中不保存原始 key"""
+    api_key_id = ApiKeyLimiter.key_id(api_key) if api_key else None
+    if not uses_task_queue():
+        return start_download_thread(task_id, url, format_id, video_url, method, user_cookie_file, profile, clip,
+                                     api_key_id, max_rate)
+    with status_lock:
+        record = download_status.pop(task_id, None)
+    status = record.to_dict() if record else {}
+    with webhook_lock:
+        webhook_url = webhook_callbacks.pop(task_id, None)
+    task_queue.enqueue(task_id, {
+        'url': url,
+        'format_id': format_id,
+        'video_url': video_url,
+        'method': method,
+        'user_cookie_file': user_cookie_file,
+        'profile': profile,
+        'clip': list(clip) if clip else None,
+        'api_key_id': api_key_id,
+        'max_rate': max_rate,
+        'webhook_url': webhook_url
+    }, status)
+    return None
+
+def start_download_thread(task_id, url, format_id, video_url, method, user_cookie_file=None, profile=False, clip=None,
+                          api_key_id=None, max_rate=None):
+    """啟動異步下載執行緒；api_key_id 為 ApiKeyLimiter.key_id() 的雜湊值，用於頻寬分組"""
+    args = (task_id, url, format_id, video_url, method, user_cookie_file, clip)
+    with status_lock:
+        task_record(task_id).last_polled = time.time()
+    bandwidth.configure(task_id, api_key_id, max_rate)
+    ensure_task_reaper()
+    if clip:
+        with status_lock:
+            record = task_record(task_id)
+            record['clip'] = {'start': clip[0], 'end': clip[1]}
+            record.touch()
+    if profile:
+        with status_lock:
+            record = task_record(task_id)
+            record['profile_id'] = task_id
+            record.touch()
+        thread = threading.Thread(target=run_profiled_task, args=(task_id, download_video_async) + args)
+    else:
+        thread = threading.Thread(target=download_video_async, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+class PrefetchManager:
+    """推測性預取：提取成功後以低優先級在背景下載預設格式（PREFERRED_DEFAULT_FORMAT），
+    相同 URL、cookie 身分與 API key 的預設格式下載請求直接接手該任務；
+    window 秒內沒有請求接手時取消任務並刪除已下載的檔案，計入浪費的流量"""
+
+    def __init__(self, enabled, window, max_active, rate_limit):
+        self.enabled = enabled
+        self.window = window
+        self.max_active = max_active
+        self.rate_limit = rate_limit or None
+        self._lock = threading.Lock()
+        self._pending = {}  # (url, cookie 檔案, API key) -> {'task_id', 'started'}
+        self._counters = {'started': 0, 'skipped': 0, 'hits': 0, 'expired': 0, 'failed': 0, 'preempted': 0,
+                          'saved_bytes': 0, 'wasted_bytes': 0}
+
+    @staticmethod
+    def _key(url, cookie_file, api_key):
+        return (url, cookie_file or '', api_key or '')
+
+    @staticmethod
+    def _downloaded_bytes(record):
+        """任務各下載階段已傳輸的位元組數（呼叫者需持有 status_lock）"""
+        if record is None:
+            return 0
+        return sum(span['bytes'] or 0 for span in record.get('timeline', []) if span['stage'] == 'download')
+
+    def _has_capacity(self):
+        """只在下載管線有空閒位置、磁碟空間不需排隊時預取，不與真正的請求搶位置"""
+        if admission.retry_after():
+            return False
+        stage = pipeline_stages['download'].stats()
+        return stage['workers'] <= 0 or stage['active'] + stage['queued'] < stage['workers']
+
+    def start(self, url, cookie_file=None, api_key=None, lang=None):
+        """提取成功後呼叫；返回預取任務 ID，未啟動時返回 None"""
+        if not self.enabled or uses_task_queue():
+            return None
+        key = self._key(url, cookie_file, api_key)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]['task_id']
+            if len(self._pending) >= self.max_active or not self._has_capacity():
+                self._counters['skipped'] += 1
+                return None
+            task_id = str(uuid.uuid4())
+            self._pending[key] = {'task_id': task_id, 'started': time.time()}
+            self._counters['started'] += 1
+        update_status(task_id, 'processing', 'status_starting', 0, lang)
+        with status_lock:
+            record = task_record(task_id)
+            record['prefetch'] = 'pending'
+            record.touch()
+        # 在下載執行緒開始前登記低優先級，第一個位元組就按預取的上限與權重整形
+        bandwidth.set_priority(task_id, True, self.rate_limit)
+        start_download_task(task_id, url, PREFERRED_DEFAULT_FORMAT, None, 'yt-dlp', cookie_file, False, None,
+                            api_key, self.rate_limit)
+        timer = threading.Timer(self.window, self._expire, args=(key, task_id))
+        timer.daemon = True
+        timer.start()
+        return task_id
+
+    def attach(self, url, format_id, video_url=None, clip=None, cookie_file=None, api_key=None):
+        """下載請求與預取任務相符時接手該任務並返回任務 ID；不相符或預取已失敗時返回 None"""
+        if not self.enabled or video_url or clip or format_id != PREFERRED_DEFAULT_FORMAT:
+            return None
+        with self._lock:
+            entry = self._pending.pop(self._key(url, cookie_file, api_key), None)
+        if entry is None:
+            return None
+        task_id = entry['task_id']
+        with status_lock:
+            record = download_status.get(task_id)
+            transferred = self._downloaded_bytes(record)
+            usable = (record is not None and record.status not in ('error', 'cancelled')
+                      and not record.cancel_requested)
+            if usable:
+                record.last_polled = time.time()
+                record['prefetch'] = 'attached'
+                record.touch()
+            finished = record is None or record.status in FINAL_STATUSES
+        with self._lock:
+            if usable:
+                self._counters['hits'] += 1
+                self._counters['saved_bytes'] += transferred
+            else:
+                self._counters['failed'] += 1
+                self._counters['wasted_bytes'] += transferred
+        if not usable:
+            return None
+        if not finished:
+            bandwidth.set_priority(task_id, False)
+        return task_id
+
+    def preempt(self):
+        """一般下載需要在下載階段排隊時，取消最早開始、尚未被接手且仍在進行的預取任務以讓出位置；
+        返回被取消的任務 ID，沒有可取消的預取時返回 None"""
+        with self._lock:
+            candidates = sorted(self._pending.items(), key=lambda item: item[1]['started'])
+        for key, entry in candidates:
+            task_id = entry['task_id']
+            with status_lock:
+                record = download_status.get(task_id)
+                if record is None or record.status in FINAL_STATUSES:
+                    continue
+                transferred = self._downloaded_bytes(record)
+            with self._lock:
+                if self._pending.get(key) is not entry:
+                    continue
+                del self._pending[key]
+                self._counters['preempted'] += 1
+                self._counters['wasted_bytes'] += transferred
+            cancel_task(task_id, 'prefetch preempted by a download request')
+            return task_id
+        return None
+
+    def _expire(self, key, task_id):
+        """window 秒內沒有請求接手：取消仍在下載的任務；已完成的刪除檔案與狀態記錄"""
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None or entry['task_id'] != task_id:
+                return
+            del self._pending[key]
+        with status_lock:
+            record = download_status.get(task_id)
+            transferred = self._downloaded_bytes(record)
+            status = record.status if record else None
+            file_id = record.file_id if record else None
+            if status in FINAL_STATUSES:
+                download_status.pop(task_id, None)
+        if status == 'completed' and file_id:
+            transferred = max(transferred, get_file_bytes(file_id))
+            remove_partial_files(file_id)
+        elif status not in FINAL_STATUSES:
+            cancel_task(task_id, f'prefetch not used within {self.window}s')
+        with self._lock:
+            self._counters['failed' if status == 'error' else 'expired'] += 1
+            self._counters['wasted_bytes'] += transferred
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            counters = dict(self._counters)
+            pending = [{'task_id': entry['task_id'], 'age_seconds': round(now - entry['started'], 1)}
+                       for entry in self._pending.values()]
+        resolved = counters['hits'] + counters['expired'] + counters['failed'] + counters['preempted']
+        return {
+            'enabled': self.enabled,
+            'window_seconds': self.window,
+            'max_active': self.max_active,
+            'rate_limit': self.rate_limit,
+            **counters,
+            'hit_rate': round(counters['hits'] / resolved, 3) if resolved else None,
+            'pending': pending
+        }
+
+prefetcher = PrefetchManager(SPECULATIVE_PREFETCH, PREFETCH_WINDOW, PREFETCH_MAX_ACTIVE, PREFETCH_RATE_KBPS * 1024)
+
+def start_queued_task(task_id, payload, status, cancel_reason):
+    """在 worker 上執行從佇列領取的任務"""
+    if cancel_reason:
+        status['cancel_requested'] = True
+        status.setdefault('cancel_reason', cancel_reason)
+    with status_lock:
+        download_status[task_id] = TaskRecord.from_dict(status)
+    if payload.get('webhook_url'):
+        with webhook_lock:
+            webhook_callbacks[task_id] = payload['webhook_url']
+    clip = tuple(payload['clip']) if payload.get('clip') else None
+    return start_download_thread(task_id, payload['url'], payload['format_id'], payload.get('video_url'),
+                                 payload.get('method'), payload.get('user_cookie_file'), payload.get('profile'),
+                                 clip, payload.get('api_key_id'), payload.get('max_rate'))
+
+def sync_worker_tasks(worker_id, running):
+    """把取消要求與查詢時間帶回本行程，並發布有變化的任務狀態；已結束的任務發布最終狀態後移除"""
+    controls = task_queue.heartbeat(worker_id, list(running))
+    with status_lock:
+        for task_id, (cancel_reason, last_polled) in controls.items():
+            entry = download_status.get(task_id)
+            if entry is None:
+                continue
+            if last_polled:
+                entry['last_polled'] = max(entry.get('last_polled', 0), last_polled)
+            if cancel_reason and not entry.get('cancel_requested') and entry.get('status') not in FINAL_STATUSES:
+                entry['cancel_requested'] = True
+                entry.setdefault('cancel_reason', cancel_reason)
+                entry.touch()
+    for task_id, (thread, published) in list(running.items()):
+        finished = not thread.is_alive()
+        with status_lock:
+            record = download_status.get(task_id)
+            status = record.to_dict() if record else {}
+            # 查詢時間由佇列記錄，不因此重新發布
+            status.pop('last_polled', None)
+            snapshot = json.dumps(status, default=str)
+        if snapshot != published or finished:
+            task_queue.publish(task_id, worker_id, snapshot, finished)
+            running[task_id] = (thread, snapshot)
+        if finished:
+            del running[task_id]
+            with status_lock:
+                download_status.pop(task_id, None)
+            with webhook_lock:
+                webhook_callbacks.pop(task_id, None)
+
+def recover_lost_tasks():
+    """重新排隊失聯 worker 的任務；超過嘗試次數的標記為錯誤，並通知 webhook、釋放 key 配額"""
+    lang = get_language()
+    lost_status = {
+        'status': 'error',
+        'message': t('error_worker_lost', lang),
+        'message_key': 'error_worker_lost',
+        'progress': 0,
+        'timestamp': time.time()
+    }
+    for task_id, payload, status in task_queue.recover(WORKER_HEARTBEAT_TIMEOUT, WORKER_MAX_ATTEMPTS, lost_status):
+        if payload.get('webhook_url'):
+            with webhook_lock:
+                webhook_callbacks[task_id] = payload['webhook_url']
+            send_webhook_callback(task_id, status)
+            with webhook_lock:
+                webhook_callbacks.pop(task_id, None)
+        if API_KEY_LIMITS:
+            key_limiter.release_task(task_id, 0)
+
+def run_worker(worker_id=None, concurrency=None, idle_exit=0):
+    """worker 主迴圈：從共用佇列領取任務在本行程執行，定期發布狀態與心跳；idle_exit 秒內沒有任務時返回"""
+    if task_queue is None:
+        raise RuntimeError('TASK_QUEUE is not configured')
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    concurrency = concurrency or WORKER_CONCURRENCY
+    worker_state.update(active=True, worker_id=worker_id)
+    running = {}  # task_id -> (執行緒, 最後發布的狀態 JSON)
+    idle_since = time.time()
+    last_recover = 0
+    try:
+        while True:
+            now = time.time()
+            if now - last_recover >= max(1, WORKER_HEARTBEAT_TIMEOUT / 4):
+                recover_lost_tasks()
+                last_recover = now
+            if running:
+                sync_worker_tasks(worker_id, running)
+            if len(running) < concurrency:
+                for task_id, payload, status, cancel_reason in task_queue.claim(worker_id, concurrency - len(running)):
+                    running[task_id] = (start_queued_task(task_id, payload, status, cancel_reason), None)
+            if running:
+                idle_since = time.time()
+            elif idle_exit and time.time() - idle_since >= idle_exit:
+                return
+            time.sleep(WORKER_SYNC_INTERVAL)
+    finally:
+        worker_state.update(active=False, worker_id=None)
+
+EXPIRED_URL_STATUSES = (403, 410)
+EXPIRED_URL_ERROR = re.compile(r'HTTP Error (403|410)')
+INTERRUPTED_DOWNLOAD_ERROR = re.compile(r'Downloaded \d+ bytes, expected \d+ bytes')
+
+def refresh_direct_url(url, video_url, status, offset, task_id, lang, refreshes):
+    """直連視頻的簽名 URL 過期：重新解析頁面（不探測候選）取得同一視頻的新 URL，在方法事件中記錄第幾次重新解析。
+    已寫入部分內容時只接受檔名相同的候選，以免續傳到另一個視頻；找不到時拋出例外"""
+    refreshes['count'] += 1
+    check_cancelled(task_id)
+    detail = f"direct_download: refresh {refreshes['count']}/{URL_REFRESH_MAX} after HTTP {status}"
+    info = None
+    if url and url != video_url and not is_direct_video_url(url):
+        if 'instagram.com' in url.lower():
+            info = extract_instagram_video(url, probe=False)
+        else:
+            info = extract_video_from_html(url, probe=False)
+    candidates = [video['url'] for video in (info or {}).get('video_urls', []) if is_direct_video_url(video['url'])]
+    name = os.path.basename(urlparse(video_url).path)
+    matches = [candidate for candidate in candidates if os.path.basename(urlparse(candidate).path) == name]
+    if not matches and not offset:
+        matches = candidates
+    if not matches:
+        add_method_event(task_id, 'url_refresh', 'failed', lang, f'{detail}: no matching video URL on the page')
+        raise Exception(f'HTTP {status}: video URL expired and could not be refreshed')
+    add_method_event(task_id, 'url_refresh', 'success', lang, f'{detail}, resuming at {offset} bytes')
+    return matches[0]
+
+def open_direct_stream(url, video_url, offset=0, task_id=None, lang=None, refreshes=None):
+    """以 GET 開啟直連視頻，offset > 0 時以 Range 從該位元組繼續；返回 403/410 時重新解析 URL 再試，
+    每次下載合計最多 URL_REFRESH_MAX 次。返回 (response, video_url)"""
+    headers = dict(PROBE_HEADERS)
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+    while True:
+        response = requests.get(video_url, headers=headers, stream=True, timeout=30)
+        if response.status_code not in EXPIRED_URL_STATUSES or refreshes is None or refreshes['count'] >= URL_REFRESH_MAX:
+            response.raise_for_status()
+            return response, video_url
+        response.close()
+        video_url = refresh_direct_url(url, video_url, response.status_code, offset, task_id, lang, refreshes)
+
+def download_video_direct(url, video_url, file_id, task_id=None, lang=None, clip=None):
+    """直接下載視頻文件"""
+    if lang is None:
+        lang = get_language()
+    if not is_direct_video_url(video_url):
+        return None
+    if clip:
+        return download_clip_direct(video_url, file_id, clip, task_id, lang)
+    try:
+        if task_id:
+            update_status(task_id, 'downloading', 'status_connecting', 10, lang)
+        begin_stage(task_id, 'download', 'direct_download')
+        
+        refreshes = {'count': 0}
+        response, video_url = open_direct_stream(url, video_url, 0, task_id, lang, refreshes)
+        
+        # 獲取文件大小
+        total_size = int(response.headers.get('content-length', 0))
+        
+        # 讀取內容前按 content-length 預留空間；排隊期間連線可能已被伺服器關閉（簽名 URL 也可能已過期），放行後重新請求
+        if admit_download(task_id, file_id, total_size, 'content-length', lang):
+            response.close()
+            response, video_url = open_direct_stream(url, video_url, 0, task_id, lang, refreshes)
+        
+        if task_id:
+            update_status(task_id, 'downloading', 'status_preparing', 20, lang)
+        
+        # 確定文件擴展名
         content_type = response.headers.get('content-type', '')
         ext = 'mp4'
         if 'webm' in content_type:
@@ -657,71 +3362,527 @@ def download_video_direct(url, video_url, file_id, task_id=None, lang=None):
         file_path = os.path.join(DOWNLOAD_DIR, f'{file_id}.{ext}')
         
         downloaded_size = 0
+        reconnects = 0
         with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    
-                    if task_id and total_size > 0:
-                        progress = 20 + int((downloaded_size / total_size) * 70)
-                        msg = f"{t('status_downloading', lang)} ({downloaded_size // 1024 // 1024}MB / {total_size // 1024 // 1024}MB)"
-                        update_status(task_id, 'downloading', msg, progress, lang)
+            while True:
+                try:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        check_cancelled(task_id)
+                        if chunk:
+                            f.write(chunk)
+                            throttle_transfer(task_id, len(chunk))
+                            downloaded_size += len(chunk)
+                            record_stage_bytes(task_id, 'download', downloaded_size)
+                            
+                            if task_id and total_size > 0:
+                                progress = 20 + int((downloaded_size / total_size) * 70)
+                                msg = f"{t('status_downloading', lang)} ({downloaded_size // 1024 // 1024}MB / {total_size // 1024 // 1024}MB)"
+                                update_status(task_id, 'downloading', msg, progress, lang)
+                    break
+                except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+                    # 連線中途中斷：以 Range 從已寫入的位元組重新連線，此時簽名 URL 可能已過期（由 open_direct_stream 重新解析）
+                    if not total_size or downloaded_size >= total_size or reconnects >= URL_REFRESH_MAX:
+                        raise
+                    reconnects += 1
+                    response.close()
+                    response, video_url = open_direct_stream(url, video_url, downloaded_size, task_id, lang, refreshes)
+                    if response.status_code != 206:
+                        # 來源不支援 Range，從頭重新下載
+                        f.seek(0)
+                        f.truncate()
+                        downloaded_size = 0
         
+        end_stage(task_id, 'download', 'success', transferred_bytes=downloaded_size)
         if task_id:
             update_status(task_id, 'downloading', 'status_finalizing', 95, lang)
         
         return file_path if os.path.exists(file_path) else None
         
+    except (TaskCancelled, AdmissionRejected):
+        raise
     except Exception as e:
+        end_stage(task_id, 'download', 'failed')
         if task_id:
             update_status(task_id, 'error', f"{t('error_download_failed', lang)}: {str(e)}", 0, lang)
         return None
 
-def download_video_with_pytube(url, file_id):
+def probe_media_duration(video_url):
+    """以 ffmpeg 讀取媒體標頭取得時長（秒），無法取得時返回 None"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-user_agent', PROBE_HEADERS['User-Agent'], '-i', video_url],
+                                capture_output=True, text=True, timeout=CANDIDATE_PROBE_TIMEOUT * 3)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds) or None
+
+def estimate_clip_bytes(content_length, duration, clip):
+    """按片段佔全片時長的比例估計片段大小；時長未知時按整個檔案估計"""
+    if not content_length or not duration:
+        return content_length
+    start, end = clip
+    clip_seconds = min(end if end is not None else duration, duration) - min(start, duration)
+    return int(content_length * max(clip_seconds, 0) / duration)
+
+def download_clip_direct(video_url, file_id, clip, task_id=None, lang=None):
+    """以 ffmpeg 截取片段：mp4 / webm / mkv 等可定位的容器只會以 HTTP Range 讀取片段所需的資料"""
+    if lang is None:
+        lang = get_language()
+    start, end = clip
+    clip_seconds = end - start if end is not None else None
+    ext = os.path.splitext(urlparse(video_url).path)[1].lower() or '.mp4'
+    file_path = os.path.join(DOWNLOAD_DIR, f'{file_id}{ext}')
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1',
+        '-user_agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        '-ss', str(start)
+    ]
+    if end is not None:
+        cmd.extend(['-to', str(end)])
+    cmd.extend(['-i', video_url, '-c', 'copy', '-y', file_path])
+
+    if task_id:
+        update_status(task_id, 'downloading', 'status_connecting', 10, lang)
+    begin_stage(task_id, 'download', 'direct_download')
+    try:
+        # 啟動 ffmpeg 前按 content-length × 片段時長 / 全片時長預留空間
+        content_length = probe_video_candidate(video_url)['content_length']
+        duration = probe_media_duration(video_url) if content_length else None
+        admit_download(task_id, file_id, estimate_clip_bytes(content_length, duration, clip), 'content-length', lang)
+        # ffmpeg 無法共用令牌桶：把任務目前分得的速率按平均碼率換算為 -readrate（即時播放速度的倍數）固定限速
+        rate = bandwidth.current_rate(task_id)
+        if rate and content_length and duration and ffmpeg_supports_readrate():
+            input_index = cmd.index('-i')
+            cmd[input_index:input_index] = ['-readrate', f'{rate * duration / content_length:.3f}']
+        # stderr 併入 stdout（分開的管道可能因 stderr 寫滿而互相阻塞），只保留最後幾行非進度輸出作為錯誤訊息
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        last_progress = [time.time()]
+        stop_reason = []
+        finished = threading.Event()
+
+        def watchdog():
+            # 連線停滯時 ffmpeg 的進度不再前進，由監視執行緒檢查取消與停滯，不依賴進度輸出
+            while not finished.wait(1):
+                if is_task_cancelled(task_id):
+                    stop_reason.append('cancelled')
+                elif time.time() - last_progress[0] > CLI_STALL_TIMEOUT:
+                    stop_reason.append(f'no progress for {CLI_STALL_TIMEOUT}s')
+                if stop_reason:
+                    process.kill()
+                    return
+
+        threading.Thread(target=watchdog, daemon=True).start()
+        written = 0
+        tail = deque(maxlen=20)
+        try:
+            for line in process.stdout:
+                key, sep, value = line.strip().partition('=')
+                if not sep or ' ' in key:
+                    # -progress 的輸出都是 key=value，其餘為 ffmpeg 的錯誤訊息
+                    if line.strip():
+                        tail.append(line.strip())
+                elif key == 'total_size' and value.isdigit():
+                    if int(value) != written:
+                        last_progress[0] = time.time()
+                        bandwidth.consume(task_id, max(int(value) - written, 0))
+                    written = int(value)
+                    record_stage_bytes(task_id, 'download', written)
+                elif key == 'out_time_us' and value.isdigit() and clip_seconds and task_id:
+                    # 按已輸出的片段時長計算進度，並據此推算片段大小
+                    fraction = min(int(value) / 1000000 / clip_seconds, 1)
+                    if fraction > 0:
+                        progress = 20 + int(fraction * 70)
+                        msg = f"{t('status_downloading', lang)} ({written // 1024 // 1024}MB / {int(written / fraction) // 1024 // 1024}MB estimated)"
+                        update_status(task_id, 'downloading', msg, progress, lang)
+            process.wait()
+        finally:
+            finished.set()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        if stop_reason == ['cancelled']:
+            raise TaskCancelled(task_id)
+        if stop_reason:
+            raise Exception(f'ffmpeg killed: {stop_reason[0]}')
+        if process.returncode != 0 or not os.path.exists(file_path):
+            raise Exception(' | '.join(tail) or f'ffmpeg exited with {process.returncode}')
+        end_stage(task_id, 'download', 'success', transferred_bytes=os.path.getsize(file_path))
+        if task_id:
+            update_status(task_id, 'downloading', 'status_finalizing', 95, lang)
+        return file_path
+    except (TaskCancelled, AdmissionRejected):
+        raise
+    except Exception as e:
+        end_stage(task_id, 'download', 'failed')
+        # 中途終止的片段檔案不完整，刪除以免之後的方法或 /api/file 誤用
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        if task_id:
+            update_status(task_id, 'error', f"{t('error_download_failed', lang)}: {str(e)}", 0, lang)
+        return None
+
+def download_video_with_pytube(url, file_id, task_id=None):
     """使用 PyTube 下載 YouTube 視頻"""
     try:
-        yt = YouTube(url)
+        begin_stage(task_id, 'extract', 'pytube')
+        # 每個區塊按任務分得的速率等待（同時檢查取消）
+        yt = YouTube(url, on_progress_callback=lambda stream, chunk, remaining: throttle_transfer(task_id, len(chunk)))
         stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
         if not stream:
             stream = yt.streams.filter(file_extension='mp4').order_by('resolution').desc().first()
+        end_stage(task_id, 'extract', 'success' if stream else 'failed')
         if not stream:
             return None
         filename = f'{file_id}.mp4'
+        begin_stage(task_id, 'download', 'pytube')
         stream.download(output_path=DOWNLOAD_DIR, filename=filename)
         file_path = os.path.join(DOWNLOAD_DIR, filename)
-        return file_path if os.path.exists(file_path) else None
+        if os.path.exists(file_path):
+            end_stage(task_id, 'download', 'success', transferred_bytes=os.path.getsize(file_path))
+            return file_path
+        end_stage(task_id, 'download', 'failed')
+        return None
+    except TaskCancelled:
+        raise
     except Exception:
+        end_stage(task_id, 'extract', 'failed')
+        end_stage(task_id, 'download', 'failed')
         return None
 
-def run_yt_dlp_subprocess(target_url, format_id, file_id, cookie_file=None):
-    """使用子程序呼叫 yt-dlp，作為備援方案"""
+def report_cli_progress(task_id, line, streams, lang):
+    """解析命令列備援輸出的進度行，合併各串流進度後更新任務狀態"""
+    fields = line[len(CLI_PROGRESS_PREFIX):].split()
+    if len(fields) != 7:
+        return
+    values = [None if value == 'NA' else value for value in fields[1:]]
+    try:
+        downloaded, total, estimate, elapsed, fragment_index, fragment_count = [
+            float(value) if value is not None else None for value in values
+        ]
+    except ValueError:
+        return
+    bandwidth.consume(task_id, max(int(downloaded or 0) - streams.get(fields[0], (0, 0))[0], 0))
+    streams[fields[0]] = (int(downloaded or 0), int(total or estimate or 0))
+    downloaded_bytes = sum(done for done, _ in streams.values())
+    total_bytes = sum(size for _, size in streams.values())
+    record_stage_bytes(task_id, 'download', downloaded_bytes)
+    if fragment_index is not None:
+        record_fragment_progress(task_id, {
+            'fragment_index': int(fragment_index),
+            'fragment_count': int(fragment_count) if fragment_count else None,
+            'downloaded_bytes': int(downloaded or 0),
+            'elapsed': elapsed,
+            'info_dict': {'format_id': fields[0]}
+        })
+    if task_id and total_bytes:
+        progress = 30 + int(min(downloaded_bytes / total_bytes, 1) * 60)
+        estimated = ' estimated' if total is None or any(not size for _, size in streams.values()) else ''
+        msg = f"{t('status_downloading', lang)} ({downloaded_bytes // 1024 // 1024}MB / {total_bytes // 1024 // 1024}MB{estimated})"
+        update_status(task_id, 'downloading', msg, progress, lang)
+
+def run_yt_dlp_subprocess(target_url, format_id, file_id, cookie_file=None, task_id=None, clip=None, lang=None):
+    """使用子程序呼叫 yt-dlp，作為備援方案：逐行讀取進度，任務取消或停滯超過 CLI_STALL_TIMEOUT 時終止子程序"""
+    if lang is None:
+        lang = get_language()
     output_pattern = os.path.join(DOWNLOAD_DIR, f'{file_id}.%(ext)s')
+    progress_template = ' '.join([
+        CLI_PROGRESS_PREFIX, '%(info.format_id)s', '%(progress.downloaded_bytes)s', '%(progress.total_bytes)s',
+        '%(progress.total_bytes_estimate)s', '%(progress.elapsed)s', '%(progress.fragment_index)s',
+        '%(progress.fragment_count)s'
+    ])
     cmd = [
         'yt-dlp',
         '--format', format_id,
         '--no-playlist',
         '--quiet',
         '--no-warnings',
+        '--progress',
+        '--newline',
+        '--progress-template', f'download:{progress_template}',
+        '--print', f'after_move:{CLI_FILE_PREFIX} %(filepath)s',
         '--merge-output-format', MERGE_OUTPUT_FORMAT,
+        '--cache-dir', YTDLP_CACHE_DIR,
         '--output', output_pattern,
         target_url
     ]
     if cookie_file:
         cmd.extend(['--cookies', cookie_file])
+    if clip:
+        start, end = clip
+        cmd[1:1] = ['--download-sections', f"*{start}-{end if end is not None else 'inf'}"]
 
+    begin_stage(task_id, 'download', 'yt_dlp_cli')
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-        if result.returncode != 0:
-            print(f"yt-dlp subprocess failed: {result.stderr.strip()}")
-            return None
-        for filename in os.listdir(DOWNLOAD_DIR):
-            if filename.startswith(file_id):
-                return os.path.join(DOWNLOAD_DIR, filename)
+        with reserve_fragment_slots(task_id) as fragment_concurrency:
+            cmd[1:1] = ['--concurrent-fragments', str(fragment_concurrency)]
+            # 子程序無法共用令牌桶，按目前分得的速率固定限速
+            rate = bandwidth.current_rate(task_id)
+            if rate:
+                cmd[1:1] = ['--limit-rate', str(rate)]
+            # stderr 併入 stdout，只保留最後幾行非進度輸出作為錯誤訊息
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+            last_output = [time.time()]
+            stop_reason = []
+            finished = threading.Event()
+
+            def watchdog():
+                while not finished.wait(1):
+                    if is_task_cancelled(task_id):
+                        stop_reason.append('cancelled')
+                    elif time.time() - last_output[0] > CLI_STALL_TIMEOUT:
+                        stop_reason.append(f'no output for {CLI_STALL_TIMEOUT}s')
+                    if stop_reason:
+                        process.kill()
+                        return
+
+            threading.Thread(target=watchdog, daemon=True).start()
+            output_file = None
+            streams = {}
+            tail = deque(maxlen=20)
+            try:
+                for line in process.stdout:
+                    last_output[0] = time.time()
+                    line = line.rstrip('\n')
+                    if line.startswith(CLI_PROGRESS_PREFIX):
+                        report_cli_progress(task_id, line, streams, lang)
+                    elif line.startswith(CLI_FILE_PREFIX):
+                        output_file = line[len(CLI_FILE_PREFIX):].strip()
+                    elif line.strip():
+                        tail.append(line)
+                process.wait()
+            finally:
+                finished.set()
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+        if stop_reason == ['cancelled']:
+            raise TaskCancelled(task_id)
+        if stop_reason:
+            print(f"yt-dlp subprocess killed: {stop_reason[0]}")
+        elif process.returncode != 0:
+            print(f"yt-dlp subprocess failed: {' | '.join(tail)}")
+        elif output_file and os.path.exists(output_file):
+            end_stage(task_id, 'download', 'success', transferred_bytes=os.path.getsize(output_file))
+            return output_file
+    except TaskCancelled:
+        raise
     except Exception as e:
         print(f"yt-dlp subprocess error: {e}")
+    end_stage(task_id, 'download', 'failed')
+    return None
+
+def download_with_url_refresh(ydl, url, info, task_id, file_id, lang):
+    """下載已提取並選好格式的 info；連線中途中斷時以同一 URL 續傳，簽名 URL 過期（HTTP 403/410）時
+    固定為已選定的格式重新提取，只為了取得該格式的新 URL。yt-dlp 從已寫入的 .part 檔案續傳，已下載完的串流不會重新下載"""
+    format_spec, format_selector = ydl.params.get('format'), ydl.format_selector
+    refreshes = reconnects = 0
+    try:
+        while True:
+            try:
+                return ydl.process_ie_result(info, download=True)
+            except yt_dlp.utils.DownloadError as e:
+                expired = EXPIRED_URL_ERROR.search(str(e))
+                if not expired and INTERRUPTED_DOWNLOAD_ERROR.search(str(e)) and reconnects < URL_REFRESH_MAX:
+                    # 重新連線時簽名 URL 可能已過期，下一次會得到 403/410
+                    reconnects += 1
+                    continue
+                if not expired or refreshes >= URL_REFRESH_MAX:
+                    raise
+            refreshes += 1
+            check_cancelled(task_id)
+            detail = f'yt_dlp: refresh {refreshes}/{URL_REFRESH_MAX} after HTTP {expired.group(1)}'
+            if info.get('format_id'):
+                # yt-dlp 在建立實例時編譯格式選擇器，固定格式需同時替換
+                ydl.params['format'] = info['format_id']
+                ydl.format_selector = ydl.build_format_selector(info['format_id'])
+            try:
+                info = extract_with_route(ydl, url)
+            except Exception as e:
+                add_method_event(task_id, 'url_refresh', 'failed', lang, f'{detail}: {e}')
+                raise
+            add_method_event(task_id, 'url_refresh', 'success', lang,
+                             f'{detail}, resuming at {get_file_bytes(file_id)} bytes')
+    finally:
+        ydl.params['format'], ydl.format_selector = format_spec, format_selector
+
+def download_clip_with_ydl(ydl, url, clip, task_id, file_id, lang):
+    """下載片段：先提取並選好格式，按片段比例估計大小，再交給 yt-dlp（download_ranges）下載。
+    yt-dlp 以 ffmpeg 下載片段時不回報進度，改為定期讀取輸出檔大小"""
+    info = extract_with_route(ydl, url)
+    end_stage(task_id, 'extract', 'success', 'yt_dlp')
+    full_bytes = estimate_download_bytes(info)
+    fraction = clip_fraction(clip, info.get('duration'))
+    expected = int(full_bytes * fraction) if full_bytes and fraction is not None else None
+    with status_lock:
+        entry = download_status.get(task_id)
+        if entry is not None:
+            entry.setdefault('clip', {}).update({'full_bytes': full_bytes, 'estimated_bytes': expected})
+            entry.touch()
+    admit_download(task_id, file_id, expected, 'format', lang)
+
+    finished = threading.Event()
+    report_lock = threading.Lock()
+
+    def on_finished(d):
+        if d['status'] == 'finished':
+            with report_lock:
+                finished.set()
+
+    def watch_output():
+        while not finished.wait(1):
+            size = 0
+            for filename in os.listdir(DOWNLOAD_DIR):
+                if filename.startswith(file_id):
+                    try:
+                        size += os.path.getsize(os.path.join(DOWNLOAD_DIR, filename))
+                    except OSError:
+                        pass
+            with report_lock:
+                if finished.is_set() or not size:
+                    continue
+                record_stage_bytes(task_id, 'download', size)
+                if expected:
+                    progress = 20 + int(min(size / expected, 0.99) * 70)
+                    msg = f"{t('status_downloading', lang)} ({size // 1024 // 1024}MB / {expected // 1024 // 1024}MB estimated)"
+                else:
+                    progress = 20
+                    msg = f"{t('status_downloading', lang)} ({size // 1024 // 1024}MB)"
+                update_status(task_id, 'downloading', msg, progress, lang)
+
+    # 放在任務 hook 之前，確保下載結束後不再回報檔案大小
+    ydl._progress_hooks.insert(0, on_finished)
+    begin_stage(task_id, 'download', 'yt_dlp')
+    watcher = threading.Thread(target=watch_output, daemon=True)
+    watcher.start()
+    try:
+        return ydl.process_ie_result(info, download=True)
+    finally:
+        finished.set()
+        watcher.join()
+        ydl._progress_hooks.remove(on_finished)
+
+# 提取請求在請求執行緒內剖析
+PROFILED_ENDPOINTS = {'extract', 'api_extract'}
+
+@app.before_request
+def start_request_profiler():
+    """需要剖析的提取請求開始取樣"""
+    if request.endpoint in PROFILED_ENDPOINTS and should_profile():
+        g.profiler = StackSampler(threading.get_ident())
+        g.profile_id = str(uuid.uuid4())
+        g.profiler.start()
+
+@app.after_request
+def stop_request_profiler(response):
+    """結束取樣並在回應標頭中返回 profile ID"""
+    sampler = g.pop('profiler', None)
+    if sampler:
+        sampler.stop()
+        store_profile(g.profile_id, 'extract', request.path, sampler)
+        response.headers['X-Profile-Id'] = g.profile_id
+    return response
+
+@app.teardown_request
+def cleanup_request_profiler(exc):
+    """請求異常結束時確保取樣執行緒停止"""
+    sampler = g.pop('profiler', None)
+    if sampler:
+        sampler.stop()
+
+def extract_api_data(url, cookie_file=None):
+    """/api/v1/extract 的提取流程：先用 yt-dlp，失敗時依序嘗試 Instagram 與 HTML 解析；
+    全部失敗時記入負面快取並返回 None。cookie_file 為請求開始時查詢負面快取所用的檔案，未提供時按目前請求解析"""
+    if cookie_file is None:
+        cookie_file = get_cookie_file(get_session_cookie_path())
+    # 首先嘗試使用 yt-dlp
+    info = extract_video_info(url)
+    if info is not None:
+        clear_url_failure(url, cookie_file)
+        formats = get_video_formats(url)
+        return {
+            'title': info['title'],
+            'duration': info['duration'],
+            'thumbnail': info.get('thumbnail', ''),
+            'description': info.get('description', ''),
+            'uploader': info.get('uploader', ''),
+            'view_count': info.get('view_count', 0),
+            'upload_date': info.get('upload_date', ''),
+            'webpage_url': info.get('webpage_url', url),
+            'formats': formats[:10],
+            'method': 'yt-dlp'
+        }
+    
+    # yt-dlp 失敗，檢查是否為 Instagram URL
+    if 'instagram.com' in url.lower():
+        instagram_info = extract_instagram_video(url)
+        if instagram_info and instagram_info['video_urls']:
+            record_route_fallback(url, 'instagram_parse')
+            clear_url_failure(url, cookie_file)
+            formats = candidate_formats('instagram', instagram_info['video_urls'])
+            return {
+                'title': instagram_info['title'],
+                'duration': instagram_info['duration'],
+                'thumbnail': '',
+                'description': '',
+                'uploader': '',
+                'view_count': 0,
+                'upload_date': '',
+                'webpage_url': url,
+                'formats': formats,
+                'method': 'instagram_parse',
+                'video_urls': instagram_info['video_urls']
+            }
+    
+    # 使用備用方案：HTML解析
+    html_info = extract_video_from_html(url)
+    if html_info and html_info['video_urls']:
+        record_route_fallback(url, 'html_parse')
+        clear_url_failure(url, cookie_file)
+        formats = candidate_formats('html', html_info['video_urls'])
+        return {
+            'title': html_info['title'],
+            'duration': html_info['duration'],
+            'thumbnail': '',
+            'description': '',
+            'uploader': '',
+            'view_count': 0,
+            'upload_date': '',
+            'webpage_url': url,
+            'formats': formats,
+            'method': 'html_parse',
+            'video_urls': html_info['video_urls']
+        }
+    record_url_failure(url, cookie_file, 'error_extract_failed')
     return None
 
+def get_extract_executor():
+    """批次提取共用的執行緒池，第一次使用時建立；所有批次請求合計最多 EXTRACT_BATCH_WORKERS 個同時提取"""
+    with extract_executor_lock:
+        if extract_executor['pool'] is None:
+            extract_executor['pool'] = ThreadPoolExecutor(max_workers=EXTRACT_BATCH_WORKERS,
+                                                          thread_name_prefix='extract-batch')
+        return extract_executor['pool']
+
+def extract_batch_item(index, url, cookie_file):
+    """批次提取中的單個 URL，返回一行 NDJSON 的內容"""
+    start = time.perf_counter()
+    try:
+        data = extract_api_data(url, cookie_file)
+        error = None if data is not None else 'Unable to extract video information'
+    except Exception as e:
+        data = None
+        error = f'Extraction failed: {str(e)}'
+    result = {'index': index, 'url': url, 'success': data is not None,
+              'seconds': round(time.perf_counter() - start, 3)}
+    if data is not None:
+        result['data'] = data
+    else:
+        result['error'] = error
+    return result
+
 @app.route('/')
 def index():
     """主页面"""
@@ -788,104 +3949,44 @@ def extract():
     if not is_valid_url(url):
         return jsonify({'error': t('error_invalid_url', lang)}), 400
     
+    # 最近所有方法都失敗的 URL 直接返回相同原因；帶 force 時重新嘗試
+    force = str(data.get('force', '')).lower() in ('1', 'true', 'yes')
+    cookie_file = get_cookie_file(get_session_cookie_path())
+    failure = get_url_failure(url, cookie_file, force)
+    if failure:
+        return jsonify({
+            'error': f"{url_failure_message(failure, lang)} ({t('error_recent_failure', lang)})",
+            'cached_failure': True,
+            'retry_after': failure['retry_after']
+        }), 400
+    
     try:
-        # 首先嘗試使用 yt-dlp
-        info = extract_video_info(url)
-        if info is not None:
-            formats = get_video_formats(url)
-            return jsonify({
-                'success': True,
-                'title': info['title'],
-                'duration': info['duration'],
-                'thumbnail': info.get('thumbnail', ''),
-                'description': info.get('description', ''),
-                'uploader': info.get('uploader', ''),
-                'view_count': info.get('view_count', 0),
-                'upload_date': info.get('upload_date', ''),
-                'webpage_url': info.get('webpage_url', url),
-                'formats': formats[:10],  # 限制返回前10个格式
-                'method': 'yt-dlp'
-            })
-        
-        # yt-dlp 失敗，檢查是否為 Instagram URL
-        if 'instagram.com' in url.lower():
-            instagram_info = extract_instagram_video(url)
-            if instagram_info and instagram_info['video_urls']:
-                formats = []
-                for idx, video in enumerate(instagram_info['video_urls']):
-                    formats.append({
-                        'format_id': f'instagram_{idx}',
-                        'ext': video['type'].split('/')[-1] if '/' in video['type'] else 'mp4',
-                        'resolution': video.get('quality', 'unknown'),
-                        'filesize': 0,
-                        'quality': 0,
-                        'video_url': video['url']
-                    })
-                
-                return jsonify({
-                    'success': True,
-                    'title': instagram_info['title'],
-                    'duration': instagram_info['duration'],
-                    'thumbnail': '',
-                    'description': '',
-                    'uploader': '',
-                    'view_count': 0,
-                    'upload_date': '',
-                    'webpage_url': url,
-                    'formats': formats,
-                    'method': 'instagram_parse',
-                    'video_urls': instagram_info['video_urls']
-                })
-        
-        # 使用備用方案：HTML解析
-        html_info = extract_video_from_html(url)
-        if html_info and html_info['video_urls']:
-            # 轉換格式以匹配前端期望
-            formats = []
-            for idx, video in enumerate(html_info['video_urls']):
-                formats.append({
-                    'format_id': f'html_{idx}',
-                    'ext': video['type'].split('/')[-1] if '/' in video['type'] else 'mp4',
-                    'resolution': video.get('quality', 'unknown'),
-                    'filesize': 0,
-                    'quality': 0,
-                    'video_url': video['url']  # 保存實際視頻URL
-                })
-            
-            return jsonify({
-                'success': True,
-                'title': html_info['title'],
-                'duration': html_info['duration'],
-                'thumbnail': '',
-                'description': '',
-                'uploader': '',
-                'view_count': 0,
-                'upload_date': '',
-                'webpage_url': url,
-                'formats': formats,
-                'method': 'html_parse',
-                'video_urls': html_info['video_urls']
-            })
+        data = extract_api_data(url, cookie_file)
+        if data is not None:
+            if data['method'] == 'yt-dlp' and prefetcher.start(url, get_session_cookie_path(), lang=lang):
+                data['prefetch'] = {'format_id': 'best', 'window_seconds': PREFETCH_WINDOW}
+            return jsonify({'success': True, **data})
         
         return jsonify({'error': t('error_extract_failed', lang)}), 400
         
     except Exception as e:
         return jsonify({'error': f"{t('extract_failed', lang)}: {str(e)}"}), 500
 
-def download_video_async(task_id, url, format_id, video_url, method, user_cookie_file=None):
+def download_video_async(task_id, url, format_id, video_url, method, user_cookie_file=None, clip=None):
     """異步下載視頻"""
     file_id = str(uuid.uuid4())
     lang = get_language()
     format_id = normalize_format_id(format_id)
     cookie_file = get_cookie_file(user_cookie_file)
     try:
+        enter_pipeline_stage(task_id, 'download', lang)
         update_status(task_id, 'processing', 'status_obtaining', 5, lang)
         
         # 如果提供了直接的視頻URL（來自HTML解析），使用直接下載
         if video_url:
             update_status(task_id, 'processing', 'status_preparing', 10, lang)
             add_method_event(task_id, 'direct_download', 'trying', lang)
-            downloaded_file = download_video_direct(url, video_url, file_id, task_id, lang)
+            downloaded_file = download_video_direct(url, video_url, file_id, task_id, lang, clip)
             if downloaded_file:
                 download_url = f'/api/file/{file_id}'
                 filename = os.path.basename(downloaded_file)
@@ -904,18 +4005,48 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
             output_path = os.path.join(DOWNLOAD_DIR, f'{file_id}.%(ext)s')
             
             downloaded_file = None
+            # 各串流的 [已下載, 總大小, 是否完成]；合併格式的影像與音訊同時下載，進度合併計算
+            stream_progress = {}
+            stream_lock = threading.Lock()
             
             def progress_hook(d):
                 nonlocal downloaded_file
+                check_cancelled(task_id)
+                if d['status'] not in ('downloading', 'finished'):
+                    return
+                stream = (d.get('info_dict') or {}).get('format_id') or ''
+                with stream_lock:
+                    was_active = any(not done for _, _, done in stream_progress.values())
+                    previous_bytes = stream_progress.get(stream, [0])[0]
+                    if d['status'] == 'downloading':
+                        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                        stream_progress[stream] = [d.get('downloaded_bytes') or 0, total, False]
+                    else:
+                        size = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+                        stream_progress[stream] = [size, size, True]
+                    is_active = any(not done for _, _, done in stream_progress.values())
+                    downloaded_bytes = sum(p[0] for p in stream_progress.values())
+                    total_bytes = sum(p[1] for p in stream_progress.values())
+                    estimated = any(not p[1] for p in stream_progress.values()) or 'total_bytes' not in d
+                    # 第一次收到進度代表提取結束；同時下載的串流共用一個下載階段
+                    if is_active and not was_active:
+                        end_stage(task_id, 'extract', 'success', 'yt_dlp')
+                        begin_stage(task_id, 'download', 'yt_dlp')
+                    if is_active:
+                        record_stage_bytes(task_id, 'download', downloaded_bytes)
+                    else:
+                        end_stage(task_id, 'download', 'success', 'yt_dlp', downloaded_bytes)
+                
                 if d['status'] == 'downloading':
+                    # 分片 / 串流下載執行緒在此按分配速率等待；yt-dlp 的 ratelimit 跟隨分配速率，在每個連線內平滑限速
+                    throttle_transfer(task_id, max((d.get('downloaded_bytes') or 0) - previous_bytes, 0))
+                    if bandwidth.enabled:
+                        ydl.params['ratelimit'] = connection_rate_limit(task_id, d.get('fragment_index') is not None)
+                    record_fragment_progress(task_id, d)
                     # 更新下載進度
-                    if 'downloaded_bytes' in d and 'total_bytes' in d:
-                        progress = 15 + int((d['downloaded_bytes'] / d['total_bytes']) * 75)
-                        msg = f"{t('status_downloading', lang)} ({d['downloaded_bytes'] // 1024 // 1024}MB / {d['total_bytes'] // 1024 // 1024}MB)"
-                        update_status(task_id, 'downloading', msg, progress, lang)
-                    elif 'downloaded_bytes' in d and 'total_bytes_estimate' in d:
-                        progress = 15 + int((d['downloaded_bytes'] / d['total_bytes_estimate']) * 75)
-                        msg = f"{t('status_downloading', lang)} ({d['downloaded_bytes'] // 1024 // 1024}MB / {d['total_bytes_estimate'] // 1024 // 1024}MB estimated)"
+                    if total_bytes:
+                        progress = 15 + int(min(downloaded_bytes / total_bytes, 1) * 75)
+                        msg = f"{t('status_downloading', lang)} ({downloaded_bytes // 1024 // 1024}MB / {total_bytes // 1024 // 1024}MB{' estimated' if estimated else ''})"
                         update_status(task_id, 'downloading', msg, progress, lang)
                     elif '_percent_str' in d:
                         percent_str = d['_percent_str'].replace('%', '').strip()
@@ -926,9 +4057,19 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                             update_status(task_id, 'downloading', msg, progress, lang)
                         except:
                             update_status(task_id, 'downloading', 'status_downloading', 50, lang)
-                elif d['status'] == 'finished':
+                else:
                     downloaded_file = d.get('filename')
-                    update_status(task_id, 'downloading', 'status_finalizing', 95, lang)
+                    if not is_active:
+                        update_status(task_id, 'downloading', 'status_finalizing', 95, lang)
+            
+            def postprocessor_hook(d):
+                # 合併 / 轉檔等後處理的耗時；後處理佔用 CPU，讓出下載位置並排隊等待後處理位置
+                check_cancelled(task_id)
+                if d['status'] == 'started':
+                    enter_pipeline_stage(task_id, 'postprocess', lang)
+                    begin_stage(task_id, 'postprocess', d.get('postprocessor'))
+                elif d['status'] == 'finished':
+                    end_stage(task_id, 'postprocess', 'success', d.get('postprocessor'))
             
             ydl_opts = {
                 'format': format_id,
@@ -937,7 +4078,9 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                 'no_warnings': True,
                 'noplaylist': True,
                 'merge_output_format': MERGE_OUTPUT_FORMAT,
+                'cachedir': YTDLP_CACHE_DIR,
                 'progress_hooks': [progress_hook],
+                'postprocessor_hooks': [postprocessor_hook],
                 'postprocessors': [{
                     'key': 'FFmpegVideoConvertor',
                     'preferedformat': MERGE_OUTPUT_FORMAT
@@ -945,10 +4088,23 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
             }
             if cookie_file:
                 ydl_opts['cookiefile'] = cookie_file
+            if clip:
+                ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(
+                    None, [(clip[0], clip[1] if clip[1] is not None else float('inf'))])
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with reserve_fragment_slots(task_id) as fragment_concurrency, \
+                    pooled_ydl(dict(ydl_opts, concurrent_fragment_downloads=fragment_concurrency)) as ydl, \
+                    concurrent_stream_downloads(ydl):
                 update_status(task_id, 'processing', 'status_extracting', 20, lang)
-                info = ydl.extract_info(url, download=True)
+                begin_stage(task_id, 'extract', 'yt_dlp')
+                if clip:
+                    info = download_clip_with_ydl(ydl, url, clip, task_id, file_id, lang)
+                else:
+                    # 先提取再下載，以便按所選格式的大小預留磁碟空間
+                    info = extract_with_route(ydl, url)
+                    end_stage(task_id, 'extract', 'success', 'yt_dlp')
+                    admit_download(task_id, file_id, reserved_download_bytes(info), 'format', lang)
+                    info = download_with_url_refresh(ydl, url, info, task_id, file_id, lang)
                 
                 # 如果progress_hook沒有捕獲，嘗試從info獲取
                 if not downloaded_file:
@@ -971,13 +4127,19 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                     # yt-dlp 失敗，嘗試備用方案
                     raise Exception('yt-dlp download failed')
                     
+        except (TaskCancelled, AdmissionRejected):
+            raise
         except Exception as e:
+            end_stage(task_id, 'extract', 'failed', 'yt_dlp')
+            end_stage(task_id, 'download', 'failed', 'yt_dlp')
+            end_stage(task_id, 'postprocess', 'failed')
             add_method_event(task_id, 'yt_dlp', 'failed', lang, str(e))
-            # yt-dlp 失敗，使用備用方案
+            # yt-dlp 失敗，使用備用方案（備用方案以下載為主，回到下載階段）
+            enter_pipeline_stage(task_id, 'download', lang)
             update_status(task_id, 'processing', 'status_alternative', 30, lang)
             try:
                 add_method_event(task_id, 'yt_dlp_cli', 'trying', lang)
-                subprocess_file = run_yt_dlp_subprocess(url, format_id, file_id, cookie_file)
+                subprocess_file = run_yt_dlp_subprocess(url, format_id, file_id, cookie_file, task_id, clip, lang)
                 if subprocess_file:
                     download_url = f'/api/file/{file_id}'
                     filename = os.path.basename(subprocess_file)
@@ -987,11 +4149,11 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                 else:
                     add_method_event(task_id, 'yt_dlp_cli', 'failed', lang)
 
-                # 如果是 YouTube，嘗試使用 PyTube
-                if 'youtube.com' in url.lower() or 'youtu.be' in url.lower():
+                # 如果是 YouTube，嘗試使用 PyTube（不支援片段下載）
+                if not clip and ('youtube.com' in url.lower() or 'youtu.be' in url.lower()):
                     update_status(task_id, 'processing', 'status_pytube', 35, lang)
                     add_method_event(task_id, 'pytube', 'trying', lang)
-                    pytube_file = download_video_with_pytube(url, file_id)
+                    pytube_file = download_video_with_pytube(url, file_id, task_id)
                     if pytube_file:
                         download_url = f'/api/file/{file_id}'
                         filename = os.path.basename(pytube_file)
@@ -1007,8 +4169,9 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                     add_method_event(task_id, 'instagram', 'trying', lang)
                     instagram_info = extract_instagram_video(url)
                     if instagram_info and instagram_info['video_urls']:
+                        # 候選已按探測結果排序，第一個為最佳
                         video_url_to_download = instagram_info['video_urls'][0]['url']
-                        downloaded_file = download_video_direct(url, video_url_to_download, file_id, task_id, lang)
+                        downloaded_file = download_video_direct(url, video_url_to_download, file_id, task_id, lang, clip)
                         if downloaded_file:
                             download_url = f'/api/file/{file_id}'
                             filename = os.path.basename(downloaded_file)
@@ -1023,14 +4186,14 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                 html_info = extract_video_from_html(url)
                 if html_info and html_info['video_urls']:
                     add_method_event(task_id, 'html_parse', 'trying', lang)
-                    # 選擇第一個可用的視頻URL
+                    # 候選已按探測結果排序（有效且最大的在前），選擇第一個
                     video_url_to_download = html_info['video_urls'][0]['url']
                     
                     # 如果是 YouTube 或 Vimeo URL，再次嘗試 yt-dlp
                     if 'youtube.com' in video_url_to_download or 'youtu.be' in video_url_to_download or 'vimeo.com' in video_url_to_download:
                         update_status(task_id, 'processing', 'status_retrying', 45, lang)
                         add_method_event(task_id, 'yt_dlp_cli', 'trying', lang)
-                        subprocess_file = run_yt_dlp_subprocess(video_url_to_download, format_id, file_id, cookie_file)
+                        subprocess_file = run_yt_dlp_subprocess(video_url_to_download, format_id, file_id, cookie_file, task_id, clip, lang)
                         if subprocess_file:
                             download_url = f'/api/file/{file_id}'
                             filename = os.path.basename(subprocess_file)
@@ -1042,7 +4205,7 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                     
                     # 直接下載視頻文件
                     add_method_event(task_id, 'direct_download', 'trying', lang)
-                    downloaded_file = download_video_direct(url, video_url_to_download, file_id, task_id, lang)
+                    downloaded_file = download_video_direct(url, video_url_to_download, file_id, task_id, lang, clip)
                     if downloaded_file:
                         download_url = f'/api/file/{file_id}'
                         filename = os.path.basename(downloaded_file)
@@ -1054,11 +4217,34 @@ def download_video_async(task_id, url, format_id, video_url, method, user_cookie
                     add_method_event(task_id, 'html_parse', 'failed', lang)
                 
                 update_status(task_id, 'error', 'error_extract_or_download', 0, lang)
+                # 所有方法都失敗：短時間內相同 URL 的請求直接返回此原因（以 yt-dlp 的錯誤為詳細訊息）
+                record_url_failure(url, cookie_file, 'error_extract_or_download', str(e),
+                                   download_failure_scope(format_id, clip))
                 
+            except (TaskCancelled, AdmissionRejected):
+                raise
             except Exception as e2:
                 update_status(task_id, 'error', f"{t('error_download_failed', lang)}: {str(e2)}", 0, lang)
+    except TaskCancelled:
+        # 背景串流與子程序都已結束，刪除未完成的檔案
+        remove_partial_files(file_id)
+        update_status(task_id, 'cancelled', 'status_cancelled', 0, lang)
+    except AdmissionRejected as e:
+        # 尚未開始下載，不再嘗試其他方法
+        update_status(task_id, 'error', f"{t(e.message_key, lang)} ({e.detail})", 0, lang)
     except Exception as e:
         update_status(task_id, 'error', f"{t('error_download_failed', lang)}: {str(e)}", 0, lang)
+    finally:
+        admission.release(task_id)
+        bandwidth.forget(task_id)
+        if API_KEY_LIMITS:
+            key_limiter.release_task(task_id, get_file_bytes(file_id))
+        leave_pipeline_stage(task_id)
+        with status_lock:
+            completed = task_id in download_status and download_status[task_id].status == 'completed'
+        if completed and not video_url:
+            # 下載成功說明 URL 可以提取，同時清除提取失敗的記錄
+            clear_url_failure(url, cookie_file, (EXTRACT_FAILURE_SCOPE, download_failure_scope(format_id, clip)))
 
 @app.route('/api/download', methods=['POST'])
 def download():
@@ -1077,17 +4263,48 @@ def download():
     if not is_valid_url(url):
         return jsonify({'error': t('error_invalid_url', lang)}), 400
     
+    # 可選的片段起止時間（秒或 HH:MM:SS）
+    try:
+        clip = parse_clip_range(data)
+    except ValueError:
+        return jsonify({'error': t('error_invalid_time_range', lang)}), 400
+    if clip and not ffmpeg_available():
+        return jsonify({'error': t('error_clip_requires_ffmpeg', lang)}), 400
+    
+    session_cookie = get_session_cookie_path()
+    
+    # 最近所有方法都失敗的 URL 直接返回相同原因；帶 force 時重新嘗試（直連視頻 URL 不經過備援流程，不檢查）
+    force = str(data.get('force', '')).lower() in ('1', 'true', 'yes')
+    failure = None if video_url else get_url_failure(url, get_cookie_file(session_cookie), force,
+                                                      download_failure_scope(format_id, clip))
+    if failure:
+        return jsonify({
+            'error': f"{url_failure_message(failure, lang)} ({t('error_recent_failure', lang)})",
+            'cached_failure': True,
+            'retry_after': failure['retry_after']
+        }), 400
+    
+    # 推測性預取已在下載相同 URL 的預設格式時直接接手該任務
+    prefetch_id = prefetcher.attach(url, format_id, video_url, clip, session_cookie)
+    if prefetch_id:
+        return jsonify({
+            'success': True,
+            'task_id': prefetch_id,
+            'prefetched': True
+        })
+    
+    # 磁碟空間不足且等待隊列已滿時直接拒絕，而不是讓任務下載到一半失敗
+    retry_after = admission.retry_after()
+    if retry_after:
+        response = jsonify({'error': t('error_server_busy', lang), 'retry_after': retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+    
     # 生成任务ID
     task_id = str(uuid.uuid4())
     update_status(task_id, 'processing', 'status_starting', 0, lang)
     
-    session_cookie = get_session_cookie_path()
-    thread = threading.Thread(
-        target=download_video_async,
-        args=(task_id, url, format_id, video_url, method, session_cookie)
-    )
-    thread.daemon = True
-    thread.start()
+    start_download_task(task_id, url, format_id, video_url, method, session_cookie, should_profile(), clip)
     
     return jsonify({
         'success': True,
@@ -1098,12 +4315,21 @@ def download():
 def get_status(task_id):
     """获取下载状态API"""
     lang = get_language()
-    with status_lock:
-        if task_id in download_status:
-            status = download_status[task_id].copy()
-            return jsonify(status)
-        else:
-            return jsonify({'error': t('error_task_not_found', lang)}), 404
+    status = get_task_status(task_id)
+    if status is None:
+        return jsonify({'error': t('error_task_not_found', lang)}), 404
+    return jsonify(status)
+
+@app.route('/api/tasks/<task_id>', methods=['DELETE'])
+def cancel_download(task_id):
+    """取消下載任務"""
+    lang = get_language()
+    result = cancel_task(task_id, 'cancelled by user')
+    if result == 'not_found':
+        return jsonify({'error': t('error_task_not_found', lang)}), 404
+    if result == 'finished':
+        return jsonify({'error': t('error_task_finished', lang)}), 409
+    return jsonify({'success': True, 'message': t('status_cancelling', lang)}), 202
 
 @app.route('/api/file/<file_id>')
 def serve_file(file_id):
@@ -1134,11 +4360,14 @@ def api_info():
         'api_version': API_VERSION,
         'endpoints': {
             'extract': f'{base_url}/api/{API_VERSION}/extract',
+            'extract_batch': f'{base_url}/api/{API_VERSION}/extract:batch',
             'download': f'{base_url}/api/{API_VERSION}/download',
             'status': f'{base_url}/api/{API_VERSION}/status/<task_id>',
-            'file': f'{base_url}/api/{API_VERSION}/file/<file_id>'
+            'status_batch': f'{base_url}/api/{API_VERSION}/status:batch',
+            'file': f'{base_url}/api/{API_VERSION}/file/<file_id>',
+            'stage_stats': f'{base_url}/api/{API_VERSION}/stats/stages'
         },
-        'authentication': 'X-API-Key header or api_key query parameter' if API_KEY else 'Not required'
+        'authentication': 'X-API-Key header or api_key query parameter' if API_KEY_LIMITS else 'Not required'
     })
 
 @app.route(f'/api/{API_VERSION}/extract', methods=['POST'])
@@ -1161,88 +4390,23 @@ def api_extract():
             'error': 'Invalid URL format'
         }), 400
     
+    force = str(data.get('force', '')).lower() in ('1', 'true', 'yes')
+    # 提取使用目前請求的 cookies，查詢、記錄與清除失敗記錄都用同一個檔案
+    cookie_file = get_cookie_file(get_session_cookie_path())
+    failure = get_url_failure(url, cookie_file, force)
+    if failure:
+        return cached_failure_response(failure)
+    
     try:
-        # 首先嘗試使用 yt-dlp
-        info = extract_video_info(url)
-        if info is not None:
-            formats = get_video_formats(url)
+        data = extract_api_data(url, cookie_file)
+        if data is not None:
+            # 有每日額度的 key 不做推測性預取，以免未請求的下載計入額度
+            api_key = get_request_api_key()
+            if data['method'] == 'yt-dlp' and api_key not in API_KEY_LIMITS and prefetcher.start(url, None, api_key, lang):
+                data['prefetch'] = {'format_id': 'best', 'window_seconds': PREFETCH_WINDOW}
             return jsonify({
                 'success': True,
-                'data': {
-                    'title': info['title'],
-                    'duration': info['duration'],
-                    'thumbnail': info.get('thumbnail', ''),
-                    'description': info.get('description', ''),
-                    'uploader': info.get('uploader', ''),
-                    'view_count': info.get('view_count', 0),
-                    'upload_date': info.get('upload_date', ''),
-                    'webpage_url': info.get('webpage_url', url),
-                    'formats': formats[:10],
-                    'method': 'yt-dlp'
-                }
-            })
-        
-        # yt-dlp 失敗，檢查是否為 Instagram URL
-        if 'instagram.com' in url.lower():
-            instagram_info = extract_instagram_video(url)
-            if instagram_info and instagram_info['video_urls']:
-                formats = []
-                for idx, video in enumerate(instagram_info['video_urls']):
-                    formats.append({
-                        'format_id': f'instagram_{idx}',
-                        'ext': video['type'].split('/')[-1] if '/' in video['type'] else 'mp4',
-                        'resolution': video.get('quality', 'unknown'),
-                        'filesize': 0,
-                        'quality': 0,
-                        'video_url': video['url']
-                    })
-                
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'title': instagram_info['title'],
-                        'duration': instagram_info['duration'],
-                        'thumbnail': '',
-                        'description': '',
-                        'uploader': '',
-                        'view_count': 0,
-                        'upload_date': '',
-                        'webpage_url': url,
-                        'formats': formats,
-                        'method': 'instagram_parse',
-                        'video_urls': instagram_info['video_urls']
-                    }
-                })
-        
-        # 使用備用方案：HTML解析
-        html_info = extract_video_from_html(url)
-        if html_info and html_info['video_urls']:
-            formats = []
-            for idx, video in enumerate(html_info['video_urls']):
-                formats.append({
-                    'format_id': f'html_{idx}',
-                    'ext': video['type'].split('/')[-1] if '/' in video['type'] else 'mp4',
-                    'resolution': video.get('quality', 'unknown'),
-                    'filesize': 0,
-                    'quality': 0,
-                    'video_url': video['url']
-                })
-            
-            return jsonify({
-                'success': True,
-                'data': {
-                    'title': html_info['title'],
-                    'duration': html_info['duration'],
-                    'thumbnail': '',
-                    'description': '',
-                    'uploader': '',
-                    'view_count': 0,
-                    'upload_date': '',
-                    'webpage_url': url,
-                    'formats': formats,
-                    'method': 'html_parse',
-                    'video_urls': html_info['video_urls']
-                }
+                'data': data
             })
         
         return jsonify({
@@ -1256,6 +4420,55 @@ def api_extract():
             'error': f'Extraction failed: {str(e)}'
         }), 500
 
+@app.route(f'/api/{API_VERSION}/extract:batch', methods=['POST'])
+@require_api_key
+def api_extract_batch():
+    """批次提取视频信息：以有上限的執行緒池並行提取，每完成一個就以一行 NDJSON 返回（供外部服務調用）"""
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+        return jsonify({
+            'success': False,
+            'error': 'urls must be a non-empty list of URLs'
+        }), 400
+    if len(urls) > EXTRACT_BATCH_MAX:
+        return jsonify({
+            'success': False,
+            'error': f'At most {EXTRACT_BATCH_MAX} URLs per request'
+        }), 400
+    force = str(data.get('force', '')).lower() in ('1', 'true', 'yes')
+    # 批次提取在執行緒池中進行，沒有請求上下文（不使用 session 上傳的 cookies），
+    # 負面快取的查詢、記錄與清除都用同一個檔案
+    cookie_file = get_cookie_file()
+    
+    def generate():
+        pool = get_extract_executor()
+        futures = []
+        succeeded = 0
+        try:
+            for index, url in enumerate(urls):
+                url = url.strip()
+                if not is_valid_url(url):
+                    yield json.dumps({'index': index, 'url': url, 'success': False, 'error': 'Invalid URL format'}) + '\n'
+                    continue
+                failure = get_url_failure(url, cookie_file, force)
+                if failure:
+                    yield json.dumps({'index': index, 'url': url, **cached_failure_result(failure)}) + '\n'
+                    continue
+                futures.append(pool.submit(extract_batch_item, index, url, cookie_file))
+            for future in as_completed(futures):
+                result = future.result()
+                succeeded += result['success']
+                yield json.dumps(result, default=str) + '\n'
+            yield json.dumps({'done': True, 'total': len(urls), 'succeeded': succeeded,
+                              'failed': len(urls) - succeeded}) + '\n'
+        finally:
+            # 客戶端中途斷線時，取消尚未開始的提取
+            for future in futures:
+                future.cancel()
+    
+    return app.response_class(generate(), mimetype='application/x-ndjson')
+
 @app.route(f'/api/{API_VERSION}/download', methods=['POST'])
 @require_api_key
 def api_download():
@@ -1280,9 +4493,83 @@ def api_download():
             'error': 'Invalid URL format'
         }), 400
     
+    try:
+        clip = parse_clip_range(data)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid time range: start and end must be seconds or HH:MM:SS, with end after start'
+        }), 400
+    if clip and not ffmpeg_available():
+        return jsonify({
+            'success': False,
+            'error': 'Clip downloads require ffmpeg on the server'
+        }), 400
+    
+    try:
+        max_rate_kbps = float(data['max_rate_kbps']) if data.get('max_rate_kbps') else None
+        # 只接受有限的正數（inf、nan 與負數都拒絕）
+        if max_rate_kbps is not None and not 0 < max_rate_kbps < float('inf'):
+            raise ValueError(max_rate_kbps)
+        max_rate = max(int(max_rate_kbps * 1024), 1) if max_rate_kbps else None
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({
+            'success': False,
+            'error': 'max_rate_kbps must be a positive number'
+        }), 400
+    
+    force = str(data.get('force', '')).lower() in ('1', 'true', 'yes')
+    # 任務以伺服器的 cookies 下載（user_cookie_file=None），與 download_video_async 記錄時相同
+    failure = None if video_url else get_url_failure(url, get_cookie_file(), force,
+                                                      download_failure_scope(format_id, clip))
+    if failure:
+        return cached_failure_response(failure)
+    
+    api_key = get_request_api_key()
+    base_url = request.url_root.rstrip('/')
+    
+    # 推測性預取已在下載相同 URL 的預設格式時直接接手該任務
+    prefetch_id = None if max_rate else prefetcher.attach(url, format_id, video_url, clip, None, api_key)
+    if prefetch_id:
+        if webhook_url:
+            # 與 update_status 同在 status_lock 內檢查：任務已結束時回調已經發過（當時尚未登記），在此補發
+            with status_lock:
+                with webhook_lock:
+                    webhook_callbacks[prefetch_id] = webhook_url
+                record = download_status.get(prefetch_id)
+                if record is not None and record.status in FINAL_STATUSES:
+                    send_webhook_callback(prefetch_id, record)
+        return jsonify({
+            'success': True,
+            'task_id': prefetch_id,
+            'status_url': f'{base_url}/api/{API_VERSION}/status/{prefetch_id}',
+            'message': 'Download task attached to prefetch',
+            'prefetched': True
+        })
+    
+    retry_after = admission.retry_after()
+    if retry_after:
+        response = jsonify({
+            'success': False,
+            'error': 'Server is out of download capacity, retry later',
+            'retry_after': retry_after
+        })
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+    
     # 生成任务ID
     task_id = str(uuid.uuid4())
     
+    # 按 API key 限制同時進行的任務數與每日下載量
+    if api_key in API_KEY_LIMITS:
+        retry_after, error = key_limiter.reserve_task(api_key, task_id, API_KEY_LIMITS[api_key])
+        if error:
+            if retry_after is None:
+                # 等到一個進行中的任務結束：按平均下載耗時估計
+                average = get_stage_stats().get('download', {}).get('avg_seconds')
+                retry_after = int(min(max(average or 30, 5), 600))
+            return rate_limited_response(error, retry_after)
+    
     # 存储webhook回调URL
     if webhook_url:
         with webhook_lock:
@@ -1291,14 +4578,9 @@ def api_download():
     update_status(task_id, 'processing', 'status_starting', 0, lang)
     
     # 启动异步下载任务
-    thread = threading.Thread(
-        target=download_video_async,
-        args=(task_id, url, format_id, video_url, method, None)
-    )
-    thread.daemon = True
-    thread.start()
+    start_download_task(task_id, url, format_id, video_url, method, None, should_profile(), clip,
+                        api_key, max_rate)
     
-    base_url = request.url_root.rstrip('/')
     return jsonify({
         'success': True,
         'task_id': task_id,
@@ -1310,21 +4592,221 @@ def api_download():
 @require_api_key
 def api_get_status(task_id):
     """获取下载状态API（供外部服务调用）"""
-    with status_lock:
-        if task_id in download_status:
-            status = download_status[task_id].copy()
-            base_url = request.url_root.rstrip('/')
-            if 'download_url' in status:
-                status['download_url'] = base_url + status['download_url']
-            return jsonify({
-                'success': True,
-                'data': status
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Task not found'
-            }), 404
+    status = get_task_status(task_id)
+    if status is None:
+        return jsonify({
+            'success': False,
+            'error': 'Task not found'
+        }), 404
+    base_url = request.url_root.rstrip('/')
+    if 'download_url' in status:
+        status['download_url'] = base_url + status['download_url']
+    return jsonify({
+        'success': True,
+        'data': status
+    })
+
+@app.route(f'/api/{API_VERSION}/status:batch', methods=['POST'])
+@require_api_key
+def api_get_status_batch():
+    """批次獲取下載狀態：一次請求查詢多個任務，可只返回某個版本 / 時間之後變更過的任務（供外部服務調用）"""
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get('task_ids')
+    if not isinstance(task_ids, list) or not task_ids or not all(isinstance(task_id, str) for task_id in task_ids):
+        return jsonify({
+            'success': False,
+            'error': 'task_ids must be a non-empty list of task IDs'
+        }), 400
+    task_ids = list(dict.fromkeys(task_ids))
+    if len(task_ids) > STATUS_BATCH_MAX:
+        return jsonify({
+            'success': False,
+            'error': f'At most {STATUS_BATCH_MAX} task IDs per request'
+        }), 400
+    try:
+        since_version = int(data['since_version']) if data.get('since_version') is not None else None
+        since = float(data['since']) if data.get('since') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'since_version must be an integer and since a Unix timestamp'
+        }), 400
+    
+    statuses, missing, version = get_task_statuses(task_ids, since_version, since)
+    base_url = request.url_root.rstrip('/')
+    for status in statuses.values():
+        if 'download_url' in status:
+            status['download_url'] = base_url + status['download_url']
+    return jsonify({
+        'success': True,
+        'data': {
+            'version': version,
+            'tasks': statuses,
+            'missing': missing
+        }
+    })
+
+@app.route(f'/api/{API_VERSION}/tasks/<task_id>', methods=['DELETE'])
+@require_api_key
+def api_cancel_task(task_id):
+    """取消下載任務：中斷下載並刪除未完成的檔案（供外部服務調用）"""
+    result = cancel_task(task_id, 'cancelled via API')
+    if result == 'not_found':
+        return jsonify({
+            'success': False,
+            'error': 'Task not found'
+        }), 404
+    if result == 'finished':
+        return jsonify({
+            'success': False,
+            'error': 'Task already finished'
+        }), 409
+    base_url = request.url_root.rstrip('/')
+    return jsonify({
+        'success': True,
+        'data': {
+            'task_id': task_id,
+            'status': 'cancelling',
+            'status_url': f'{base_url}/api/{API_VERSION}/status/{task_id}'
+        }
+    }), 202
+
+@app.route(f'/api/{API_VERSION}/usage', methods=['GET'])
+@require_api_key
+def api_usage():
+    """目前 API key 的請求數、進行中任務與每日下載量"""
+    api_key = get_request_api_key()
+    if api_key not in API_KEY_LIMITS:
+        return jsonify({
+            'success': False,
+            'error': 'No API keys are configured'
+        }), 404
+    return jsonify({
+        'success': True,
+        'data': key_limiter.usage(api_key, API_KEY_LIMITS[api_key])
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/stages', methods=['GET'])
+@require_api_key
+def api_stage_stats():
+    """各下載階段的匯總耗時與吞吐量（用於找出瓶頸）"""
+    return jsonify({
+        'success': True,
+        'data': get_stage_stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/ydl-pool', methods=['GET'])
+@require_api_key
+def api_ydl_pool_stats():
+    """YoutubeDL 實例池命中率與大小"""
+    return jsonify({
+        'success': True,
+        'data': get_ydl_pool_stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/routes', methods=['GET'])
+@require_api_key
+def api_route_stats():
+    """各域名的 extractor 路由與命中統計"""
+    return jsonify({
+        'success': True,
+        'data': get_route_stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/negative-cache', methods=['GET'])
+@require_api_key
+def api_negative_cache_stats():
+    """最近所有方法都失敗的 URL 記錄數與命中統計"""
+    return jsonify({
+        'success': True,
+        'data': get_negative_cache_stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/ytdlp-cache', methods=['GET'])
+@require_api_key
+def api_ytdlp_cache_stats():
+    """yt-dlp 持久化快取大小與節省的提取時間"""
+    return jsonify({
+        'success': True,
+        'data': get_ytdlp_cache_stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/bandwidth', methods=['GET'])
+@require_api_key
+def api_bandwidth_stats():
+    """頻寬整形設定與各任務分得 / 實際的速率"""
+    return jsonify({
+        'success': True,
+        'data': bandwidth.stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/admission', methods=['GET'])
+@require_api_key
+def api_admission_stats():
+    """磁碟空間預留與排隊狀態"""
+    return jsonify({
+        'success': True,
+        'data': admission.stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/prefetch', methods=['GET'])
+@require_api_key
+def api_prefetch_stats():
+    """推測性預取的命中率、節省與浪費的流量"""
+    return jsonify({
+        'success': True,
+        'data': prefetcher.stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/stats/queue', methods=['GET'])
+@require_api_key
+def api_queue_stats():
+    """分散式模式的共用佇列狀態"""
+    if task_queue is None:
+        return jsonify({
+            'success': False,
+            'error': 'Task queue is not enabled (set TASK_QUEUE)'
+        }), 404
+    return jsonify({
+        'success': True,
+        'data': task_queue.stats()
+    })
+
+@app.route(f'/api/{API_VERSION}/admin/profiles', methods=['GET'])
+@require_admin_key
+def api_list_profiles():
+    """列出已保存的剖析結果"""
+    with profiles_lock:
+        items = [
+            {key: value for key, value in profile.items() if key != 'sampler'}
+            for profile in reversed(profiles.values())
+        ]
+    return jsonify({
+        'success': True,
+        'data': items
+    })
+
+@app.route(f'/api/{API_VERSION}/admin/profiles/<profile_id>', methods=['GET'])
+@require_admin_key
+def api_get_profile(profile_id):
+    """獲取剖析結果（format=collapsed 返回 flamegraph 文本，format=json 返回熱點函數）"""
+    with profiles_lock:
+        profile = profiles.get(profile_id)
+    if not profile:
+        return jsonify({
+            'success': False,
+            'error': 'Profile not found'
+        }), 404
+
+    sampler = profile['sampler']
+    if request.args.get('format', 'collapsed') == 'json':
+        data = {key: value for key, value in profile.items() if key != 'sampler'}
+        data['top_functions'] = sampler.top_functions()
+        return jsonify({
+            'success': True,
+            'data': data
+        })
+    return app.response_class(sampler.collapsed(), mimetype='text/plain')
 
 @app.route(f'/api/{API_VERSION}/file/<file_id>', methods=['GET'])
 @require_api_key
@@ -1355,20 +4837,21 @@ def api_docs():
         'version': API_VERSION,
         'base_url': f'{base_url}/api/{API_VERSION}',
         'authentication': {
-            'required': API_KEY is not None,
+            'required': bool(API_KEY_LIMITS),
             'method': 'X-API-Key header or api_key query parameter',
             'example': 'X-API-Key: your-api-key-here'
         },
         'endpoints': {
             'GET /info': {
                 'description': 'Get API information and available endpoints',
-                'authentication': 'Required if API_KEY is set'
+                'authentication': 'Required if API_KEY or API_KEYS is set'
             },
             'POST /extract': {
                 'description': 'Extract video information without downloading',
                 'request_body': {
                     'url': 'string (required) - Video URL',
-                    'language': 'string (optional) - Language code (en, zh-TW, zh-CN)'
+                    'language': 'string (optional) - Language code (en, zh-TW, zh-CN)',
+                    'force': 'boolean (optional) - Retry even if the URL failed every method recently'
                 },
                 'response': {
                     'success': 'boolean',
@@ -1380,10 +4863,19 @@ def api_docs():
                         'uploader': 'string',
                         'view_count': 'number',
                         'upload_date': 'string',
-                        'formats': 'array'
+                        'formats': 'array',
+                        'prefetch': 'object (only when SPECULATIVE_PREFETCH started a background download) - {format_id, window_seconds}'
                     }
                 }
             },
+            'POST /extract:batch': {
+                'description': 'Extract many URLs concurrently; results are streamed as NDJSON, one line per URL as it finishes',
+                'request_body': {
+                    'urls': f'array (required) - up to {EXTRACT_BATCH_MAX} video URLs',
+                    'force': 'boolean (optional) - retry URLs that failed every method recently'
+                },
+                'response': 'application/x-ndjson - {index, url, success, seconds, data | error} per URL (recently failed URLs: {index, url, success, error, cached_failure, retry_after}), then {done, total, succeeded, failed}'
+            },
             'POST /download': {
                 'description': 'Start video download task',
                 'request_body': {
@@ -1392,13 +4884,23 @@ def api_docs():
                     'video_url': 'string (optional) - Direct video URL',
                     'method': 'string (optional) - Extraction method',
                     'webhook_url': 'string (optional) - Webhook callback URL',
-                    'language': 'string (optional) - Language code'
+                    'language': 'string (optional) - Language code',
+                    'start': 'number|string (optional) - Clip start, seconds or HH:MM:SS',
+                    'end': 'number|string (optional) - Clip end, seconds or HH:MM:SS',
+                    'max_rate_kbps': 'number (optional) - Bandwidth cap for this task in KB/s',
+                    'force': 'boolean (optional) - Retry even if the URL failed every method recently'
                 },
                 'response': {
                     'success': 'boolean',
                     'task_id': 'string',
                     'status_url': 'string',
-                    'message': 'string'
+                    'message': 'string',
+                    'prefetched': 'boolean (only when attached to a speculative prefetch of the default format)'
+                },
+                'errors': {
+                    '400': 'Invalid request, or the URL failed every method recently (cached_failure: true, retry_after seconds)',
+                    '429': 'API key is over its request rate, in-flight download or daily byte limit; retry after the Retry-After header (seconds)',
+                    '503': 'Out of disk capacity and the admission queue is full; retry after the Retry-After header (seconds)'
                 }
             },
             'GET /status/<task_id>': {
@@ -1406,21 +4908,86 @@ def api_docs():
                 'response': {
                     'success': 'boolean',
                     'data': {
-                        'status': 'string (processing, downloading, completed, error)',
+                        'status': 'string (processing, downloading, completed, error, cancelled)',
                         'message': 'string',
                         'progress': 'number (0-100)',
                         'download_url': 'string (if completed)',
-                        'filename': 'string (if completed)'
+                        'filename': 'string (if completed)',
+                        'timeline': 'array - per-stage start/end, duration, bytes, avg_throughput, peak_throughput',
+                        'stage_totals': 'object - seconds spent per stage (extract, download, postprocess, attempt, fallback)'
+                    }
+                }
+            },
+            'POST /status:batch': {
+                'description': 'Get the status of many tasks in one request, optionally only those changed since a version or timestamp',
+                'parameters': {
+                    'task_ids': f'array (required) - up to {STATUS_BATCH_MAX} task IDs',
+                    'since_version': 'integer (optional) - only tasks changed after this version (use data.version from the previous response)',
+                    'since': 'number (optional) - only tasks changed after this Unix timestamp'
+                },
+                'response': {
+                    'success': 'boolean',
+                    'data': {
+                        'version': 'integer - current status version, pass as since_version on the next poll',
+                        'tasks': 'object - task_id -> status (same fields as GET /status/<task_id>)',
+                        'missing': 'array - task IDs that were not found'
+                    }
+                }
+            },
+            'GET /usage': {
+                'description': 'Limits and current usage of the calling API key: requests per minute, in-flight downloads, bytes downloaded today'
+            },
+            'DELETE /tasks/<task_id>': {
+                'description': 'Cancel a running or queued task; partial files are deleted and status becomes cancelled',
+                'response': {
+                    'success': 'boolean',
+                    'data': {
+                        'task_id': 'string',
+                        'status': 'string (cancelling)',
+                        'status_url': 'string'
                     }
                 }
             },
+            'GET /stats/stages': {
+                'description': 'Aggregated stage timing and throughput across all tasks, grouped by stage and method'
+            },
+            'GET /stats/ydl-pool': {
+                'description': 'YoutubeDL instance pool hits, misses, evictions and idle instances'
+            },
+            'GET /stats/routes': {
+                'description': 'Per-domain extractor routing: cached ie_key or HTML route, hits, success rate, average extract time'
+            },
+            'GET /stats/negative-cache': {
+                'description': 'URLs that recently failed every extraction method: entries, fail-fast hits, force bypasses and expiries'
+            },
+            'GET /stats/ytdlp-cache': {
+                'description': 'Shared yt-dlp cache directory size and estimated extraction time saved by warm cache'
+            },
+            'GET /stats/bandwidth': {
+                'description': 'Bandwidth shaping limits and per-task allocated and measured rates'
+            },
+            'GET /stats/admission': {
+                'description': 'Disk-space admission control: free bytes, reserved and outstanding bytes, admitted, queued and rejected tasks'
+            },
+            'GET /stats/prefetch': {
+                'description': 'Speculative prefetch: started, skipped, hits, expired and failed prefetches, hit rate, bytes saved and wasted'
+            },
+            'GET /stats/queue': {
+                'description': 'Distributed worker mode: queued, running and finished tasks in the shared queue and active workers'
+            },
+            'GET /admin/profiles': {
+                'description': 'List stored stack-sampling profiles (requires X-Admin-Key)'
+            },
+            'GET /admin/profiles/<profile_id>': {
+                'description': 'Get a profile as collapsed stacks (format=collapsed, default) or top functions (format=json)'
+            },
             'GET /file/<file_id>': {
                 'description': 'Download video file',
                 'response': 'Binary file stream'
             }
         },
         'webhook': {
-            'description': 'If webhook_url is provided in download request, a POST request will be sent when download completes or fails',
+            'description': 'If webhook_url is provided in download request, a POST request will be sent when download completes, fails or is cancelled',
             'payload': {
                 'task_id': 'string',
                 'status': 'string',
@@ -1433,6 +5000,21 @@ def api_docs():
         }
     })
 
+def warm_up():
+    """預先載入所有延遲依賴及 yt-dlp 的 extractor 列表"""
+    for lazy in LAZY_IMPORTS:
+        try:
+            lazy._load()
+        except ImportError as e:
+            print(f"Preload failed for {lazy._module_name}: {e}")
+    if yt_dlp.is_loaded:
+        importlib.import_module('yt_dlp.extractor').gen_extractor_classes()
+
+if PRELOAD_MODULES:
+    warm_up()
+    # 將預載入的物件移出 GC 追蹤，避免 worker 中的垃圾回收觸碰共享頁面導致複製
+    gc.freeze()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
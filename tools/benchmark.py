@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the extraction and download pipeline.
+
+Starts a local stand-in HTTP server (in a separate process) that serves the
+recorded pages in tools/bench_fixtures and synthetic video files of any size,
+then measures the functions in app.py against it. No external network access
+is needed.
+
+Usage:
+    python tools/benchmark.py --output bench.json
+    python tools/benchmark.py --output new.json --compare bench.json
+    python tools/benchmark.py --only html_parse,direct_download
+
+Results are written as JSON: {"meta": {...}, "results": {benchmark: {metric: value}}}.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_fixtures')
+
+VIDEO_PATH_RE = re.compile(r'^(?:/instagram)?/video/(\d+)\.(mp4|webm|mov|mkv)$')
+CONTENT_TYPES = {
+    'mp4': 'video/mp4',
+    'webm': 'video/webm',
+    'mov': 'video/quicktime',
+    'mkv': 'video/x-matroska',
+}
+BLOCK = os.urandom(1024 * 1024)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves fixture pages and synthetic videos (with Range support)."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        path, _, query = self.path.partition('?')
+        if path.startswith('/page/'):
+            self.serve_page(path[len('/page/'):], query, send_body)
+            return
+        match = VIDEO_PATH_RE.match(path)
+        if match:
+            self.serve_video(int(match.group(1)), match.group(2), send_body)
+            return
+        self.send_error(404)
+
+    def serve_page(self, name, query, send_body):
+        fixture_path = os.path.join(FIXTURE_DIR, os.path.basename(name))
+        if not os.path.exists(fixture_path):
+            self.send_error(404)
+            return
+        with open(fixture_path, encoding='utf-8') as f:
+            page = f.read().replace('{base}', f'http://{self.headers.get("Host")}')
+        # ?repeat=N duplicates the <main> block to simulate large pages
+        repeat_match = re.search(r'repeat=(\d+)', query)
+        if repeat_match and '<main>' in page:
+            head, rest = page.split('<main>', 1)
+            main, tail = rest.split('</main>', 1)
+            page = head + ('<main>' + main + '</main>') * int(repeat_match.group(1)) + tail
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def serve_video(self, size, ext, send_body):
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        range_match = re.match(r'bytes=(\d*)-(\d*)', range_header or '')
+        if range_match:
+            if range_match.group(1):
+                start = int(range_match.group(1))
+                if range_match.group(2):
+                    end = min(int(range_match.group(2)), size - 1)
+            elif range_match.group(2):
+                start = max(size - int(range_match.group(2)), 0)
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        length = end - start + 1
+        self.send_header('Content-Type', CONTENT_TYPES[ext])
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+        offset = start % len(BLOCK)
+        remaining = length
+        try:
+            while remaining > 0:
+                chunk = BLOCK[offset:offset + remaining]
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                offset = 0
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def run_fixture_server(queue):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.daemon_threads = True
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_fixture_server():
+    """Start the fixture server in a child process; returns (process, base_url)."""
+    queue = Queue()
+    process = Process(target=run_fixture_server, args=(queue,), daemon=True)
+    process.start()
+    port = queue.get(timeout=10)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies, cpu_times=None):
+    result = {
+        'runs': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'min_ms': round(min(latencies) * 1000, 3) if latencies else 0,
+    }
+    if cpu_times:
+        result['cpu_mean_ms'] = round(sum(cpu_times) / len(cpu_times) * 1000, 3)
+    return result
+
+
+def measure(func, iterations, warmup=1):
+    """Run func repeatedly; returns (wall latencies, thread CPU times)."""
+    for _ in range(warmup):
+        func()
+    latencies, cpu_times = [], []
+    for _ in range(iterations):
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        func()
+        cpu_times.append(time.thread_time() - cpu_start)
+        latencies.append(time.perf_counter() - wall_start)
+    return latencies, cpu_times
+
+
+def remove_downloads(app, file_ids=None):
+    for filename in os.listdir(app.DOWNLOAD_DIR):
+        path = os.path.join(app.DOWNLOAD_DIR, filename)
+        if os.path.isfile(path) and (file_ids is None or any(filename.startswith(f) for f in file_ids)):
+            os.remove(path)
+
+
+# ==================== Benchmarks ====================
+
+def bench_build_format_options(app, base_url, args):
+    info = {'formats': []}
+    for idx in range(200):
+        info['formats'].append({
+            'format_id': str(idx),
+            'ext': ('mp4', 'webm', 'm4a')[idx % 3],
+            'height': (144, 240, 360, 480, 720, 1080, 1440, 2160)[idx % 8],
+            'tbr': 100 + idx * 7,
+            'vcodec': 'none' if idx % 3 == 2 else 'avc1',
+            'acodec': 'mp4a' if idx % 2 else 'none',
+            'filesize': idx * 1000,
+        })
+    latencies, cpu_times = measure(lambda: app.build_format_options(info), args.iterations * 20)
+    return summarize(latencies, cpu_times)
+
+
+def bench_html_parse(app, base_url, args):
+    results = {}
+    pages = {
+        'generic': f'{base_url}/page/generic_video.html',
+        'generic_large': f'{base_url}/page/generic_video.html?repeat=50',
+    }
+    for name, page_url in pages.items():
+        latencies, cpu_times = measure(lambda: app.extract_video_from_html(page_url), args.iterations)
+        results[name] = summarize(latencies, cpu_times)
+    return results
+
+
+def bench_instagram_parse(app, base_url, args):
+    page_url = f'{base_url}/page/instagram_reel.html'
+    latencies, cpu_times = measure(lambda: app.extract_instagram_video(page_url), args.iterations)
+    return summarize(latencies, cpu_times)
+
+
+def bench_extract_latency(app, base_url, args):
+    """yt-dlp (generic extractor) and the full /api/v1/extract endpoint."""
+    client = app.app.test_client()
+    page_url = f'{base_url}/page/generic_video.html'
+    iterations = max(args.iterations // 2, 1)
+    latencies, cpu_times = measure(lambda: app.extract_video_info(page_url), iterations)
+    endpoint_latencies, _ = measure(
+        lambda: client.post(f'/api/{app.API_VERSION}/extract', json={'url': page_url}),
+        iterations
+    )
+    return {
+        'extract_video_info': summarize(latencies, cpu_times),
+        'api_extract': summarize(endpoint_latencies),
+    }
+
+
+def bench_ydl_pool(app, base_url, args):
+    """Checkout latency of pooled YoutubeDL instances; repeated checkouts with the same options must hit."""
+    if app.YDL_POOL_SIZE <= 0:
+        return {'skipped': 'YDL_POOL_SIZE=0'}
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'outtmpl': os.path.join(app.DOWNLOAD_DIR, 'bench-pool.%(ext)s'),
+        'progress_hooks': [lambda d: None],
+        'concurrent_fragment_downloads': 2,
+        'ratelimit': None,
+    }
+    key = app.ydl_pool_key(ydl_opts)
+
+    def checkout():
+        with app.pooled_ydl(ydl_opts):
+            pass
+
+    checkout()
+    before = dict(app.ydl_pool_stats)
+    latencies, cpu_times = measure(checkout, args.iterations, warmup=0)
+    hits = app.ydl_pool_stats['hits'] - before['hits']
+    misses = app.ydl_pool_stats['misses'] - before['misses']
+    if misses or key not in app.ydl_pool:
+        raise RuntimeError(f'pooled YoutubeDL checkouts missed ({hits} hits, {misses} misses, keys={len(app.ydl_pool)})')
+    result = summarize(latencies, cpu_times)
+    result['hits'] = hits
+    return result
+
+
+def bench_direct_download(app, base_url, args):
+    results = {}
+    for size_mb in args.sizes:
+        size = size_mb * 1024 * 1024
+        video_url = f'{base_url}/video/{size}.mp4'
+        latencies = []
+        for idx in range(args.download_runs):
+            file_id = f'bench-{size_mb}-{idx}'
+            start = time.perf_counter()
+            path = app.download_video_direct(video_url, video_url, file_id)
+            latencies.append(time.perf_counter() - start)
+            if not path:
+                raise RuntimeError(f'direct download of {video_url} failed')
+            remove_downloads(app, [file_id])
+        result = summarize(latencies)
+        result['throughput_mb_s'] = round(size_mb / (sum(latencies) / len(latencies)), 2)
+        results[f'{size_mb}MB'] = result
+    return results
+
+
+def bench_status_poll(app, base_url, args):
+    """Latency of /api/v1/status while pollers and status writers run concurrently."""
+    task_ids = [f'bench-status-{idx}' for idx in range(args.tasks)]
+    for task_id in task_ids:
+        app.update_status(task_id, 'downloading', 'status_downloading', 50, 'en')
+        app.add_method_event(task_id, 'yt_dlp', 'trying', 'en')
+
+    stop = threading.Event()
+
+    def writer():
+        progress = 0
+        while not stop.is_set():
+            for task_id in task_ids:
+                app.update_status(task_id, 'downloading', 'status_downloading', progress % 100, 'en')
+            progress += 1
+
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def poller(offset):
+        client = app.app.test_client()
+        local = []
+        for idx in range(args.polls):
+            task_id = task_ids[(offset + idx) % len(task_ids)]
+            start = time.perf_counter()
+            client.get(f'/api/{app.API_VERSION}/status/{task_id}')
+            local.append(time.perf_counter() - start)
+        with latencies_lock:
+            latencies.extend(local)
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+    started = time.perf_counter()
+    pollers = [threading.Thread(target=poller, args=(idx,)) for idx in range(args.concurrency)]
+    for thread in pollers:
+        thread.start()
+    for thread in pollers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writer_thread.join()
+
+    with app.status_lock:
+        for task_id in task_ids:
+            app.download_status.pop(task_id, None)
+
+    result = summarize(latencies)
+    result['p99_ms'] = round(percentile(latencies, 99) * 1000, 3)
+    result['concurrency'] = args.concurrency
+    result['requests_per_s'] = round(len(latencies) / elapsed, 1)
+    return result
+
+
+def bench_end_to_end(app, base_url, args):
+    """Tasks per second through /api/v1/download with direct video URLs."""
+    client = app.app.test_client()
+    size = args.e2e_size * 1024 * 1024
+    task_ids = []
+    started = time.perf_counter()
+    for idx in range(args.e2e_tasks):
+        video_url = f'{base_url}/video/{size}.mp4'
+        response = client.post(f'/api/{app.API_VERSION}/download', json={
+            'url': f'{base_url}/page/generic_video.html',
+            'video_url': video_url,
+        })
+        task_ids.append(response.get_json()['task_id'])
+
+    pending = set(task_ids)
+    failed = 0
+    file_ids = []
+    deadline = time.time() + args.timeout
+    while pending and time.time() < deadline:
+        for task_id in list(pending):
+            with app.status_lock:
+                record = app.download_status.get(task_id)
+                status = record.to_dict() if record is not None else {}
+            if status.get('status') == 'completed':
+                pending.discard(task_id)
+                file_ids.append(status.get('file_id'))
+            elif status.get('status') == 'error':
+                pending.discard(task_id)
+                failed += 1
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    remove_downloads(app, [f for f in file_ids if f])
+
+    completed = len(task_ids) - len(pending) - failed
+    return {
+        'tasks': len(task_ids),
+        'completed': completed,
+        'failed': failed,
+        'timed_out': len(pending),
+        'elapsed_s': round(elapsed, 3),
+        'tasks_per_s': round(completed / elapsed, 2) if elapsed else 0,
+    }
+
+
+BENCHMARKS = {
+    'build_format_options': bench_build_format_options,
+    'html_parse': bench_html_parse,
+    'instagram_parse': bench_instagram_parse,
+    'extract_latency': bench_extract_latency,
+    'ydl_pool': bench_ydl_pool,
+    'direct_download': bench_direct_download,
+    'status_poll': bench_status_poll,
+    'end_to_end': bench_end_to_end,
+}
+
+
+# ==================== Reporting ====================
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def print_comparison(baseline, current):
+    old = flatten(baseline.get('results', {}))
+    new = flatten(current.get('results', {}))
+    print(f'{"metric":<55} {"baseline":>12} {"current":>12} {"change":>9}')
+    for name in sorted(new):
+        if name not in old:
+            continue
+        before, after = old[name], new[name]
+        change = f'{(after - before) / before * 100:+.1f}%' if before else 'n/a'
+        print(f'{name:<55} {before:>12} {after:>12} {change:>9}')
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except Exception:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run offline benchmarks for the extraction and download pipeline.')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare the results against')
+    parser.add_argument('--only', help='Comma-separated benchmark names to run (default: all)')
+    parser.add_argument('--iterations', type=int, default=20, help='Iterations for latency benchmarks')
+    parser.add_argument('--sizes', default='1,16,64', help='Synthetic video sizes in MB for direct downloads')
+    parser.add_argument('--download-runs', type=int, default=3, help='Downloads per size')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent status pollers')
+    parser.add_argument('--polls', type=int, default=200, help='Status requests per poller')
+    parser.add_argument('--tasks', type=int, default=100, help='Fake tasks in download_status for polling')
+    parser.add_argument('--e2e-tasks', type=int, default=20, help='Tasks submitted in the end-to-end benchmark')
+    parser.add_argument('--e2e-size', type=int, default=4, help='Video size in MB for end-to-end tasks')
+    parser.add_argument('--timeout', type=int, default=120, help='End-to-end timeout in seconds')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    selected = list(BENCHMARKS)
+    if args.only:
+        selected = [name.strip() for name in args.only.split(',') if name.strip()]
+        unknown = [name for name in selected if name not in BENCHMARKS]
+        if unknown:
+            print(f'Unknown benchmarks: {", ".join(unknown)}', file=sys.stderr)
+            sys.exit(1)
+
+    server, base_url = start_fixture_server()
+    sys.path.insert(0, ROOT_DIR)
+    import app
+
+    results = {}
+    try:
+        for name in selected:
+            print(f'Running {name}...', file=sys.stderr)
+            results[name] = BENCHMARKS[name](app, base_url, args)
+    finally:
+        server.terminate()
+
+    import yt_dlp
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'yt_dlp': yt_dlp.version.__version__,
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f'Results written to {args.output}', file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Load generator simulating concurrent web UI pollers and API clients.
+
+Each simulated client repeatedly runs a full session against local fake
+sources (served by the fixture server from tools/benchmark.py): extract,
+start a download, then poll the status at the real client rate until the task
+finishes. UI clients use /api/extract, /api/download and /api/status and poll
+every 500 ms like templates/index.html; API clients use /api/v1/* and poll
+every 2 s.
+
+By default the Flask app is driven in-process, which also allows measuring
+status_lock contention and the memory held by download_status. With --target
+the load is sent over HTTP to a running server instead (latency only).
+
+Usage:
+    python tools/load_test.py --clients 50 --duration 60
+    python tools/load_test.py --clients 20 --api-ratio 0.5 --output load.json
+    python tools/load_test.py --target http://127.0.0.1:5000 --clients 100
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from benchmark import ROOT_DIR, percentile, start_fixture_server
+
+UI_POLL_INTERVAL = 0.5
+API_POLL_INTERVAL = 2.0
+TASK_ID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+class ContentionLock:
+    """Wraps a lock and records how long callers wait to acquire it."""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.waits = []
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            with self._stats_lock:
+                self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        wait = time.perf_counter() - start
+        with self._stats_lock:
+            self.contended += 1
+            self.waits.append(wait)
+            if acquired:
+                self.acquisitions += 1
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def report(self):
+        with self._stats_lock:
+            waits = list(self.waits)
+            return {
+                'acquisitions': self.acquisitions,
+                'contended': self.contended,
+                'contention_ratio': round(self.contended / self.acquisitions, 4) if self.acquisitions else 0,
+                'wait_total_ms': round(sum(waits) * 1000, 3),
+                'wait_p50_ms': round(percentile(waits, 50) * 1000, 3),
+                'wait_p99_ms': round(percentile(waits, 99) * 1000, 3),
+                'wait_max_ms': round(max(waits) * 1000, 3) if waits else 0,
+            }
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate memory held by a nested dict/list structure, including
+    objects that keep their fields in __slots__ (TaskRecord, StageSpan)."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(obj, name):
+                size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+class InProcessTransport:
+    """Sends requests through the Flask test client."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        client = self.app.app.test_client()
+
+        def send(method, path, body=None):
+            response = client.open(path, method=method, json=body)
+            return response.status_code, response.get_json(silent=True) or {}
+        return send
+
+
+class HttpTransport:
+    """Sends requests to a running server over HTTP."""
+
+    def __init__(self, target, api_key=None):
+        self.target = target.rstrip('/')
+        self.api_key = api_key
+
+    def session(self):
+        import requests
+        http = requests.Session()
+        if self.api_key:
+            http.headers['X-API-Key'] = self.api_key
+
+        def send(method, path, body=None):
+            response = http.request(method, self.target + path, json=body, timeout=60)
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            return response.status_code, data
+        return send
+
+
+class LoadRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.sessions = {'completed': 0, 'failed': 0, 'interrupted': 0}
+
+    def record(self, endpoint, latency, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def session_done(self, outcome):
+        with self.lock:
+            self.sessions[outcome] += 1
+
+    def report(self):
+        endpoints = {}
+        with self.lock:
+            for endpoint, values in sorted(self.latencies.items()):
+                endpoints[endpoint] = {
+                    'requests': len(values),
+                    'errors': self.errors.get(endpoint, 0),
+                    'p50_ms': round(percentile(values, 50) * 1000, 3),
+                    'p95_ms': round(percentile(values, 95) * 1000, 3),
+                    'p99_ms': round(percentile(values, 99) * 1000, 3),
+                    'max_ms': round(max(values) * 1000, 3),
+                }
+            return endpoints, dict(self.sessions)
+
+
+def run_client(client_id, transport, recorder, base_url, args, stop, file_ids):
+    send = transport.session()
+    api_client = random.random() < args.api_ratio
+    prefix = '/api/v1' if api_client else '/api'
+    poll_interval = API_POLL_INTERVAL if api_client else UI_POLL_INTERVAL
+    page_url = f'{base_url}/page/generic_video.html'
+
+    def call(method, path, body=None):
+        endpoint = TASK_ID_RE.sub('<task_id>', path)
+        start = time.perf_counter()
+        try:
+            status_code, data = send(method, path, body)
+        except Exception:
+            recorder.record(f'{method} {endpoint}', time.perf_counter() - start, False)
+            return None, {}
+        recorder.record(f'{method} {endpoint}', time.perf_counter() - start, status_code < 400)
+        return status_code, data
+
+    while not stop.is_set():
+        if not args.no_extract:
+            call('POST', f'{prefix}/extract', {'url': page_url})
+        size = random.choice(args.sizes) * 1024 * 1024
+        status_code, data = call('POST', f'{prefix}/download', {
+            'url': page_url,
+            'video_url': f'{base_url}/video/{size}.mp4',
+        })
+        task_id = data.get('task_id')
+        if not task_id:
+            recorder.session_done('failed')
+            stop.wait(poll_interval)
+            continue
+
+        outcome = 'interrupted'
+        while not stop.is_set():
+            stop.wait(poll_interval)
+            status_code, data = call('GET', f'{prefix}/status/{task_id}')
+            status = data.get('data', data) if api_client else data
+            if status.get('status') in ('completed', 'error'):
+                outcome = 'completed' if status.get('status') == 'completed' else 'failed'
+                if status.get('file_id'):
+                    file_ids.append(status['file_id'])
+                break
+        recorder.session_done(outcome)
+        stop.wait(args.think_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate concurrent UI pollers and API clients.')
+    parser.add_argument('--clients', type=int, default=20, help='Number of simulated clients')
+    parser.add_argument('--duration', type=float, default=30, help='Test duration in seconds')
+    parser.add_argument('--api-ratio', type=float, default=0.3, help='Fraction of clients using /api/v1')
+    parser.add_argument('--sizes', default='1,4,16', help='Fake video sizes in MB, picked at random per download')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Pause between sessions per client')
+    parser.add_argument('--ramp-up', type=float, default=2.0, help='Seconds over which clients are started')
+    parser.add_argument('--no-extract', action='store_true', help='Skip the extract call in each session')
+    parser.add_argument('--target', help='Base URL of a running server (default: drive app.py in-process)')
+    parser.add_argument('--api-key', help='API key for --target mode')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    fixture_server, base_url = start_fixture_server()
+    app = None
+    lock = None
+    if args.target:
+        transport = HttpTransport(args.target, args.api_key)
+    else:
+        sys.path.insert(0, ROOT_DIR)
+        import app
+        lock = ContentionLock(app.status_lock)
+        app.status_lock = lock
+        transport = InProcessTransport(app)
+
+    recorder = LoadRecorder()
+    stop = threading.Event()
+    file_ids = []
+    memory_samples = []
+
+    def sample_memory():
+        while True:
+            with app.status_lock:
+                tasks = len(app.download_status)
+                size = deep_sizeof(app.download_status)
+            memory_samples.append({'t': round(time.perf_counter() - started, 2), 'tasks': tasks, 'bytes': size})
+            if stop.wait(1.0):
+                break
+
+    started = time.perf_counter()
+    if app is not None:
+        threading.Thread(target=sample_memory, daemon=True).start()
+
+    threads = []
+    for client_id in range(args.clients):
+        thread = threading.Thread(
+            target=run_client,
+            args=(client_id, transport, recorder, base_url, args, stop, file_ids),
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+        if args.ramp_up and args.clients > 1:
+            time.sleep(args.ramp_up / args.clients)
+
+    stop.wait(max(args.duration - (time.perf_counter() - started), 0))
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    elapsed = time.perf_counter() - started
+    fixture_server.terminate()
+
+    endpoints, sessions = recorder.report()
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'api_key')},
+        'elapsed_s': round(elapsed, 2),
+        'sessions': sessions,
+        'sessions_per_s': round(sessions['completed'] / elapsed, 2),
+        'endpoints': endpoints,
+    }
+    if app is not None:
+        report['status_lock'] = lock.report()
+        first, last = memory_samples[0], memory_samples[-1]
+        report['download_status_memory'] = {
+            'start_bytes': first['bytes'],
+            'end_bytes': last['bytes'],
+            'peak_bytes': max(sample['bytes'] for sample in memory_samples),
+            'tasks': last['tasks'],
+            'bytes_per_task': int(last['bytes'] / last['tasks']) if last['tasks'] else 0,
+            'samples': memory_samples,
+        }
+        for filename in os.listdir(app.DOWNLOAD_DIR):
+            if any(filename.startswith(file_id) for file_id in file_ids):
+                os.remove(os.path.join(app.DOWNLOAD_DIR, filename))
+
+    summary = {key: value for key, value in report.items() if key != 'download_status_memory'}
+    if 'download_status_memory' in report:
+        summary['download_status_memory'] = {
+            key: value for key, value in report['download_status_memory'].items() if key != 'samples'
+        }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start time of app.py.
+
+Each run starts a fresh Python process that imports app.py and serves a page
+render and a status poll through the Flask test client, so nothing is cached
+between runs. Runs are repeated for the default lazy mode and for
+PRELOAD_MODULES=1 (everything imported up front, as the gunicorn master does
+with --preload).
+
+Usage:
+    python tools/measure_startup.py
+    python tools/measure_startup.py --runs 10 --importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('yt_dlp', 'requests', 'bs4', 'pytube')
+
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+first_page = time.perf_counter()
+client.get('/api/status/startup-probe')
+first_poll = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'first_page_s': first_page - start,
+    'first_poll_s': first_poll - start,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_child(preload):
+    env = dict(os.environ)
+    env['PRELOAD_MODULES'] = '1' if preload else '0'
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_mode(preload, runs):
+    samples = [run_child(preload) for _ in range(runs)]
+    return {
+        'import_ms': round(statistics.median(s['import_s'] for s in samples) * 1000, 1),
+        'first_page_ms': round(statistics.median(s['first_page_s'] for s in samples) * 1000, 1),
+        'first_poll_ms': round(statistics.median(s['first_poll_s'] for s in samples) * 1000, 1),
+        'heavy_modules_loaded': samples[-1]['loaded'],
+    }
+
+
+def print_importtime(limit):
+    """Show the slowest imports reported by python -X importtime."""
+    env = dict(os.environ, PRELOAD_MODULES='0')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].strip()))
+    print('\nSlowest imports (cumulative, lazy mode):')
+    for cumulative_us, name in sorted(rows, reverse=True)[:limit]:
+        print(f'  {cumulative_us / 1000:>8.1f} ms  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app.py cold-start time (lazy vs preloaded imports).')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per mode (median is reported)')
+    parser.add_argument('--importtime', action='store_true', help='Also list the slowest imports')
+    parser.add_argument('--limit', type=int, default=15, help='Rows to show with --importtime')
+    args = parser.parse_args()
+
+    report = {
+        'lazy': measure_mode(False, args.runs),
+        'preload': measure_mode(True, args.runs),
+    }
+    report['import_saved_ms'] = round(report['preload']['import_ms'] - report['lazy']['import_ms'], 1)
+    print(json.dumps(report, indent=2))
+
+    if args.importtime:
+        print_importtime(args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Measure the memory held per task in download_status.
+
+Runs a simulated task lifecycle (status updates, method attempts with their
+timeline spans, a completed download) through app.update_status and
+app.add_method_event for many tasks, and compares the compact TaskRecord
+entries with the plain dicts the status endpoint returns (the previous
+in-memory representation) using tracemalloc.
+
+Usage:
+    python tools/measure_task_memory.py
+    python tools/measure_task_memory.py --tasks 20000 --attempts 6
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import tracemalloc
+import uuid
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METHODS = ('yt_dlp', 'yt_dlp_cli', 'pytube', 'instagram', 'html_parse', 'direct_download')
+
+
+def simulate_task(app, task_id, attempts, lang):
+    app.update_status(task_id, 'processing', 'status_starting', 0, lang)
+    app.update_status(task_id, 'processing', 'status_obtaining', 5, lang)
+    for index in range(attempts):
+        method = METHODS[index % len(METHODS)]
+        app.add_method_event(task_id, method, 'trying', lang)
+        app.update_status(task_id, 'downloading', 'status_downloading', 10 + index, lang)
+        last = index == attempts - 1
+        app.add_method_event(task_id, method, 'success' if last else 'failed', lang,
+                             None if last else 'HTTP Error 403: Forbidden')
+    file_id = str(uuid.uuid4())
+    app.update_status(task_id, 'completed', 'status_completed', 100, lang, file_id, f'{file_id}.mp4',
+                      f'/api/file/{file_id}')
+
+
+def measure(build):
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory per task of TaskRecord and plain status dicts.')
+    parser.add_argument('--tasks', type=int, default=10000, help='Simulated tasks')
+    parser.add_argument('--attempts', type=int, default=4, help='Download methods tried per task')
+    parser.add_argument('--lang', default='en', help='Language of the status messages')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TASK_POLL_TIMEOUT', '0')
+    sys.path.insert(0, ROOT_DIR)
+    import app
+
+    tracemalloc.start()
+    task_ids = [str(uuid.uuid4()) for _ in range(args.tasks)]
+
+    def build_records():
+        for task_id in task_ids:
+            simulate_task(app, task_id, args.attempts, args.lang)
+        return app.download_status
+
+    records, record_bytes = measure(build_records)
+    # 以前的表示方式：每個任務一個 dict，翻譯後的標籤與 ISO 時間字串存在每個方法事件裡
+    plain, plain_bytes = measure(lambda: {task_id: copy.deepcopy(record.to_dict())
+                                          for task_id, record in records.items()})
+    tracemalloc.stop()
+
+    sample = plain[task_ids[-1]]
+    print(json.dumps({
+        'tasks': args.tasks,
+        'method_events_per_task': len(sample.get('methods', [])),
+        'timeline_spans_per_task': len(sample.get('timeline', [])),
+        'dict_bytes_per_task': round(plain_bytes / args.tasks),
+        'record_bytes_per_task': round(record_bytes / args.tasks),
+        'saved_percent': round((1 - record_bytes / plain_bytes) * 100, 1) if plain_bytes else 0,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Pre-fill the shared yt-dlp cache directory at deploy time.
+
+Runs an extraction for each URL so yt-dlp downloads the player JS and stores
+the extracted signature / nsig functions under YTDLP_CACHE_DIR. A second
+extraction with a fresh YoutubeDL instance then shows how much time the warm
+cache saves.
+
+Usage:
+    python tools/warm_ytdlp_cache.py
+    python tools/warm_ytdlp_cache.py --url https://www.youtube.com/watch?v=... --url https://vimeo.com/...
+    YTDLP_WARM_URLS="url1,url2" python tools/warm_ytdlp_cache.py
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_URLS = ['https://www.youtube.com/watch?v=jNQXAC9IVRw']
+
+
+def timed_extract(app, url):
+    start = time.perf_counter()
+    info = app.extract_video_info(url)
+    return time.perf_counter() - start, info is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm up the shared yt-dlp cache directory.')
+    parser.add_argument('--url', action='append', help='URL to extract (repeatable)')
+    args = parser.parse_args()
+
+    urls = args.url or [u.strip() for u in os.environ.get('YTDLP_WARM_URLS', '').split(',') if u.strip()] or DEFAULT_URLS
+
+    sys.path.insert(0, ROOT_DIR)
+    import app
+    # Use a fresh YoutubeDL for every extraction so only the on-disk cache is measured
+    app.YDL_POOL_SIZE = 0
+
+    results = []
+    for url in urls:
+        first_seconds, first_ok = timed_extract(app, url)
+        second_seconds, second_ok = timed_extract(app, url)
+        results.append({
+            'url': url,
+            'success': first_ok and second_ok,
+            'first_seconds': round(first_seconds, 3),
+            'warm_seconds': round(second_seconds, 3),
+            'saved_seconds': round(first_seconds - second_seconds, 3),
+        })
+
+    app.prune_ytdlp_cache()
+    stats = app.get_ytdlp_cache_stats()
+    print(json.dumps({
+        'cache_dir': stats['cache_dir'],
+        'files': stats['files'],
+        'size_bytes': stats['size_bytes'],
+        'results': results,
+    }, indent=2))
+    if not all(result['success'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Show how throughput scales with the number of worker processes.
+
+Starts a local HTTP server that serves generated video files at a fixed rate
+per connection (so each download is bound by its own connection, like a
+remote host), enqueues the same batch of direct-URL downloads through the API
+with TASK_QUEUE=sqlite, and runs the batch with 1, 2, 4 ... worker.py
+processes. Each run uses a fresh queue database.
+
+Usage:
+    python tools/worker_scaling.py
+    python tools/worker_scaling.py --workers 1 2 4 8 --tasks 16 --size-mb 2 --rate-kbps 1024
+"""
+import argparse
+import functools
+import http.server
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 64 * 1024
+
+
+class ThrottledHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /<name>.mp4 as size_bytes of zeros at rate_bytes per second."""
+
+    def __init__(self, *args, size_bytes, rate_bytes, **kwargs):
+        self.size_bytes = size_bytes
+        self.rate_bytes = rate_bytes
+        super().__init__(*args, **kwargs)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(self.size_bytes))
+        self.end_headers()
+
+    def do_GET(self):
+        self.do_HEAD()
+        chunk = b'\0' * CHUNK
+        remaining = self.size_bytes
+        try:
+            while remaining > 0:
+                data = chunk[:min(CHUNK, remaining)]
+                self.wfile.write(data)
+                remaining -= len(data)
+                time.sleep(len(data) / self.rate_bytes)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(size_bytes, rate_bytes):
+    handler = functools.partial(ThrottledHandler, size_bytes=size_bytes, rate_bytes=rate_bytes)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_batch(app, client, base_url, workers, tasks, work_dir, warmup, timeout):
+    queue_db = os.path.join(work_dir, f'queue-{workers}.db')
+    app.task_queue = app.SQLiteTaskQueue(queue_db)
+    env = dict(os.environ, TASK_QUEUE='sqlite', TASK_QUEUE_DB=queue_db,
+               DOWNLOAD_DIR=app.DOWNLOAD_DIR, TASK_POLL_TIMEOUT='0')
+    processes = [
+        subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'worker.py'), '--concurrency', '1',
+                          '--worker-id', f'scaling-{workers}-{index}'], cwd=ROOT_DIR, env=env)
+        for index in range(workers)
+    ]
+    try:
+        time.sleep(warmup)  # let every worker finish importing app before the clock starts
+        start = time.perf_counter()
+        task_ids = []
+        for index in range(tasks):
+            response = client.post('/api/v1/download', json={
+                'url': f'{base_url}/page/{index}',
+                'video_url': f'{base_url}/video-{workers}-{index}.mp4'
+            })
+            task_ids.append(response.get_json()['task_id'])
+
+        pending = set(task_ids)
+        statuses = {}
+        while pending and time.perf_counter() - start < timeout:
+            for task_id in list(pending):
+                data = client.get(f'/api/v1/status/{task_id}').get_json()['data']
+                if data.get('status') in app.FINAL_STATUSES:
+                    statuses[task_id] = data
+                    pending.discard(task_id)
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - start
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    completed = [s for s in statuses.values() if s.get('status') == 'completed']
+    return {
+        'workers': workers,
+        'completed': len(completed),
+        'failed': tasks - len(completed),
+        'wall_seconds': round(elapsed, 2),
+        'tasks_per_minute': round(len(completed) / elapsed * 60, 1),
+        'workers_used': len({s.get('queue', {}).get('worker') for s in completed}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure download throughput against the number of worker processes.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker process counts to run')
+    parser.add_argument('--tasks', type=int, default=8, help='Downloads per run')
+    parser.add_argument('--size-mb', type=float, default=1, help='Size of each generated file')
+    parser.add_argument('--rate-kbps', type=int, default=512, help='Per-connection serving rate')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds to wait for workers to start')
+    parser.add_argument('--timeout', type=float, default=600, help='Give up on a run after this many seconds')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='worker-scaling-')
+    os.environ.update(TASK_QUEUE='sqlite', DOWNLOAD_DIR=os.path.join(work_dir, 'downloads'),
+                      TASK_QUEUE_DB=os.path.join(work_dir, 'queue.db'))
+    os.environ.pop('API_KEY', None)
+    os.environ.pop('API_KEYS', None)
+    sys.path.insert(0, ROOT_DIR)
+    import app
+
+    server = start_server(int(args.size_mb * 1024 * 1024), args.rate_kbps * 1024)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    client = app.app.test_client()
+    try:
+        runs = [run_batch(app, client, base_url, workers, args.tasks, work_dir, args.warmup, args.timeout)
+                for workers in args.workers]
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = runs[0]['tasks_per_minute'] / runs[0]['workers'] if runs[0]['tasks_per_minute'] else 0
+    for run in runs:
+        ideal = baseline * run['workers']
+        run['scaling_efficiency'] = round(run['tasks_per_minute'] / ideal, 2) if ideal else None
+    print(json.dumps({
+        'tasks': args.tasks,
+        'size_mb': args.size_mb,
+        'rate_kbps': args.rate_kbps,
+        'runs': runs,
+    }, indent=2))
+    if any(run['failed'] for run in runs):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
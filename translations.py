@@ -7,6 +7,7 @@ TRANSLATIONS = {
         "video_url_placeholder": "https://www.youtube.com/watch?v=...",
         "search_video": "搜尋影片",
         "download_video": "下載影片",
+        "cancel_download": "取消下載",
         "processing": "處理中...",
         "enter_video_url": "請輸入影片網址",
         "search_first": "請先搜尋影片",
@@ -29,6 +30,10 @@ TRANSLATIONS = {
         "status_extracting": "Extracting video information...",
         "status_downloading": "Downloading video...",
         "status_finalizing": "Finalizing download...",
+        "status_queued": "排隊等待中",
+        "status_cancelling": "正在取消...",
+        "status_cancelled": "下載已取消",
+        "status_waiting_disk": "等待磁碟空間",
         "status_completed": "Download completed!",
         "status_starting": "Starting download...",
         "status_connecting": "Connecting to video source...",
@@ -44,6 +49,7 @@ TRANSLATIONS = {
         "method_html_parse": "HTML 解析",
         "method_direct_download": "直接下載",
         "method_instagram": "Instagram 解析",
+        "method_url_refresh": "重新取得視頻 URL",
         "method_status_trying": "嘗試中",
         "method_status_success": "成功",
         "method_status_failed": "失敗",
@@ -53,8 +59,16 @@ TRANSLATIONS = {
         "error_direct_download_failed": "直接下載失敗",
         "error_download_failed": "下載失敗",
         "error_extract_or_download": "無法從頁面提取視頻或下載視頻文件",
+        "error_recent_failure": "最近的嘗試已失敗，請稍後再試",
         "error_file_not_found": "文件未找到",
         "error_task_not_found": "Task not found",
+        "error_task_finished": "任務已結束，無法取消",
+        "error_insufficient_disk": "磁碟空間不足，無法下載此影片",
+        "error_admission_timeout": "等待磁碟空間逾時",
+        "error_server_busy": "伺服器忙碌中，請稍後再試",
+        "error_worker_lost": "執行下載的 worker 已停止回應",
+        "error_invalid_time_range": "無效的片段時間範圍（結束時間必須晚於開始時間）",
+        "error_clip_requires_ffmpeg": "伺服器未安裝 ffmpeg，無法下載片段",
         "language": "語言",
         "chinese_traditional": "繁體中文",
         "chinese_simplified": "简体中文",
@@ -90,6 +104,7 @@ TRANSLATIONS = {
         "video_url_placeholder": "https://www.youtube.com/watch?v=...",
         "search_video": "搜索视频",
         "download_video": "下载视频",
+        "cancel_download": "取消下载",
         "processing": "处理中...",
         "enter_video_url": "请输入视频网址",
         "search_first": "请先搜索视频",
@@ -112,6 +127,10 @@ TRANSLATIONS = {
         "status_extracting": "正在提取视频信息...",
         "status_downloading": "正在下载视频...",
         "status_finalizing": "正在完成下载...",
+        "status_queued": "排队等待中",
+        "status_cancelling": "正在取消...",
+        "status_cancelled": "下载已取消",
+        "status_waiting_disk": "等待磁盘空间",
         "status_completed": "下载完成！",
         "status_starting": "正在开始下载...",
         "status_connecting": "正在连接到视频源...",
@@ -127,6 +146,7 @@ TRANSLATIONS = {
         "method_html_parse": "HTML 解析",
         "method_direct_download": "直接下载",
         "method_instagram": "Instagram 解析",
+        "method_url_refresh": "重新获取视频 URL",
         "method_status_trying": "尝试中",
         "method_status_success": "成功",
         "method_status_failed": "失败",
@@ -136,8 +156,16 @@ TRANSLATIONS = {
         "error_direct_download_failed": "直接下载失败",
         "error_download_failed": "下载失败",
         "error_extract_or_download": "无法从页面提取视频或下载视频文件",
+        "error_recent_failure": "最近的尝试已失败，请稍后再试",
         "error_file_not_found": "文件未找到",
         "error_task_not_found": "任务未找到",
+        "error_task_finished": "任务已结束，无法取消",
+        "error_insufficient_disk": "磁盘空间不足，无法下载此视频",
+        "error_admission_timeout": "等待磁盘空间超时",
+        "error_server_busy": "服务器繁忙，请稍后再试",
+        "error_worker_lost": "执行下载的 worker 已停止响应",
+        "error_invalid_time_range": "无效的片段时间范围（结束时间必须晚于开始时间）",
+        "error_clip_requires_ffmpeg": "服务器未安装 ffmpeg，无法下载片段",
         "language": "语言",
         "chinese_traditional": "繁體中文",
         "chinese_simplified": "简体中文",
@@ -173,6 +201,7 @@ TRANSLATIONS = {
         "video_url_placeholder": "https://www.youtube.com/watch?v=...",
         "search_video": "Search Video",
         "download_video": "Download Video",
+        "cancel_download": "Cancel",
         "processing": "Processing...",
         "enter_video_url": "Please enter video URL",
         "search_first": "Please search video first",
@@ -195,6 +224,10 @@ TRANSLATIONS = {
         "status_extracting": "Extracting video information...",
         "status_downloading": "Downloading video...",
         "status_finalizing": "Finalizing download...",
+        "status_queued": "Waiting in queue",
+        "status_cancelling": "Cancelling...",
+        "status_cancelled": "Download cancelled",
+        "status_waiting_disk": "Waiting for disk space",
         "status_completed": "Download completed!",
         "status_starting": "Starting download...",
         "status_connecting": "Connecting to video source...",
@@ -210,6 +243,7 @@ TRANSLATIONS = {
         "method_html_parse": "HTML Parsing",
         "method_direct_download": "Direct Download",
         "method_instagram": "Instagram Parsing",
+        "method_url_refresh": "Video URL Refresh",
         "method_status_trying": "In progress",
         "method_status_success": "Success",
         "method_status_failed": "Failed",
@@ -219,8 +253,16 @@ TRANSLATIONS = {
         "error_direct_download_failed": "Direct download failed",
         "error_download_failed": "Download failed",
         "error_extract_or_download": "Unable to extract video from page or download video file",
+        "error_recent_failure": "failed recently, please try again later",
         "error_file_not_found": "File not found",
         "error_task_not_found": "Task not found",
+        "error_task_finished": "Task already finished and cannot be cancelled",
+        "error_insufficient_disk": "Not enough disk space to download this video",
+        "error_admission_timeout": "Timed out waiting for disk space",
+        "error_server_busy": "Server is busy, please try again later",
+        "error_worker_lost": "The worker running this download stopped responding",
+        "error_invalid_time_range": "Invalid time range (end must be after start)",
+        "error_clip_requires_ffmpeg": "Clip downloads require ffmpeg on the server",
         "language": "Language",
         "chinese_traditional": "繁體中文",
         "chinese_simplified": "简体中文",
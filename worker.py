@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Download worker for distributed mode.
+
+API nodes started with TASK_QUEUE=sqlite only enqueue download tasks. Each
+worker process claims tasks from the shared queue, runs the download pipeline
+and publishes status back to the queue; finished files are written to the
+shared DOWNLOAD_DIR, where the API nodes serve them from.
+
+Usage:
+    TASK_QUEUE=sqlite python worker.py
+    TASK_QUEUE=sqlite python worker.py --concurrency 8 --worker-id host-a-1
+"""
+import argparse
+import os
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run download tasks from the shared task queue.')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='Tasks run at the same time (default: WORKER_CONCURRENCY)')
+    parser.add_argument('--worker-id', default=None, help='Worker name shown in task status (default: host-pid)')
+    parser.add_argument('--idle-exit', type=float, default=0,
+                        help='Exit after this many seconds without tasks (default: run forever)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TASK_QUEUE', 'sqlite')
+    import app
+    try:
+        app.run_worker(args.worker_id, args.concurrency, args.idle_exit)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == '__main__':
+    main()